@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import argparse
+import re
+import sys
+import timeit
+
+sys.path.insert(0, '../../')
+
+from survy.core.utils import Utils
+
+
+def legacy_complex_match(check_type, check_value, value):
+    """
+    Uncompiled complex match, as implemented before matchers compilation
+    """
+    if isinstance(check_value, list):
+        out = {}
+        for cv in check_value:
+            res = legacy_complex_match(check_type, cv, value)
+
+            if res is False:
+                return False
+
+            if isinstance(res, dict):
+                out.update(res)
+
+        return out
+
+    if check_type == 'contains':
+        return value in check_value
+
+    if check_type == 'icontains':
+        return value.lower() in check_value.lower()
+
+    if check_type == 'eq':
+        return str(value) == str(check_value)
+
+    if check_type == 'neq':
+        return str(value) != str(check_value)
+
+    if check_type == 'ineq':
+        return str(value).lower() != str(check_value).lower()
+
+    if check_type == 'gt':
+        return int(value) > int(check_value)
+
+    if check_type == 'lt':
+        return int(value) < int(check_value)
+
+    if check_type == 'gteq':
+        return int(value) <= int(check_value)
+
+    if check_type == 'lteq':
+        return int(value) >= int(check_value)
+
+    if check_type == 'regex':
+        m = re.search(check_value, str(value))
+        if not m:
+            return False
+        return m.groupdict()
+
+    if check_type == 'iregex':
+        m = re.search(check_value, str(value), flags=re.IGNORECASE)
+        if not m:
+            return False
+        return m.groupdict()
+
+    return str(check_value).lower() == str(value).lower()
+
+
+CHECKS = [
+    ('ieq', ['Kitchen door'], 'kitchen door'),
+    ('eq', ['1a2b3c'], '1a2b3c'),
+    ('ineq', ['armed'], 'disarmed'),
+    ('gt', ['10'], '12'),
+    ('lteq', ['20', '30'], '25'),
+    ('regex', [r'^(?P<device>\w+)_(?P<sub>\w+)$'], 'door_open'),
+    ('iregex', [r'motion|pir'], 'PIR sensor'),
+    ('icontains', ['Living room lights'], 'ROOM'),
+]
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--number", help="Evaluations per check", type=int, default=100000)
+
+args = parser.parse_args()
+
+for check_type, check_value, value in CHECKS:
+    compiled = Utils.compile_match(check_type, check_value)
+
+    if compiled(value) != legacy_complex_match(check_type, check_value, value):
+        print("Mismatch for " + check_type)
+        sys.exit(-1)
+
+legacy_time = timeit.timeit(
+    lambda: [legacy_complex_match(t, cv, v) for t, cv, v in CHECKS], number=args.number)
+
+matchers = [(Utils.compile_match(t, cv), v) for t, cv, v in CHECKS]
+compiled_time = timeit.timeit(
+    lambda: [m(v) for m, v in matchers], number=args.number)
+
+evaluations = args.number * len(CHECKS)
+print("Legacy:   %.3fs (%.0f matches/s)" % (legacy_time, evaluations / legacy_time))
+print("Compiled: %.3fs (%.0f matches/s)" % (compiled_time, evaluations / compiled_time))
+print("Speedup:  %.2fx" % (legacy_time / compiled_time))
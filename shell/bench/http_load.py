@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+from http.server import HTTPServer
+
+sys.path.insert(0, '../../')
+
+from survy.core.components.http import PooledHTTPServer, WebServiceReqHandler
+from survy.core.executor import Executor
+from survy.core.intercom import Reply
+
+
+class StubReqHandler(WebServiceReqHandler):
+    """
+    Handler replying without intercom, simulating a component taking delay seconds
+    """
+    delay = 0
+
+    def on_message(self):
+        self._read_payload()
+        if self.delay > 0:
+            time.sleep(self.delay)
+
+        return Reply(Reply.INTERCOM_STATUS_SUCCESS, {'path': self.path})
+
+
+class LegacyReqHandler(StubReqHandler):
+    protocol_version = 'HTTP/1.0'
+
+
+def legacy_server():
+    return HTTPServer(('127.0.0.1', 0), LegacyReqHandler)
+
+
+def pooled_server():
+    return PooledHTTPServer(('127.0.0.1', 0), StubReqHandler, Executor('http', workers=args.workers))
+
+
+def client(address, count, keep_alive, latencies):
+    body = json.dumps({'device_code': 'kitchen_door'})
+    conn = None
+
+    for i in range(0, count):
+        if conn is None:
+            conn = http.client.HTTPConnection(*address)
+
+        start = time.time()
+        conn.request('POST', '/rule/rule-do-fire', body, {'Content-Type': 'application/json'})
+        conn.getresponse().read()
+        latencies.append(time.time() - start)
+
+        if not keep_alive:
+            conn.close()
+            conn = None
+
+    if conn is not None:
+        conn.close()
+
+
+def run(name, server_factory, keep_alive):
+    server = server_factory()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    latencies = []
+    threads = [
+        threading.Thread(target=client, args=(server.server_address, args.count, keep_alive, latencies))
+        for i in range(0, args.clients)
+    ]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.time() - start
+
+    server.shutdown()
+    server.server_close()
+
+    latencies.sort()
+    print("%-9s %d requests in %.3fs (%.0f requests/s, p50 %.1fms, p99 %.1fms)" % (
+        name + ':', len(latencies), elapsed, len(latencies) / elapsed,
+        latencies[int(len(latencies) * 0.5)] * 1000, latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--clients", help="Concurrent clients", type=int, default=8)
+parser.add_argument("--count", help="Requests per client", type=int, default=200)
+parser.add_argument("--workers", help="Pooled server workers", type=int, default=8)
+parser.add_argument("--delay", help="Simulated component time in ms", type=float, default=5)
+
+args = parser.parse_args()
+StubReqHandler.delay = args.delay / 1000
+
+run('Legacy', legacy_server, False)
+run('Pooled', pooled_server, True)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import argparse
+import copy
+import random
+import sys
+import time
+
+sys.path.insert(0, '../../')
+
+from survy.core.app import App
+from survy.core.capture import CaptureReader
+from survy.core.component import ComponentCollection
+from survy.core.components.signals.usb_ook import SignalManagerUsbOOK
+from survy.core.stream import LineBuffer
+
+CONFIRMATION_INTERVAL = 1
+DEBOUNCE_INTERVAL = 3
+
+
+class LegacyParser:
+    """
+    Deep copy and expire dance, as implemented before the debouncer
+    """
+    def __init__(self):
+        self._last_confirmed_codes = {}
+        self._last_received_codes = {}
+        self.triggered = 0
+
+    def on_data(self, data, now):
+        message = data.strip().decode('utf-8')
+        self.parse(message, now)
+
+    def parse(self, message, now):
+        try:
+            signal_code, signal_dump = message.split(':')
+        except ValueError:
+            return False
+
+        codes = copy.deepcopy(self._last_confirmed_codes)
+        for k in list(codes):
+            if now - self._last_confirmed_codes[k] > DEBOUNCE_INTERVAL:
+                del self._last_confirmed_codes[k]
+
+        codes = copy.deepcopy(self._last_received_codes)
+        for k in list(codes):
+            if now - self._last_received_codes[k] > CONFIRMATION_INTERVAL:
+                del self._last_received_codes[k]
+
+        if signal_code in self._last_received_codes:
+            if signal_code not in self._last_confirmed_codes:
+                self.triggered += 1
+
+            self._last_confirmed_codes[signal_code] = now
+
+        self._last_received_codes[signal_code] = now
+        return True
+
+
+class StreamingParser(SignalManagerUsbOOK):
+    triggered = 0
+
+    def __init__(self):
+        SignalManagerUsbOOK.__init__(self, 'ook', 'ook', {
+            'signals-confirmation-interval': CONFIRMATION_INTERVAL,
+            'debounce-interval': DEBOUNCE_INTERVAL,
+        })
+        self._line_buffer = LineBuffer(errors='replace')
+
+    def _on_signal(self, signal):
+        self.triggered += 1
+
+    def on_data(self, data, now):
+        for message in self._line_buffer.feed(data):
+            self._parse_cli_message(message, now)
+
+
+def load_log(file_name):
+    """
+    Read a serial log, one "<timestamp> <line>" per line
+    """
+    log = []
+    with open(file_name, 'r') as f:
+        for line in f:
+            ts, message = line.rstrip("\n").split(' ', 1)
+            log.append((float(ts), bytes(message + "\r\n", 'utf-8')))
+
+    return log
+
+
+def load_capture(file_name):
+    """
+    Read a capture recorded by a serial signal manager
+    """
+    return [(ts, bytes(line + "\r\n", 'utf-8')) for ts, line in CaptureReader(file_name)]
+
+
+def create_log(sensors, events):
+    """
+    Synthetic log, each event is a burst of repeated codes as sent by OOK remotes and sensors
+    """
+    log = []
+    ts = 0.0
+    codes = ['%06X' % random.randrange(0, 0xffffff) for i in range(0, sensors)]
+    for i in range(0, events):
+        ts += random.expovariate(5)
+        code = random.choice(codes)
+        for n in range(0, 6):
+            log.append((ts + n * 0.01, bytes(code + ':350,1050,' + code + "\r\n", 'utf-8')))
+
+    log.sort(key=lambda entry: entry[0])
+    return log
+
+
+def replay(log, on_data, speed):
+    """
+    Feed log lines at speed times their real rate.
+    At max speed, log timestamps are used as reception time so debouncing behaves as in real traffic.
+    :return: Parsing time and max lateness
+    """
+    busy = 0.0
+    lateness = 0.0
+
+    start = time.time()
+    first_ts = log[0][0]
+    for ts, data in log:
+        if speed > 0:
+            due = start + (ts - first_ts) / speed
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lateness = max(lateness, -delay)
+
+        parse_start = time.time()
+        if speed > 0:
+            on_data(data, parse_start)
+        else:
+            on_data(data, ts)
+        busy += time.time() - parse_start
+
+    return busy, lateness
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--log", help="Serial log file, one \"<timestamp> <line>\" per line")
+parser.add_argument("--capture", help="Capture file recorded by a serial signal manager")
+parser.add_argument("--sensors", help="Sensors in synthetic log", type=int, default=200)
+parser.add_argument("--events", help="Events in synthetic log", type=int, default=500)
+parser.add_argument("--speed", help="Replay speed factor, 0 for max speed", type=float, default=10)
+
+args = parser.parse_args()
+
+App.components = ComponentCollection()
+
+if args.capture is not None:
+    log = load_capture(args.capture)
+elif args.log is not None:
+    log = load_log(args.log)
+else:
+    log = create_log(args.sensors, args.events)
+
+print("Replaying %d lines over %.1fs at %sx" % (len(log), log[-1][0] - log[0][0], args.speed))
+
+legacy = LegacyParser()
+streaming = StreamingParser()
+
+for name, instance, on_data in [('Legacy', legacy, legacy.on_data), ('Streaming', streaming, streaming.on_data)]:
+    busy, lateness = replay(log, on_data, args.speed)
+    print("%-10s %.1fus per line, max lateness %.1fms, %d signals triggered" % (
+        name + ':', busy / len(log) * 1000000, lateness * 1000, instance.triggered))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, '../../')
+
+from survy.core.app import App
+from survy.core.settings import Settings
+
+
+def create_rules(count):
+    rules = {}
+    for i in range(0, count):
+        rules['rule_%d' % i] = {
+            'events': [{
+                'type': 'signal-event-recognized',
+                'payload': {'device_code': 'sensor_%d' % i, 'sub_code': 'open'},
+            }],
+            'conditions': [{'payload': {'runlevel': 'away'}}],
+            'actions': [
+                {'type': 'tts-do-say', 'payload': {'text': 'Sensor %d opened at %%time%%' % i}},
+                {'type': 'cam-do-snapshot', 'component_to': 'cam', 'delay': 2},
+            ],
+        }
+
+    return rules
+
+
+def create_signals(count):
+    signals = {}
+    for i in range(0, count):
+        signals['sensor_%d' % i] = {
+            'name': 'Sensor %d' % i,
+            'subs': {
+                'open': {'name': 'Open', 'manager': 'ook', 'code': '%08X' % i, 'dump': '1:%08X' % i},
+            },
+        }
+
+    return signals
+
+
+def timed(fn, files):
+    start = time.time()
+    for file_name in files:
+        fn(file_name)
+
+    return time.time() - start
+
+
+def legacy_load(file_name):
+    """
+    Pure Python parser, as implemented before the settings loader
+    """
+    return yaml.load(open(file_name, 'r'), Loader=yaml.Loader)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rules", help="Rules count", type=int, default=500)
+parser.add_argument("--signals", help="Signals count", type=int, default=5000)
+
+args = parser.parse_args()
+
+App.base_path = tempfile.mkdtemp()
+os.makedirs(App.get_settings_path())
+
+files = [App.get_settings_path() + '/rules.yml', App.get_settings_path() + '/signals.yml']
+yaml.dump(create_rules(args.rules), open(files[0], 'w'), default_flow_style=False)
+yaml.dump(create_signals(args.signals), open(files[1], 'w'), default_flow_style=False)
+
+print("Legacy:     %.3fs" % timed(legacy_load, files))
+print("Cold cache: %.3fs (libyaml: %s)" % (timed(Settings.load, files), Settings.get_stats()['libyaml']))
+print("Warm cache: %.3fs" % timed(Settings.load, files))
+
+os.utime(files[0])
+print("Touched:    %.3fs" % timed(Settings.load, files))
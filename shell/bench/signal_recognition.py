@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import sys
+import time
+
+sys.path.insert(0, '../../')
+
+from survy.core.recognition import SignalIndex
+
+
+def create_dump(rnd):
+    return ''.join('%03x' % rnd.choice([350, 1050]) for _ in range(0, 48))
+
+
+def drift(rnd, value, bits, flips):
+    for bit in rnd.sample(range(0, bits), flips):
+        value ^= 1 << bit
+
+    return value
+
+
+def linear_lookup(index, code, dump):
+    """
+    Compare the received signal with every known one
+    """
+    value, bits = SignalIndex.parse_code(code)
+    pulses = SignalIndex.parse_dump(dump)
+
+    best = None
+    best_confidence = 0
+    for item, item_value, item_bits, item_pulses, blocks in index._entries.values():
+        if item_bits != bits:
+            continue
+
+        distance = bin(value ^ item_value).count('1')
+        if distance > index._max_distance:
+            continue
+
+        timing_score = index.get_timing_score(pulses, item_pulses)
+        if timing_score is not None and 1 - timing_score > index._timing_tolerance:
+            continue
+
+        confidence = index.get_confidence(distance, bits, timing_score)
+        if confidence > best_confidence:
+            best = item
+            best_confidence = confidence
+
+    return best, best_confidence
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--count", help="Known signals", type=int, default=10000)
+parser.add_argument("--lookups", help="Received signals", type=int, default=2000)
+parser.add_argument("--distance", help="Max different code bits", type=int, default=2)
+parser.add_argument("--bits", help="Code length in bits", type=int, default=24)
+
+args = parser.parse_args()
+
+rnd = random.Random(1)
+index = SignalIndex(args.distance)
+
+signals = []
+for i in range(0, args.count):
+    value = rnd.getrandbits(args.bits)
+    signals.append((i, value, create_dump(rnd)))
+    index.add(i, '%0*X' % (args.bits // 4, value), signals[-1][2])
+
+received = []
+for i in range(0, args.lookups):
+    item, value, dump = rnd.choice(signals)
+    received.append((item, '%0*X' % (args.bits // 4, drift(rnd, value, args.bits, rnd.randint(0, args.distance))), dump))
+
+for name, lookup in [('Linear', lambda c, d: linear_lookup(index, c, d)), ('Index', index.lookup)]:
+    recognized = 0
+
+    start = time.time()
+    for item, code, dump in received:
+        if lookup(code, dump)[0] is not None:
+            recognized += 1
+    elapsed = time.time() - start
+
+    print("%-8s %.1fus per lookup, %d/%d recognized" % (
+        name + ':', elapsed / args.lookups * 1000000, recognized, args.lookups))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '../../')
+
+from survy.core.app import App
+from survy.core.component import ComponentCollection
+from survy.core.signal import Signal, SignalRepo, SignalManager
+
+
+def create_signal(manager, n):
+    return Signal(
+        manager=manager,
+        code='%08X' % n,
+        dump='1:%08X' % n,
+        device_name='Sensor %d' % (n // 4),
+        sub_name='Channel %d' % (n % 4),
+    )
+
+
+def legacy_add(signal):
+    """
+    Full reparse and rewrite of signals.yml, as implemented before the journal
+    """
+    SignalRepo.load()
+    SignalRepo._index(signal)
+    SignalRepo.export_yaml(SignalRepo.get_signals_file())
+
+
+def timed(fn, *args):
+    start = time.time()
+    fn(*args)
+    return time.time() - start
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--count", help="Signals in store", type=int, default=5000)
+parser.add_argument("--learn", help="Signals learned on top of store", type=int, default=20)
+
+args = parser.parse_args()
+
+App.base_path = tempfile.mkdtemp()
+os.makedirs(App.get_settings_path())
+
+App.components = ComponentCollection()
+manager = SignalManager('ook', 'ook', {})
+App.components.add('ook', manager, manager.COMPONENT_TYPE)
+
+SignalRepo.load()
+for i in range(0, args.count):
+    SignalRepo._index(create_signal(manager, i))
+
+print("Compaction:      %.3fs for %d signals" % (timed(SignalRepo.compact), args.count))
+print("Load:            %.3fs" % timed(SignalRepo.load))
+
+for name, add in [('Legacy', legacy_add), ('Journal', SignalRepo.add)]:
+    signals = [create_signal(manager, args.count * 2 + i) for i in range(0, args.learn)]
+
+    start = time.time()
+    for signal in signals:
+        add(signal)
+    elapsed = time.time() - start
+
+    print("%-16s %.1fms per learned signal" % (name + ':', elapsed / args.learn * 1000))
+
+print("Load + journal:  %.3fs" % timed(SignalRepo.load))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, '../../')
+
+from survy.core.stream import LineBuffer
+
+
+def legacy_read_lines(sock, count):
+    """
+    Byte by byte reader, as implemented before buffered reading
+    """
+    line = ''
+    n = 0
+    while n < count:
+        b = sock.recv(1)
+        if b == b'':
+            break
+
+        c = b.decode('utf-8')
+        if c in ['\n', '\r']:
+            json.loads(line.strip())
+            line = ''
+            n += 1
+        else:
+            line += c
+
+    return n
+
+
+def buffered_read_lines(sock, count):
+    line_buffer = LineBuffer()
+    n = 0
+    while n < count:
+        data = sock.recv(4096)
+        if data == b'':
+            break
+
+        for line in line_buffer.feed(data):
+            json.loads(line)
+            n += 1
+
+    return n
+
+
+def run(reader, count):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    message = bytes(json.dumps({
+        'message': 'signal-event-recognized',
+        'from': 'signal_usb_ook',
+        'to': '_all',
+        'payload': {'device_code': 'kitchen_door', 'sub_code': 'open', 'device_name': 'Kitchen door ë'},
+    }) + "\n", 'utf-8')
+
+    def push():
+        conn, _ = server.accept()
+        conn.sendall(message * count)
+        conn.close()
+
+    threading.Thread(target=push).start()
+
+    sock = socket.create_connection(server.getsockname())
+
+    start = time.time()
+    received = reader(sock, count)
+    elapsed = time.time() - start
+
+    sock.close()
+    server.close()
+
+    return received, elapsed
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--count", help="Messages to be sent", type=int, default=10000)
+
+args = parser.parse_args()
+
+for name, reader in [('Legacy', legacy_read_lines), ('Buffered', buffered_read_lines)]:
+    received, elapsed = run(reader, args.count)
+    print("%-9s %d messages in %.3fs (%.0f messages/s)" % (name + ':', received, elapsed, received / elapsed))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+
+sys.path.insert(0, '../../')
+
+from survy.core.intercom import Reply
+from survy.core.signal import SignalManager
+from survy.core.client import Client
+
+parser = argparse.ArgumentParser()
+parser.add_argument("signals", help="Signals as device/sub, optionally followed by :repeat", nargs='+')
+parser.add_argument("--repeat", help="Repeat the whole sequence", type=int, default=1)
+parser.add_argument("--priority", help="Transmission priority, lower is sent first", type=int,
+                    default=SignalManager.PRIORITY_NORMAL)
+
+args = parser.parse_args()
+
+signals = []
+for signal in args.signals:
+    repeat = 1
+    if ':' in signal:
+        signal, repeat = signal.rsplit(':', 1)
+
+    try:
+        device, sub = signal.split('/', 1)
+    except ValueError:
+        print("Invalid signal " + signal + ", expected device/sub")
+        sys.exit(-1)
+
+    signals.append({
+        'device': device,
+        'sub': sub,
+        'repeat': int(repeat),
+    })
+
+client = Client()
+res = client.send(
+    message_type=SignalManager.INTERCOM_MESSAGE_DO_FIRE_BATCH,
+    message_payload={
+        'signals': signals,
+        'repeat': args.repeat,
+        'priority': args.priority,
+    }
+)
+
+if res is None:
+    print("No reply")
+    sys.exit(-1)
+
+# Each signal manager replies for the whole batch, only owned signals are queued.
+# Payload is not a dict when no signal manager handled the message.
+replies = res['payload']
+if not isinstance(replies, dict):
+    replies = {}
+
+statuses = {}
+for manager, reply in replies.items():
+    if not isinstance(reply, dict) or not isinstance(reply.get('payload'), dict) or \
+            'signals' not in reply['payload']:
+        continue
+
+    for result in reply['payload']['signals']:
+        key = result['device'] + '/' + result['sub']
+        if statuses.get(key) != SignalManager.FIRE_STATUS_QUEUED:
+            statuses[key] = result['status']
+
+failed = res['status'] != Reply.INTERCOM_STATUS_SUCCESS
+for signal in signals:
+    key = signal['device'] + '/' + signal['sub']
+    status = statuses.get(key, SignalManager.FIRE_STATUS_NOT_FOUND)
+    if status != SignalManager.FIRE_STATUS_QUEUED:
+        failed = True
+
+    print(key + ": " + status)
+
+if failed:
+    sys.exit(-1)
+
+sys.exit(0)
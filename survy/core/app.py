@@ -2,14 +2,28 @@ import copy
 import importlib
 import os
 
-import yaml
 import threading
 
 from survy.core.component import ComponentCollection
+from survy.core.intercom import Mailbox
 from survy.core.log import Log
+from survy.core.settings import Settings
+from survy.core.variables import VariableStore
 
 
 class App:
+    VARIABLES_SOURCE = '_app'
+
+    INTERCOM_MODE_SYNC = 'sync'
+    INTERCOM_MODE_ASYNC = 'async'
+
+    INTERCOM_DEFAULTS = {
+        'mode': INTERCOM_MODE_SYNC,
+        'workers': 1,
+        'queue_size': 100,
+        'request_timeout': 30,
+    }
+
     config = None
     components = None
     allowed_paths = []
@@ -23,7 +37,7 @@ class App:
 
         cls.variables = {}
         try:
-            cls.variables = yaml.load(open(variable_file, 'r'))
+            cls.variables = Settings.load(variable_file)
             Log.info('Variables loaded from ' + variable_file)
         except:
             pass
@@ -31,6 +45,8 @@ class App:
         if cls.variables is None:
             cls.variables = {}
 
+        VariableStore.publish(cls.VARIABLES_SOURCE, cls.variables)
+
     @classmethod
     def load_components(cls):
         Log.info("Loading components")
@@ -53,12 +69,43 @@ class App:
             component = component_class(k, component_name, component_params)
             component_class.set_instance_code(k)
 
+            intercom_params = cls.get_intercom_params(component_info)
+            if intercom_params['mode'] == cls.INTERCOM_MODE_ASYNC:
+                component.set_mailbox(Mailbox(
+                    component=component,
+                    workers=intercom_params['workers'],
+                    queue_size=intercom_params['queue_size'],
+                    request_timeout=intercom_params['request_timeout']
+                ))
+
             cls.components.add(k, component, component.COMPONENT_TYPE)
 
+            # Register variables in components order
+            component.publish_variables()
+
+        cls.components.build_subscriptions()
+
         cls.allowed_paths = []
         if 'allowed_paths' in cls.config:
             cls.allowed_paths = cls.config['allowed_paths']
 
+    @classmethod
+    def get_intercom_params(cls, component_info):
+        """
+        Return intercom delivery settings for a component
+        :param component_info: Component configuration
+        :return: A dict of intercom settings
+        """
+        params = copy.copy(cls.INTERCOM_DEFAULTS)
+
+        if 'intercom' in cls.config:
+            params.update(cls.config['intercom'])
+
+        if 'intercom' in component_info:
+            params.update(component_info['intercom'])
+
+        return params
+
     @classmethod
     def can_access_file(cls, filename):
         """
@@ -96,23 +143,39 @@ class App:
     def start_components(cls):
         Log.info("Starting components")
         components_list = cls.components.get_list()
+        for code in components_list:
+            if cls.components.get(code).get_mailbox() is not None:
+                cls.components.get(code).get_mailbox().start()
+
         for code in components_list:
             threading.Thread(target=cls.components.get(code).start).start()
 
     @classmethod
     def get_variables(cls):
-        out = cls.variables
+        """
+        Return a read only snapshot of global variables
+        :return: Variables snapshot
+        """
+        return VariableStore.get_snapshot()
+
+    @classmethod
+    def get_stats(cls):
+        components_stats = {}
 
         components_list = cls.components.get_list()
         for code in components_list:
-            out.update(copy.deepcopy(App.components.get(code).get_variables()))
+            components_stats[code] = cls.components.get(code).get_stats()
 
-        return out
+        return {
+            'components': components_stats,
+            'variables': VariableStore.get_stats(),
+            'settings': Settings.get_stats(),
+        }
 
     @classmethod
     def setup(cls, base_path, config_file):
-        cls.config = yaml.load(open(base_path + '/' + config_file, 'r'))
         cls.base_path = base_path
+        cls.config = Settings.load(base_path + '/' + config_file)
 
     @classmethod
     def reload(cls):
@@ -0,0 +1,155 @@
+import os
+import struct
+import time
+
+
+class Capture:
+    """
+    Compact binary capture of timestamped lines.
+    Each record is a little endian double timestamp, an unsigned short length and the line bytes.
+    Captures are split in size limited segments, only the newest ones are kept.
+    """
+    RECORD_HEADER = struct.Struct('<dH')
+    MAX_LINE_SIZE = 0xffff
+
+    @classmethod
+    def get_segment_file(cls, file_name, n):
+        """
+        :param file_name: Capture file
+        :param n: Segment number, 0 is the current one
+        :return: Segment file name
+        """
+        if n == 0:
+            return file_name
+
+        return file_name + '.' + str(n)
+
+    @classmethod
+    def get_segment_files(cls, file_name):
+        """
+        :param file_name: Capture file
+        :return: Existing segment files, oldest first
+        """
+        res = []
+
+        n = 0
+        while os.path.exists(cls.get_segment_file(file_name, n)):
+            res.insert(0, cls.get_segment_file(file_name, n))
+            n += 1
+
+        return res
+
+
+class CaptureWriter:
+    """
+    Record lines to a capture, rotating segments when the current one exceeds max_size
+    """
+    _file_name = None
+    _max_size = None
+    _segments = None
+    _file = None
+    _size = 0
+
+    def __init__(self, file_name, max_size=1048576, segments=2):
+        self._file_name = file_name
+        self._max_size = int(max_size)
+        self._segments = max(1, int(segments))
+
+        os.makedirs(os.path.dirname(os.path.abspath(file_name)), 0o750, True)
+        self._open()
+
+    def _open(self):
+        self._file = open(self._file_name, 'ab')
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+
+        for n in range(self._segments - 1, 0, -1):
+            source = Capture.get_segment_file(self._file_name, n - 1)
+            if os.path.exists(source):
+                os.replace(source, Capture.get_segment_file(self._file_name, n))
+
+        if self._segments == 1:
+            os.remove(self._file_name)
+
+        self._open()
+
+    def write(self, ts, line):
+        """
+        Record a line
+        :param ts: Reception timestamp
+        :param line: Line text
+        """
+        data = bytes(line, 'utf-8')[:Capture.MAX_LINE_SIZE]
+        record = Capture.RECORD_HEADER.pack(ts, len(data)) + data
+
+        if self._size > 0 and self._size + len(record) > self._max_size:
+            self._rotate()
+
+        self._file.write(record)
+        self._file.flush()
+        self._size += len(record)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CaptureReader:
+    """
+    Read lines from a capture, oldest segment first
+    """
+    _file_name = None
+
+    def __init__(self, file_name):
+        self._file_name = file_name
+
+    def __iter__(self):
+        """
+        :return: An iterator of (timestamp, line) tuples
+        """
+        header_size = Capture.RECORD_HEADER.size
+
+        for segment_file in Capture.get_segment_files(self._file_name):
+            with open(segment_file, 'rb') as f:
+                data = f.read()
+
+            offset = 0
+            while offset + header_size <= len(data):
+                ts, length = Capture.RECORD_HEADER.unpack_from(data, offset)
+                offset += header_size
+
+                # Record truncated by an interrupted write
+                if offset + length > len(data):
+                    break
+
+                yield ts, data[offset:offset + length].decode('utf-8', 'replace')
+                offset += length
+
+    def replay(self, callback, speed=1.0):
+        """
+        Feed recorded lines to a callback, preserving the time between them
+        :param callback: Function called with line and recorded timestamp
+        :param speed: Speed factor, 0 to replay at max speed
+        :return: Number of replayed lines
+        """
+        n = 0
+        start = None
+        first_ts = None
+
+        for ts, line in self:
+            if speed > 0:
+                if start is None:
+                    start = time.time()
+                    first_ts = ts
+
+                delay = start + (ts - first_ts) / speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            callback(line, ts)
+            n += 1
+
+        return n
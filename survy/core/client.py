@@ -1,51 +1,317 @@
+import asyncio
+import collections
+import itertools
 import json
 import socket
+import threading
 
-from survy.core.intercom import Reply
+from survy.core.intercom import Reply, ReplyFuture
+from survy.core.log import Log
+from survy.core.stream import LineBuffer
 
 
 class Client:
+    """
+    Persistent TCP socket client.
+    Requests carry a correlation ID echoed in replies, so several threads can share the connection
+    and pipeline their requests.
+    """
+    RECV_SIZE = 4096
+    DEFAULT_TIMEOUT = 30
+
     sock = None
     host = None
     port = None
+    timeout = None
 
-    def __init__(self, host='127.0.0.1', port=2006):
+    _lock = None
+    _ids = None
+    _pending = None
+    _waiters = None
+
+    def __init__(self, host='127.0.0.1', port=2006, timeout=DEFAULT_TIMEOUT):
         self.host = host
         self.port = port
+        self.timeout = timeout
 
-    def _read_line(self):
-        line = ''
-        while True:
-            b = self.sock.recv(1)
-            if b == b'':
-                break
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = collections.OrderedDict()
+        self._waiters = []
 
-            c = b.decode('utf-8')
-            if c in ['\n', '\r']:
-                return line.strip()
+    def connect(self):
+        with self._lock:
+            self._connect()
 
-            line += c
-
-        return None
-
-    def send(self, message_type, message_payload=None, expect=None):
-        if expect is None:
-            expect = Reply.INTERCOM_MESSAGE_REPLY
+    def _connect(self):
+        if self.sock is not None:
+            return
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.sock.connect((self.host, self.port))
 
-        message = json.dumps({
+        threading.Thread(target=self._read_loop, args=(self.sock, ), daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            if self.sock is not None:
+                # Wake up the reader thread, it fails pending callers
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+                self.sock.close()
+                self.sock = None
+
+    def _read_loop(self, sock):
+        line_buffer = LineBuffer()
+
+        try:
+            while True:
+                data = sock.recv(self.RECV_SIZE)
+                if data == b'':
+                    break
+
+                for line in line_buffer.feed(data):
+                    self._on_message(json.loads(line))
+
+                if line_buffer.get_dropped_lines() > 0:
+                    raise ValueError('line longer than ' + str(LineBuffer.DEFAULT_MAX_LINE_SIZE) + ' bytes')
+
+        except OSError:
+            pass
+
+        except (ValueError, KeyError, TypeError) as e:
+            # Replies cannot be matched anymore once the stream is out of sync
+            Log.error('Invalid message from %s:%s, disconnecting: %s', self.host, self.port, e)
+
+        finally:
+            # Connection lost, fail any waiting caller and reconnect on next send
+            with self._lock:
+                if self.sock is sock:
+                    self.sock = None
+
+                pending = list(self._pending.values()) + [future for expect, future in self._waiters]
+                self._pending.clear()
+                self._waiters = []
+
+            sock.close()
+
+            for future in pending:
+                future.set_reply(None)
+
+    def _on_message(self, message):
+        future = None
+
+        with self._lock:
+            if message['message'] == Reply.INTERCOM_MESSAGE_REPLY:
+                if 'id' in message and message['id'] in self._pending:
+                    future = self._pending.pop(message['id'])
+
+                elif 'id' not in message and len(self._pending) > 0:
+                    # Server not echoing IDs, replies come in requests order
+                    future = self._pending.popitem(last=False)[1]
+
+            if future is None:
+                for waiter in self._waiters:
+                    if message['message'] in waiter[0]:
+                        future = waiter[1]
+                        self._waiters.remove(waiter)
+                        break
+
+        if future is not None:
+            future.set_reply(message)
+
+    def send_async(self, message_type, message_payload=None, expect=None) -> ReplyFuture:
+        """
+        Send a message without waiting
+        :param message_type: Message type
+        :param message_payload: Message payload
+        :param expect: A list of message types to wait for instead of the message reply
+        :return: Future resolved with the reply or expected message, None if connection is lost
+        """
+        future = ReplyFuture()
+        message_id = next(self._ids)
+
+        data = bytes(json.dumps({
+            'id': message_id,
             'message': message_type,
             'payload': message_payload
-        })
+        }) + "\n", 'utf-8')
+
+        with self._lock:
+            if expect is None:
+                self._pending[message_id] = future
+            else:
+                self._waiters.append((expect, future))
+
+            try:
+                self._connect()
+                self.sock.sendall(data)
+
+            except OSError:
+                if self.sock is not None:
+                    self.sock.close()
+                    self.sock = None
+
+                self._pending.pop(message_id, None)
+                self._waiters = [w for w in self._waiters if w[1] is not future]
+                future.set_reply(None)
+
+        return future
+
+    def send(self, message_type, message_payload=None, expect=None):
+        """
+        Send a message and wait for its reply
+        :param message_type: Message type
+        :param message_payload: Message payload
+        :param expect: A list of message types to wait for instead of the message reply
+        :return: Reply or expected message, None on failure or timeout
+        """
+        future = self.send_async(message_type, message_payload, expect)
+        reply = future.get_reply(self.timeout)
+
+        if not future.done():
+            # Forget the request, a late reply is ignored
+            with self._lock:
+                for message_id, pending in list(self._pending.items()):
+                    if pending is future:
+                        del self._pending[message_id]
+
+                self._waiters = [w for w in self._waiters if w[1] is not future]
+
+        return reply
+
+
+class AsyncClient:
+    """
+    Asyncio variant of the persistent TCP socket client
+    """
+    host = None
+    port = None
+
+    _reader = None
+    _writer = None
+    _read_task = None
+    _connect_lock = None
+    _ids = None
+    _pending = None
+    _waiters = None
+
+    def __init__(self, host='127.0.0.1', port=2006):
+        self.host = host
+        self.port = port
+
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._waiters = []
+
+    async def connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            if self._writer is not None:
+                return
+
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            self._read_task = asyncio.ensure_future(self._read_loop())
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _read_loop(self):
+        line_buffer = LineBuffer()
+        writer = self._writer
+
+        try:
+            while True:
+                data = await self._reader.read(Client.RECV_SIZE)
+                if data == b'':
+                    break
+
+                for line in line_buffer.feed(data):
+                    self._on_message(json.loads(line))
+
+                if line_buffer.get_dropped_lines() > 0:
+                    raise ValueError('line longer than ' + str(LineBuffer.DEFAULT_MAX_LINE_SIZE) + ' bytes')
+
+        except OSError:
+            pass
+
+        except (ValueError, KeyError, TypeError) as e:
+            Log.error('Invalid message from %s:%s, disconnecting: %s', self.host, self.port, e)
+
+        finally:
+            if self._writer is writer:
+                self._writer = None
+
+            writer.close()
+
+            for future in list(self._pending.values()) + [future for expect, future in self._waiters]:
+                if not future.done():
+                    future.set_result(None)
+
+            self._pending = {}
+            self._waiters = []
+
+    def _on_message(self, message):
+        future = None
+
+        if message['message'] == Reply.INTERCOM_MESSAGE_REPLY and message.get('id') in self._pending:
+            future = self._pending.pop(message['id'])
+
+        else:
+            for waiter in self._waiters:
+                if message['message'] in waiter[0]:
+                    future = waiter[1]
+                    self._waiters.remove(waiter)
+                    break
+
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    async def send(self, message_type, message_payload=None, expect=None):
+        """
+        Send a message and wait for its reply
+        :param message_type: Message type
+        :param message_payload: Message payload
+        :param expect: A list of message types to wait for instead of the message reply
+        :return: Reply or expected message, None if connection is lost after sending
+        :raises ConnectionError: if the message could not be sent
+        """
+        await self.connect()
+
+        # The reader may drop the connection at any await
+        writer = self._writer
+        if writer is None:
+            raise ConnectionError('Connection to %s:%s lost' % (self.host, self.port))
+
+        future = asyncio.get_event_loop().create_future()
+        message_id = next(self._ids)
+
+        if expect is None:
+            self._pending[message_id] = future
+        else:
+            self._waiters.append((expect, future))
+
+        try:
+            writer.write(bytes(json.dumps({
+                'id': message_id,
+                'message': message_type,
+                'payload': message_payload
+            }) + "\n", 'utf-8'))
+            await writer.drain()
+
+        except OSError as e:
+            self._pending.pop(message_id, None)
+            self._waiters = [w for w in self._waiters if w[1] is not future]
 
-        self.sock.sendall(bytes(message+"\n", 'utf-8'))
-        while True:
-            reply = self._read_line()
-            if reply is None:
-                return None
+            if not future.done():
+                future.set_exception(ConnectionError('Connection to %s:%s lost: %s' % (self.host, self.port, e)))
 
-            message = json.loads(reply)
-            if message['message'] in expect:
-                return message
+        return await future
@@ -1,12 +1,76 @@
 import traceback
 
 from survy.core.collection import Collection
-from survy.core.intercom import Reply, Message
+from survy.core.intercom import Reply, Message, Mailbox
 from survy.core.log import Log
+from survy.core.variables import VariableStore
 
 
 class ComponentCollection(Collection):
-    pass
+    _subscribers = None
+    _subscribers_all = None
+    _subscribers_exact = None
+    _subscribers_prefix = None
+
+    def build_subscriptions(self):
+        """
+        Build the message type subscription index from the components intercom declarations
+        """
+        subscribers_all = []
+        subscribers_exact = {}
+        subscribers_prefix = []
+
+        for code in self.get_list():
+            component = self.get(code)
+
+            message_types = component.get_intercom_messages()
+            if message_types is None:
+                subscribers_all.append(code)
+                continue
+
+            for message_type in message_types:
+                if message_type not in subscribers_exact:
+                    subscribers_exact[message_type] = []
+
+                if code not in subscribers_exact[message_type]:
+                    subscribers_exact[message_type].append(code)
+
+            for prefix in component.get_intercom_message_prefixes():
+                subscribers_prefix.append((prefix, code))
+
+        self._subscribers_all = subscribers_all
+        self._subscribers_exact = subscribers_exact
+        self._subscribers_prefix = subscribers_prefix
+        self._subscribers = {}
+
+    def get_subscribers(self, message_type):
+        """
+        Return the list of components code interested in a message type
+
+        :param message_type: Message type
+        :return: A list of components code
+        """
+        if self._subscribers is None:
+            self.build_subscriptions()
+
+        subscribers = self._subscribers
+        if message_type in subscribers:
+            return subscribers[message_type]
+
+        codes = set(self._subscribers_all)
+
+        if message_type in self._subscribers_exact:
+            codes.update(self._subscribers_exact[message_type])
+
+        for prefix, code in self._subscribers_prefix:
+            if message_type.startswith(prefix):
+                codes.add(code)
+
+        # Keep components loading order
+        res = [code for code in self.get_list() if code in codes]
+        subscribers[message_type] = res
+
+        return res
 
 
 class Component:
@@ -15,11 +79,16 @@ class Component:
 
     INTERCOM_MESSAGE_DO_RELOAD = 'reload'
 
+    # Message types and prefixes handled by this component, set INTERCOM_MESSAGES to None to receive everything
+    INTERCOM_MESSAGES = []
+    INTERCOM_MESSAGE_PREFIXES = []
+
     _instance_code = None
 
     _code = None
     _name = None
     _params = None
+    _mailbox = None
 
     def __init__(self, code, name, params=None):
         if params is None:
@@ -39,6 +108,34 @@ class Component:
     def get_variables(self):
         return {}
 
+    def publish_variables(self):
+        """
+        Publish component variables to the global variables store, to be called when they change
+        """
+        VariableStore.publish(self.get_code(), self.get_variables())
+
+    def get_stats(self):
+        """
+        Return runtime statistics for this component
+        :return: A dict of statistics
+        """
+        stats = {}
+
+        if self.get_mailbox() is not None:
+            stats['intercom'] = self.get_mailbox().get_stats()
+
+        return stats
+
+    def set_mailbox(self, value: Mailbox):
+        self._mailbox = value
+
+    def get_mailbox(self) -> Mailbox:
+        """
+        Return the component inbox or None when messages are handled synchronously
+        :return: Component inbox
+        """
+        return self._mailbox
+
     @classmethod
     def set_instance_code(cls, code):
         if cls._instance_code is None:
@@ -52,20 +149,50 @@ class Component:
     def get_code(self):
         return self._code
 
+    def get_intercom_messages(self):
+        """
+        Return the list of message types handled by this component or None to receive every message
+        :return: A list of message types
+        """
+        if self.INTERCOM_MESSAGES is None:
+            return None
+
+        return [self.INTERCOM_MESSAGE_DO_RELOAD] + list(self.INTERCOM_MESSAGES)
+
+    def get_intercom_message_prefixes(self):
+        """
+        Return the list of message types prefixes handled by this component
+        :return: A list of message types prefixes
+        """
+        return list(self.INTERCOM_MESSAGE_PREFIXES)
+
     def get_name(self):
         return self._name
 
-    def create_intercom_message(self, component_to, message_type, message_payload) -> Message:
+    def create_intercom_message(self, component_to, message_type, message_payload,
+                                delivery=Message.INTERCOM_DELIVERY_REQUEST) -> Message:
         return Message(
             message_from=self.get_code(),
             message_to=component_to,
             message_type=message_type,
-            message_payload=message_payload
+            message_payload=message_payload,
+            delivery=delivery
         )
 
     def send_intercom_message(self, message_type, message_payload=None) -> Reply:
         return self.create_intercom_message(Message.INTERCOM_RECIPIENT_BROADCAST, message_type, message_payload).send()
 
+    def send_intercom_event(self, message_type, message_payload=None) -> Reply:
+        """
+        Broadcast an event, asynchronous components get it fire and forget
+        :param message_type: Message type
+        :param message_payload: Message payload
+        :return: Message reply, components whose inbox was full reply with a non blocking failure
+        """
+        return self.create_intercom_message(
+            Message.INTERCOM_RECIPIENT_BROADCAST, message_type, message_payload, Message.INTERCOM_DELIVERY_EVENT
+        ).send()
+
     @classmethod
     def check_required_parameters(cls, payload, required_params):
         """
@@ -1,10 +1,42 @@
 from survy.core.app import App
 from survy.core.component import Component
+from survy.core.intercom import Message, Reply
+from survy.core.watcher import SettingsWatcher
 
 
 class AppManager(Component):
     """
     Simple class to forward intercom messages to app
     """
+    INTERCOM_MESSAGE_DO_STATS = 'app-do-stats'
+
+    INTERCOM_MESSAGES = [
+        INTERCOM_MESSAGE_DO_STATS,
+    ]
+
+    def _on_intercom_message(self, message: Message) -> Reply:
+        if message == self.INTERCOM_MESSAGE_DO_STATS:
+            return Reply(Reply.INTERCOM_STATUS_SUCCESS, App.get_stats())
+
+        return Component._on_intercom_message(self, message)
+
+    def get_stats(self):
+        stats = Component.get_stats(self)
+        stats['watcher'] = SettingsWatcher.get_stats()
+
+        return stats
+
     def _reload(self):
         return App.reload()
+
+    def start(self):
+        Component.start(self)
+
+        # Settings files are reloaded as soon as they change
+        if 'watch' not in self._params or self._params['watch']:
+            interval = SettingsWatcher.DEFAULT_INTERVAL
+            if 'watch_interval' in self._params:
+                interval = self._params['watch_interval']
+
+            SettingsWatcher.register(App.get_settings_path() + '/variables.yml', App.load_variables)
+            SettingsWatcher.start(App.get_settings_path(), interval)
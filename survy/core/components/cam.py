@@ -10,17 +10,20 @@ import time
 from time import strftime, localtime
 
 import sys
+import cv2
 from PIL import ImageFont
 from PIL import Image
 from PIL import ImageDraw
 
-import yaml
 
 from survy.core.app import App
 from survy.core.component import Component
 from survy.core.intercom import Message, Reply
 from survy.core.log import Log
+from survy.core.settings import Settings
+from survy.core.stream import FrameBuffer
 from survy.core.utils import Utils
+from survy.core.watcher import SettingsWatcher
 
 
 class CamManager:
@@ -30,7 +33,16 @@ class CamManager:
 class Cam:
     CAM_RECONNECT_TIMEOUT = 10
 
+    # Older frames are stale, snapshots are then requested to the cam
+    FRAME_MAX_AGE = 5
+
+    # Consecutive undecodable frames before reconnecting
+    MAX_DROPPED_FRAMES = 50
+
+    FPS_WINDOW = 5
+
     _stop = False
+    _capture_reset = False
     _code = None
     _timelapse = None
     history = None
@@ -43,6 +55,12 @@ class Cam:
     _current_params = {}
     _current_type = None
 
+    _frames = None
+    _jpeg = None
+    _jpeg_seq = None
+    _jpeg_lock = None
+    _capture_stats = None
+
     def __init__(self, code, name, cam_type, params, timelapse, history):
         self.code = code
         self.name = name
@@ -53,6 +71,25 @@ class Cam:
 
         self._lock = Lock()
 
+        self._frames = FrameBuffer()
+        self._jpeg_lock = Lock()
+        self._capture_stats = {
+            'connected': False,
+            'fps': 0.0,
+            'frames': 0,
+            'dropped': 0,
+            'reconnects': 0,
+            'snapshots_memory': 0,
+            'snapshots_adapter': 0,
+        }
+
+    @property
+    def image(self):
+        """
+        Latest captured frame, as an OpenCV BGR image
+        """
+        return self._frames.get()[2]
+
     @property
     def timelapse(self):
         return int(self._timelapse)
@@ -94,6 +131,80 @@ class Cam:
 
         return self.adapter.on_cam_command(message)
 
+    def _encode_jpeg(self, seq, frame):
+        """
+        Encode a frame once, however many readers ask for it
+        """
+        with self._jpeg_lock:
+            if self._jpeg_seq != seq:
+                ok, data = cv2.imencode('.jpg', frame)
+                if not ok:
+                    return None
+
+                self._jpeg = data.tobytes()
+                self._jpeg_seq = seq
+
+            return self._jpeg
+
+    def get_jpeg(self, max_age=None):
+        """
+        Return latest captured frame
+        :param max_age: Max frame age in seconds, None for any age
+        :return: JPEG bytes or None if no frame is available
+        """
+        seq, ts, frame = self._frames.get()
+        if frame is None or (max_age is not None and time.time() - ts > max_age):
+            return None
+
+        return self._encode_jpeg(seq, frame)
+
+    def wait_jpeg(self, since, timeout=None):
+        """
+        Wait for a frame newer than a sequence number
+        :param since: Last sequence number seen by reader
+        :param timeout: Max seconds to wait
+        :return: A (seq, jpeg) tuple, jpeg is None on timeout
+        """
+        seq, ts, frame = self._frames.wait(since, timeout)
+        if seq <= since or frame is None:
+            return since, None
+
+        return seq, self._encode_jpeg(seq, frame)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._capture_stats)
+
+        seq, ts, frame = self._frames.get()
+
+        stats['frame_age'] = None
+        if ts is not None:
+            stats['frame_age'] = round(time.time() - ts, 3)
+
+        return stats
+
+    def _update_stats(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self._capture_stats[key] += value
+
+    def save_snapshot(self, file_name):
+        """
+        Save the latest captured frame, the cam is only queried when no recent frame is available
+        :param file_name: Destination file
+        """
+        jpeg = self.get_jpeg(self.FRAME_MAX_AGE)
+        if jpeg is None:
+            self._update_stats(snapshots_adapter=1)
+            self.adapter.do_snapshot(file_name)
+            return
+
+        self._update_stats(snapshots_memory=1)
+        with open(file_name, 'wb') as f:
+            f.write(jpeg)
+
+        self.adapter.decorate_image(file_name)
+
     def snapshot(self):
         """
         Take snapshot from cam
@@ -103,9 +214,9 @@ class Cam:
         file_name = self.get_capture_file(self.get_manager().get_snapshot_file_template())
         Log.info('Taking snapshot from "' + self.code + '": ' + file_name)
 
-        self.adapter.do_snapshot(file_name)
+        self.save_snapshot(file_name)
 
-        self.get_manager().send_intercom_message(CamManager.INTERCOM_MESSAGE_EVENT_SNAPSHOT, {
+        self.get_manager().send_intercom_event(CamManager.INTERCOM_MESSAGE_EVENT_SNAPSHOT, {
             'filename': file_name
         })
 
@@ -189,7 +300,7 @@ class Cam:
                     else:
                         break
 
-                self.adapter.do_snapshot(snapshot_file_name)
+                self.save_snapshot(snapshot_file_name)
                 if os.path.exists(snapshot_file_name):
                     n += 1
 
@@ -198,6 +309,101 @@ class Cam:
             else:
                 time.sleep(1)
 
+    def _open_capture(self):
+        """
+        Open cam stream
+        :return: OpenCV capture or None on failure
+        """
+        url = self.adapter.get_streaming_url()
+
+        # Local devices are numbered
+        if isinstance(url, str) and url.isdigit():
+            url = int(url)
+
+        capture = cv2.VideoCapture(url)
+        if not capture.isOpened():
+            capture.release()
+            return None
+
+        return capture
+
+    def _read_frames(self, capture):
+        """
+        Decode frames into the frame buffer until the stream is lost, the cam is stopped or reloaded
+        """
+        dropped = 0
+        window_start = time.time()
+        window_frames = 0
+
+        try:
+            while not self._stop and not self._capture_reset:
+                if not capture.grab():
+                    return
+
+                ok, frame = capture.retrieve()
+                now = time.time()
+
+                if not ok or frame is None:
+                    dropped += 1
+                    self._update_stats(dropped=1)
+
+                    if dropped >= self.MAX_DROPPED_FRAMES:
+                        return
+
+                    continue
+
+                dropped = 0
+                self._frames.put(frame, now)
+
+                window_frames += 1
+                if now - window_start >= self.FPS_WINDOW:
+                    with self._lock:
+                        self._capture_stats['frames'] += window_frames
+                        self._capture_stats['fps'] = round(window_frames / (now - window_start), 2)
+
+                    window_start = now
+                    window_frames = 0
+        finally:
+            self._update_stats(frames=window_frames)
+
+    def start_capture(self):
+        """
+        Keep reading cam stream into the frame buffer, reconnecting when it is lost
+        """
+        while not self._stop:
+            if self.adapter is None or self.adapter.get_streaming_url() is None:
+                time.sleep(self.CAM_RECONNECT_TIMEOUT)
+                continue
+
+            self._capture_reset = False
+
+            capture = self._open_capture()
+            if capture is None:
+                Log.error('Cannot open stream for "' + self.code + '", retrying in ' +
+                          str(self.CAM_RECONNECT_TIMEOUT) + 's')
+
+                self._update_stats(reconnects=1)
+                time.sleep(self.CAM_RECONNECT_TIMEOUT)
+                continue
+
+            Log.info('Capturing stream for "' + self.code + '"')
+            with self._lock:
+                self._capture_stats['connected'] = True
+
+            try:
+                self._read_frames(capture)
+            finally:
+                capture.release()
+
+                with self._lock:
+                    self._capture_stats['connected'] = False
+                    self._capture_stats['fps'] = 0.0
+
+            if not self._stop and not self._capture_reset:
+                Log.error('Stream lost for "' + self.code + '", reconnecting')
+                self._update_stats(reconnects=1)
+                time.sleep(1)
+
     def restart(self):
         """
         Try to restart camera
@@ -205,6 +411,9 @@ class Cam:
         """
         self.adapter = CamManager.get_instance().create_adapter_class(cam=self)
 
+        # Capture loop reconnects with the new stream settings
+        self._capture_reset = True
+
     def reload(self):
         """
         Reload camera settings trying to not break existing stream
@@ -220,6 +429,9 @@ class Cam:
     def start(self):
         self.reload()
 
+        if self.get_manager().is_capture_enabled():
+            threading.Thread(target=self.start_capture, name='cam-' + self.code, daemon=True).start()
+
         if self.timelapse > 0:
             threading.Thread(target=self.start_timelapse).start()
 
@@ -246,6 +458,16 @@ class CamManager(Component):
     INTERCOM_MESSAGE_EVENT_VIDEO_START = 'cam-event-video-start'
     INTERCOM_MESSAGE_EVENT_VIDEO_STOP = 'cam-event-video-stop'
 
+    INTERCOM_MESSAGES = [
+        INTERCOM_MESSAGE_DO_SNAPSHOT,
+        INTERCOM_MESSAGE_DO_VIDEO_START,
+        INTERCOM_MESSAGE_DO_VIDEO_STOP,
+    ]
+
+    INTERCOM_MESSAGE_PREFIXES = [
+        INTERCOM_MESSAGE_DO_COMMAND_PREFIX,
+    ]
+
     # Do not change
     TEMPLATE_SNAPSHOT_FILE = '%time_day%/snap_%code%_%time_ts%.jpg'
     TEMPLATE_VIDEO_FILE = '%time_day%/video_%code%_%time_ts%.avi'
@@ -255,6 +477,9 @@ class CamManager(Component):
     TEMPLATE_TL_SNAP_PATHS_GLOB = '*/timelapse/*-%code%'
     TEMPLATE_TL_VIDEO_PATHS_GLOB = '*/timelapse/*-%code%.avi'
 
+    # Keep a stream open for each cam, snapshots and streaming are served from the last frame
+    DEFAULT_CAPTURE = True
+
     def _on_cam_action(self, message: Message) -> Reply:
         payload = message.message_payload
 
@@ -315,6 +540,18 @@ class CamManager(Component):
     def get_avconv(self):
         return self._params['avconv']
 
+    def is_capture_enabled(self):
+        if 'capture' in self._params:
+            return bool(self._params['capture'])
+
+        return self.DEFAULT_CAPTURE
+
+    def get_stats(self):
+        stats = Component.get_stats(self)
+        stats['cams'] = {cam_code: cam.get_stats() for cam_code, cam in CamRepo.cams.items()}
+
+        return stats
+
     def create_adapter_class(self, cam):
         if cam.type not in self._params['adapters']:
             return None
@@ -335,69 +572,84 @@ class CamManager(Component):
         Component.start(self)
         CamRepo.load()
 
+        SettingsWatcher.register(CamRepo.get_cams_file(), CamRepo.load)
+
 
 class CamRepo:
     cams = {}
+    _cam_infos = {}
     _load_lock = Lock()
 
     @classmethod
-    def _get_cams_file(cls):
+    def get_cams_file(cls):
         return App.get_settings_path() + '/cams.yml'
 
     @classmethod
     def load(cls):
         """
-        Load YML signals file
+        Load YML cams file.
+        Only cams whose settings changed are reloaded, cams are started and stopped outside the lock.
         """
 
-        cls._load_lock.acquire()
-        cams_file = cls._get_cams_file()
+        cams_file = cls.get_cams_file()
 
         try:
-            cams = yaml.load(open(cams_file, 'r'))
+            cams = Settings.load(cams_file)
             Log.info("Loading cams information from " + cams_file)
         except:
             Log.error("Loading cams information failed from " + cams_file)
             return
 
-        # Update / Create cams
-        new_codes = []
-        for cam_code, cam_info in cams.items():
-            # New cam
-            if cam_code not in cls.cams:
-                cam = Cam(
-                    code=cam_code,
-                    name=cam_info['name'],
-                    cam_type=cam_info['type'],
-                    params=cam_info['params'],
-                    timelapse=cam_info['timelapse'],
-                    history=cam_info['history'],
-                )
-                threading.Thread(target=cam.start).start()
-                cls.cams[cam.code] = cam
-
-            # Existing cam
-            else:
-                cam = cls.cams[cam_code]
-                cam.name = cam_info['name']
-                cam.params = cam_info['params']
-                cam.type = cam_info['type']
-                cam.timelapse = cam_info['timelapse']
-                cam.reload()
-
-            new_codes.append(cam.code)
-
-        # Delete old cams
-        cams_to_delete = []
-        for cam_code, cam in cls.cams.items():
-            if cam_code not in new_codes:
-                cam.stop()
-                cams_to_delete.append(cam_code)
-
-        for cam_code in cams_to_delete:
-            del cls.cams[cam_code]
-
-        cls._load_lock.release()
+        cams_to_start = []
+        cams_to_reload = []
+        cams_to_stop = []
+
+        with cls._load_lock:
+            new_cams = {}
+            cam_infos = {}
+
+            for cam_code, cam_info in cams.items():
+                # New cam
+                if cam_code not in cls.cams:
+                    cam = Cam(
+                        code=cam_code,
+                        name=cam_info['name'],
+                        cam_type=cam_info['type'],
+                        params=cam_info['params'],
+                        timelapse=cam_info['timelapse'],
+                        history=cam_info['history'],
+                    )
+                    cams_to_start.append(cam)
+
+                # Existing cam
+                else:
+                    cam = cls.cams[cam_code]
+                    if cls._cam_infos.get(cam_code) != cam_info:
+                        cam.name = cam_info['name']
+                        cam.params = cam_info['params']
+                        cam.type = cam_info['type']
+                        cam.timelapse = cam_info['timelapse']
+                        cams_to_reload.append(cam)
+
+                new_cams[cam.code] = cam
+                cam_infos[cam_code] = cam_info
+
+            # Delete old cams
+            for cam_code, cam in cls.cams.items():
+                if cam_code not in new_cams:
+                    cams_to_stop.append(cam)
+
+            cls.cams = new_cams
+            cls._cam_infos = cam_infos
+
+        for cam in cams_to_stop:
+            cam.stop()
+
+        for cam in cams_to_reload:
+            cam.reload()
+
+        for cam in cams_to_start:
+            threading.Thread(target=cam.start).start()
 
     @classmethod
     def get_by_code(cls, code) -> Cam:
@@ -3,11 +3,6 @@ import re
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from socketserver import ThreadingMixIn
 
-import io
-import cv2
-import time
-from PIL import Image
-
 from survy.core.component import Component
 from survy.core.components.cam import CamRepo, Cam
 from survy.core.log import Log
@@ -18,6 +13,8 @@ class CamThreadedHTTPServer(ThreadingMixIn, HTTPServer):
 
 
 class CamStreamHandler(BaseHTTPRequestHandler):
+    FRAME_TIMEOUT = 5
+
     def send404(self):
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
@@ -31,23 +28,19 @@ class CamStreamHandler(BaseHTTPRequestHandler):
         self.send_header('Content-type', 'multipart/x-mixed-replace; boundary=--jpgboundary')
         self.end_headers()
 
+        # Frames are encoded once by the cam and sent only when a new one is captured
+        seq = 0
         while True:
-            img = cam.image
-            if img is None:
-                time.sleep(5)
+            seq, jpg = cam.wait_jpeg(seq, self.FRAME_TIMEOUT)
+            if jpg is None:
                 continue
 
             try:
-                imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                jpg = Image.fromarray(imgRGB)
-                tmpFile = io.BytesIO()
-
-                jpg.save(tmpFile, 'JPEG')
-                self.wfile.write(bytes("--jpgboundary", 'utf-8'))
+                self.wfile.write(bytes("--jpgboundary\r\n", 'utf-8'))
                 self.send_header('Content-type', 'image/jpeg')
-                # self.send_header('Content-length', str(tmpFile.len))
+                self.send_header('Content-length', str(len(jpg)))
                 self.end_headers()
-                jpg.save(self.wfile, 'JPEG')
+                self.wfile.write(jpg)
             except:
                 Log.info("Closing camera stream for " + cam.code)
                 break
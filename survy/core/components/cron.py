@@ -8,26 +8,31 @@ class CronManager(Component):
     INTERCOM_MESSAGE_EVENT_CRON = 'cron-event'
 
     def get_variables(self):
+        now = localtime()
+
         return {
-            'time_ts': strftime("%Y%m%d%H%M%S", localtime()),
-            'time_day': strftime("%Y%m%d", localtime()),
-            'time_hour': strftime("%H", localtime()),
-            'time_minute': strftime("%M", localtime()),
-            'time_second': strftime("%S", localtime()),
-            'time_dow': strftime("%w", localtime()),
-            'time_time': strftime("%H%M%S", localtime())
+            'time_ts': strftime("%Y%m%d%H%M%S", now),
+            'time_day': strftime("%Y%m%d", now),
+            'time_hour': strftime("%H", now),
+            'time_minute': strftime("%M", now),
+            'time_second': strftime("%S", now),
+            'time_dow': strftime("%w", now),
+            'time_time': strftime("%H%M%S", now)
         }
 
     def start(self):
         Component.start(self)
 
         while True:
+            # Time variables are refreshed once per second
+            self.publish_variables()
+
             now = datetime.datetime.now()
 
             if now.second == 0:
                 dow = str(now.isoweekday())
 
-                self.send_intercom_message(self.INTERCOM_MESSAGE_EVENT_CRON, {
+                self.send_intercom_event(self.INTERCOM_MESSAGE_EVENT_CRON, {
                     'dow': dow,
                     'hour': now.hour,
                     'minute': now.minute,
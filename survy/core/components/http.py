@@ -1,26 +1,601 @@
 import json
 import re
+import selectors
+import socket
+import sys
+import threading
+import time
+from email.utils import formatdate
+from urllib.parse import urlsplit, parse_qs
 
 from survy.core.component import Component
 from http.server import BaseHTTPRequestHandler, HTTPServer
 
-from survy.core.intercom import Reply
+from survy.core.executor import Executor
+from survy.core.intercom import Reply, Message
+from survy.core.log import Log
+from survy.core.stream import EventRing
+
+
+class EventFilter:
+    """
+    Event stream subscription filters, a filter without criteria accepts everything
+    """
+    message_types = None
+    message_prefixes = None
+    components = None
+
+    def __init__(self, message_types=None, message_prefixes=None, components=None):
+        self.message_types = message_types
+        self.message_prefixes = message_prefixes
+        self.components = components
+
+    @classmethod
+    def from_query(cls, query):
+        """
+        Build filters from query string parameters (types, prefix, component), comma separated
+        :param query: Parsed query string
+        :return:
+        """
+        def get_list(key):
+            if key not in query:
+                return None
+
+            return [v for value in query[key] for v in value.split(',') if v != '']
+
+        return cls(get_list('types'), get_list('prefix'), get_list('component'))
+
+    def accepts(self, event):
+        """
+        :param event: Message dict
+        :return:
+        """
+        if self.components is not None and event['from'] not in self.components:
+            return False
+
+        if self.message_types is None and self.message_prefixes is None:
+            return True
+
+        if self.message_types is not None and event['message'] in self.message_types:
+            return True
+
+        if self.message_prefixes is not None:
+            for prefix in self.message_prefixes:
+                if event['message'].startswith(prefix):
+                    return True
+
+        return False
+
+
+class EventSubscriber:
+    """
+    Server-sent events connection detached from its HTTP worker
+    """
+    sock = None
+    event_filter = None
+    seq = None
+
+    def __init__(self, sock, event_filter, seq):
+        self.sock = sock
+        self.event_filter = event_filter
+        self.seq = seq
+
+    def get_data(self, items):
+        """
+        Encode items accepted by this subscriber
+        :param items: A list of (seq, (event, data)) tuples
+        :return: Bytes to be sent
+        """
+        data = b''
+        for (seq, (event, event_data)) in items:
+            if self.event_filter.accepts(event):
+                data += b'id: ' + bytes(str(seq), 'utf-8') + b'\n' + event_data
+
+            self.seq = seq
+
+        return data
+
+
+class EventPoller:
+    """
+    Long-poll request waiting for events in the streamer thread, detached from its HTTP worker
+    """
+    sock = None
+    event_filter = None
+    seq = None
+    deadline = None
+    events = None
+    on_answered = None
+
+    def __init__(self, sock, event_filter, seq, deadline, on_answered=None):
+        """
+        :param sock: Client socket
+        :param event_filter: Events filter
+        :param seq: Last sequence number seen by client
+        :param deadline: Timestamp of the empty reply
+        :param on_answered: Function taking the connection back once answered, None to close it
+        """
+        self.sock = sock
+        self.event_filter = event_filter
+        self.seq = seq
+        self.deadline = deadline
+        self.on_answered = on_answered
+        self.events = []
+
+    def collect(self, items):
+        """
+        :param items: A list of (seq, (event, data)) tuples
+        """
+        for (seq, (event, event_data)) in items:
+            if self.event_filter.accepts(event):
+                self.events.append(dict(event, id=seq))
+
+            self.seq = seq
+
+    def is_done(self, now):
+        return len(self.events) > 0 or now >= self.deadline
+
+    def get_response(self):
+        body = bytes(json.dumps({'seq': self.seq, 'events': self.events}), 'utf-8')
+
+        headers = 'HTTP/1.1 200 OK\r\n' + \
+            'Date: ' + formatdate(usegmt=True) + '\r\n' + \
+            'Content-type: application/json\r\n' + \
+            'Content-Length: ' + str(len(body)) + '\r\n'
+
+        if self.on_answered is None:
+            headers += 'Connection: close\r\n'
+
+        return bytes(headers + '\r\n', 'latin-1') + body
+
+
+class EventStreamer:
+    """
+    Single thread pushing ring buffer events to every server-sent events subscriber and long-poll request
+    """
+    HEARTBEAT = 15
+    SEND_TIMEOUT = 2
+
+    _ring = None
+    _lock = None
+    _subscribers = None
+    _pollers = None
+    _woken = False
+
+    def __init__(self, ring: EventRing):
+        self._ring = ring
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._pollers = []
+
+        self._stats = {
+            'subscribed': 0,
+            'slow_disconnections': 0,
+            'polls': 0,
+        }
+
+    def start(self):
+        threading.Thread(target=self._run, name='http-events', daemon=True).start()
+
+    def subscribe(self, subscriber: EventSubscriber):
+        """
+        Replay missed events, then hand the subscriber over to the streamer thread
+        :param subscriber: Subscriber with the last seen sequence number
+        :return: False if the client went away during replay
+        """
+        subscriber.sock.settimeout(self.SEND_TIMEOUT)
+
+        while True:
+            try:
+                subscriber.sock.sendall(subscriber.get_data(self._ring.read(subscriber.seq, 0)))
+            except OSError:
+                return False
+
+            # Register only once caught up, so the streamer never misses an event for this subscriber
+            with self._lock:
+                if self._ring.get_seq() <= subscriber.seq:
+                    self._subscribers.append(subscriber)
+                    self._stats['subscribed'] += 1
+                    return True
+
+    def poll(self, poller: EventPoller):
+        """
+        Hand a long-poll request over to the streamer thread, answered on the first accepted event or on deadline
+        :param poller: Detached long-poll request
+        """
+        with self._lock:
+            self._pollers.append(poller)
+            self._stats['polls'] += 1
+            self._woken = True
+
+        # Deadline may be earlier than the streamer current wait
+        self._ring.notify()
+
+    def _is_woken(self):
+        return self._woken
+
+    def _answer(self, poller: EventPoller):
+        with self._lock:
+            self._pollers.remove(poller)
+
+        try:
+            poller.sock.settimeout(self.SEND_TIMEOUT)
+            poller.sock.sendall(poller.get_response())
+        except OSError:
+            poller.on_answered = None
+
+        if poller.on_answered is not None:
+            poller.on_answered()
+            return
+
+        try:
+            poller.sock.close()
+        except OSError:
+            pass
+
+    def _get_wait_timeout(self, heartbeat_ts):
+        timeout = heartbeat_ts + self.HEARTBEAT - time.time()
+
+        with self._lock:
+            for poller in self._pollers:
+                timeout = min(timeout, poller.deadline - time.time())
+
+        return max(0, timeout)
+
+    def _disconnect(self, subscriber: EventSubscriber, slow=False):
+        with self._lock:
+            self._subscribers.remove(subscriber)
+            if slow:
+                self._stats['slow_disconnections'] += 1
+
+        try:
+            subscriber.sock.close()
+        except OSError:
+            pass
+
+    def _run(self):
+        seq = self._ring.get_seq()
+        heartbeat_ts = time.time()
+
+        while True:
+            self._ring.wait(seq, self._get_wait_timeout(heartbeat_ts), self._is_woken)
+
+            with self._lock:
+                self._woken = False
+                seq = self._ring.get_seq()
+                subscribers = list(self._subscribers)
+                pollers = list(self._pollers)
+
+            now = time.time()
+            for poller in pollers:
+                poller.collect(self._ring.read(poller.seq, 0))
+                if poller.is_done(now):
+                    self._answer(poller)
+
+            heartbeat = time.time() - heartbeat_ts >= self.HEARTBEAT
+            if heartbeat:
+                heartbeat_ts = time.time()
+
+            for subscriber in subscribers:
+                data = subscriber.get_data(self._ring.read(subscriber.seq, 0))
+
+                # Comments keep proxies from closing idle streams and detect dead clients
+                if len(data) == 0 and heartbeat:
+                    data = b': keep-alive\n\n'
+
+                if len(data) == 0:
+                    continue
+
+                try:
+                    subscriber.sock.sendall(data)
+                except socket.timeout:
+                    Log.warn('Disconnecting slow event stream client')
+                    self._disconnect(subscriber, True)
+                except OSError:
+                    self._disconnect(subscriber)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = len(self._subscribers)
+            stats['pollers'] = len(self._pollers)
+
+        return stats
+
+
+class IdleConnections:
+    """
+    Keep-alive connections waiting for their next request.
+    A single selector thread watches them, so idle clients do not hold HTTP workers.
+    """
+    # Seconds between idle timeouts checks
+    CHECK_INTERVAL = 1
+
+    _server = None
+    _timeout = None
+    _selector = None
+    _lock = None
+    _pending = None
+    _deadlines = None
+    _closed = False
+
+    def __init__(self, server, timeout):
+        self._server = server
+        self._timeout = float(timeout)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._deadlines = {}
+
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+        self._stats = {
+            'parked': 0,
+            'resumed': 0,
+            'expired': 0,
+        }
+
+    def start(self):
+        threading.Thread(target=self._run, name='http-idle', daemon=True).start()
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except BlockingIOError:
+            pass
+
+    def park(self, sock, client_address):
+        """
+        Wait for the next request on a connection, it is closed if none comes within timeout
+        :param sock: Client socket
+        :param client_address: Client address
+        """
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._pending.append((sock, client_address))
+                self._stats['parked'] += 1
+
+        if closed:
+            self._server.shutdown_request(sock)
+            return
+
+        self._wakeup()
+
+    def close(self):
+        """
+        Stop watching and close idle connections
+        """
+        with self._lock:
+            self._closed = True
+
+        self._wakeup()
+
+    def _register_pending(self, now):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+
+        for sock, client_address in pending:
+            try:
+                self._selector.register(sock, selectors.EVENT_READ, client_address)
+            except (ValueError, OSError):
+                # Closed while being parked
+                self._server.shutdown_request(sock)
+                continue
+
+            self._deadlines[sock] = now + self._timeout
+
+    def _expire(self, now):
+        for sock, deadline in list(self._deadlines.items()):
+            if deadline <= now:
+                self._selector.unregister(sock)
+                del self._deadlines[sock]
+                self._server.shutdown_request(sock)
+
+                with self._lock:
+                    self._stats['expired'] += 1
+
+    def _shutdown(self):
+        self._register_pending(time.time())
+
+        for sock in list(self._deadlines.keys()):
+            self._selector.unregister(sock)
+            self._server.shutdown_request(sock)
+
+        self._deadlines.clear()
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def _run(self):
+        check_ts = time.time()
+
+        while True:
+            with self._lock:
+                closed = self._closed
+
+            if closed:
+                self._shutdown()
+                return
+
+            self._register_pending(time.time())
+
+            for key, events in self._selector.select(self.CHECK_INTERVAL):
+                if key.fileobj is self._wakeup_r:
+                    try:
+                        self._wakeup_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+
+                    continue
+
+                # Next request arrived, or the client went away: a worker finds out
+                self._selector.unregister(key.fileobj)
+                del self._deadlines[key.fileobj]
+
+                with self._lock:
+                    self._stats['resumed'] += 1
+
+                self._server.resume(key.fileobj, key.data)
+
+            now = time.time()
+            if now - check_ts >= self.CHECK_INTERVAL:
+                self._expire(now)
+                check_ts = now
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+
+        stats['idle'] = len(self._deadlines)
+
+        return stats
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTP server handling requests on a pool of worker threads.
+    A worker is only busy while a request is being processed: new and idle keep-alive connections
+    wait for their next request in IdleConnections.
+    """
+    DEFAULT_WORKERS = 8
+    DEFAULT_KEEP_ALIVE_TIMEOUT = 30
+
+    executor = None
+    idle = None
+
+    def __init__(self, server_address, RequestHandlerClass, executor: Executor = None,
+                 keep_alive_timeout=DEFAULT_KEEP_ALIVE_TIMEOUT):
+        HTTPServer.__init__(self, server_address, RequestHandlerClass)
+
+        if executor is None:
+            executor = Executor('http', workers=self.DEFAULT_WORKERS)
+
+        self.executor = executor
+        self.idle = IdleConnections(self, keep_alive_timeout)
+        self.idle.start()
+
+        self._detached = {}
+        self._detached_lock = threading.Lock()
+
+    def detach(self, request, callback=None):
+        """
+        Keep a connection open after its handler returns, it is then owned by someone else
+        :param request: Client socket
+        :param callback: Function called once the handler returned, to hand the connection over
+        :return:
+        """
+        with self._detached_lock:
+            self._detached[request] = callback
+
+    def park(self, request, client_address):
+        """
+        Wait for the next request on a keep-alive connection without holding a worker
+        :param request: Client socket
+        :param client_address: Client address
+        """
+        self.idle.park(request, client_address)
+
+    def resume(self, request, client_address):
+        """
+        Process the next request of a parked connection
+        """
+        if not self.executor.submit(self._process_request, request, client_address):
+            self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        # Connections opened ahead by browsers must not hold a worker either
+        self.park(request, client_address)
+
+    def _process_request(self, request, client_address):
+        failed = False
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+            failed = True
+
+        with self._detached_lock:
+            detached = request in self._detached
+            callback = self._detached.pop(request, None)
+
+        if failed or not detached:
+            self.shutdown_request(request)
+            return
+
+        if callback is not None:
+            callback()
+
+    def handle_error(self, request, client_address):
+        # Clients dropping parked keep-alive connections are not errors
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            Log.debug('HTTP client %s went away', client_address)
+            return
+
+        HTTPServer.handle_error(self, request, client_address)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.idle.close()
 
 
 class WebServiceReqHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections, the timeout only bounds a request being received
+    protocol_version = 'HTTP/1.1'
+    timeout = 10
+    disable_nagle_algorithm = True
+
+    BATCH_PATH = '/_batch'
+    EVENTS_PATH = '/_events'
+    POLL_PATH = '/_poll'
+
+    MAX_POLL_TIMEOUT = 60
+
+    def _has_buffered_data(self):
+        """
+        Check if the client already sent its next request, without blocking
+        """
+        self.connection.setblocking(False)
+        try:
+            return len(self.rfile.peek(1)) > 0
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def handle(self):
+        # Pipelined requests are served at once, otherwise the connection waits idle in the server
+        self.handle_one_request()
+
+        while not self.close_connection:
+            if not self._has_buffered_data():
+                connection, client_address = self.connection, self.client_address
+                self.server.detach(connection, lambda: self.server.park(connection, client_address))
+                return
+
+            self.handle_one_request()
+
+    def _read_payload(self):
+        if 'Content-Length' in self.headers:
+            content_len = int(self.headers['Content-Length'])
+        else:
+            content_len = 0
+
+        if content_len > 0:
+            raw_data = self.rfile.read(content_len)
+            return json.loads(raw_data.decode('utf-8'))
+
+        return None
+
     def on_message(self):
         m = re.search(r'^/(?P<component>.+?)/(?P<task>.+)$', self.path)
         if m:
-            if 'Content-Length' in self.headers:
-                content_len = int(self.headers['Content-Length'])
-            else:
-                content_len = 0
-
-            if content_len > 0:
-                raw_data = self.rfile.read(content_len)
-                payload = json.loads(raw_data.decode('utf-8'))
-            else:
-                payload = None
+            payload = self._read_payload()
 
             component = m.group('component')
             task = m.group('task')
@@ -29,26 +604,211 @@ class WebServiceReqHandler(BaseHTTPRequestHandler):
 
         return Reply(status=Reply.INTERCOM_STATUS_FAILURE, payload={'message': 'Incorrect format'})
 
+    def on_batch(self):
+        """
+        Dispatch a list of {component, task, payload} items
+        :return: Reply with a list of items replies
+        """
+        items = self._read_payload()
+        if not isinstance(items, list):
+            return Reply(status=Reply.INTERCOM_STATUS_FAILURE, payload={'message': 'Incorrect format'})
+
+        replies = []
+        for item in items:
+            if not isinstance(item, dict) or 'component' not in item or 'task' not in item:
+                reply = Reply(status=Reply.INTERCOM_STATUS_FAILURE, payload={'message': 'Incorrect format'})
+
+            else:
+                payload = None
+                if 'payload' in item:
+                    payload = item['payload']
+
+                reply = HttpManager.get_instance().create_intercom_message(
+                    item['component'], item['task'], payload).send()
+
+            replies.append(reply.to_dict())
+
+        return Reply(Reply.INTERCOM_STATUS_SUCCESS, replies)
+
+    def _get_since(self, query):
+        """
+        Last event seen by client, from Last-Event-ID header or since parameter
+        :param query: Parsed query string
+        :return: Sequence number, current one if not specified
+        """
+        ring = HttpManager.get_instance().get_events()
+
+        since = self.headers.get('Last-Event-ID')
+        if since is None and 'since' in query:
+            since = query['since'][0]
+
+        if since is None:
+            return ring.get_seq()
+
+        # Client coming from a previous run, replay everything available
+        if int(since) > ring.get_seq():
+            return 0
+
+        return int(since)
+
+    def on_poll(self, query):
+        """
+        Long-poll events newer than since, waiting up to timeout seconds for one
+        :param query: Parsed query string
+        :return: Reply with last sequence number and events, None if the request waits in the streamer
+        """
+        manager = HttpManager.get_instance()
+
+        timeout = 30
+        if 'timeout' in query:
+            timeout = min(float(query['timeout'][0]), self.MAX_POLL_TIMEOUT)
+
+        keep_alive = not self.close_connection
+        connection, client_address = self.connection, self.client_address
+
+        on_answered = None
+        if keep_alive:
+            on_answered = lambda: self.server.park(connection, client_address)
+
+        poller = EventPoller(
+            connection, EventFilter.from_query(query), self._get_since(query), time.time() + timeout, on_answered)
+
+        # Events already available are returned at once
+        poller.collect(manager.get_events().read(poller.seq, 0))
+        if poller.is_done(time.time()):
+            return Reply(Reply.INTERCOM_STATUS_SUCCESS, {'seq': poller.seq, 'events': poller.events})
+
+        # Otherwise the request waits in the streamer thread, without holding a worker
+        self.close_connection = True
+        self.server.detach(connection, lambda: manager.get_streamer().poll(poller))
+
+        return None
+
+    def on_events(self, query):
+        """
+        Switch connection to a server-sent events stream served by the streamer thread
+        :param query: Parsed query string
+        :return:
+        """
+        manager = HttpManager.get_instance()
+        subscriber = EventSubscriber(self.connection, EventFilter.from_query(query), self._get_since(query))
+
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.flush()
+
+        self.close_connection = True
+        if manager.get_streamer().subscribe(subscriber):
+            self.server.detach(self.connection)
+
+    def send_json(self, status, data):
+        body = bytes(json.dumps(data), 'utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body)
+
     def do_GET(self):
         self.do_POST()
 
     def do_POST(self):
-        res = self.on_message()
+        url = urlsplit(self.path)
 
-        self.send_response(res.get_http_status())
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
+        try:
+            if url.path == self.EVENTS_PATH:
+                return self.on_events(parse_qs(url.query))
+
+            if url.path == self.POLL_PATH:
+                res = self.on_poll(parse_qs(url.query))
+                if res is None:
+                    return
+            elif url.path == self.BATCH_PATH:
+                res = self.on_batch()
+            else:
+                res = self.on_message()
+
+        except ValueError as e:
+            res = Reply(status=Reply.INTERCOM_STATUS_FAILURE, payload={'message': str(e)})
 
-        self.wfile.write(bytes(json.dumps(res.get_payload()), 'utf-8'))
+        self.send_json(res.get_http_status(), res.get_payload())
+
+    def log_message(self, format, *args):
+        Log.debug(format, *args)
 
 
 class HttpManager(Component):
     COMPONENT_TYPE = 'http-manager'
+
+    # Every message is recorded for event streams
+    INTERCOM_MESSAGES = None
+
+    DEFAULT_WORKERS = 8
+    DEFAULT_EVENTS_BUFFER_SIZE = 1000
+    DEFAULT_KEEP_ALIVE_TIMEOUT = 30
+
     server = None
+    _executor = None
+    _events = None
+    _streamer = None
+
+    def __init__(self, code, name, params=None):
+        Component.__init__(self, code, name, params)
+
+        workers = self.DEFAULT_WORKERS
+        if 'workers' in self._params:
+            workers = self._params['workers']
+
+        events_buffer_size = self.DEFAULT_EVENTS_BUFFER_SIZE
+        if 'events_buffer_size' in self._params:
+            events_buffer_size = self._params['events_buffer_size']
+
+        # Workers are only busy while processing a request
+        self._executor = Executor('http', workers=workers)
+
+        self._events = EventRing(events_buffer_size)
+        self._streamer = EventStreamer(self._events)
+
+    def get_events(self) -> EventRing:
+        return self._events
+
+    def get_streamer(self) -> EventStreamer:
+        return self._streamer
+
+    def get_stats(self):
+        stats = Component.get_stats(self)
+        stats['requests'] = self._executor.get_stats()
+        if self.server is not None:
+            stats['connections'] = self.server.idle.get_stats()
+        stats['events'] = self._events.get_stats()
+        stats['events'].update(self._streamer.get_stats())
+
+        return stats
+
+    def _on_intercom_message(self, message: Message) -> Reply:
+        # Encode once for all subscribers
+        event = message.to_dict()
+        event_data = bytes('event: ' + message.message_type + '\ndata: ' + json.dumps(event) + '\n\n', 'utf-8')
+        self._events.append((event, event_data))
+
+        return Component._on_intercom_message(self, message)
 
     def start(self):
         try:
-            self.server = HTTPServer((self._params['host'], self._params['port']), WebServiceReqHandler)
+            keep_alive_timeout = self.DEFAULT_KEEP_ALIVE_TIMEOUT
+            if 'keep_alive_timeout' in self._params:
+                keep_alive_timeout = self._params['keep_alive_timeout']
+
+            self.server = PooledHTTPServer(
+                (self._params['host'], self._params['port']), WebServiceReqHandler, self._executor,
+                keep_alive_timeout)
+
+            self._streamer.start()
             self.server.serve_forever()
         except KeyboardInterrupt:
             if self.server is not None:
@@ -1,15 +1,14 @@
 import copy
 import re
-import threading
-
-import time
-import yaml
 
 from survy.core.app import App
 from survy.core.component import Component
+from survy.core.executor import Executor, Scheduler
 from survy.core.intercom import Reply, Message
 from survy.core.log import Log
-from survy.core.utils import Utils
+from survy.core.settings import Settings
+from survy.core.utils import Utils, PayloadTemplate
+from survy.core.watcher import SettingsWatcher
 
 
 class RuleManager(Component):
@@ -24,8 +23,76 @@ class Rule:
     pass
 
 
+class PayloadMatcher:
+    """
+    Compiled payload checks shared by events and conditions
+    """
+    _checks = None
+    _dynamic_template = None
+
+    def __init__(self, payload):
+        if payload is None:
+            payload = {}
+
+        checks = []
+        dynamic_payload = {}
+
+        for k, v in payload.items():
+            if Utils.has_variables(v):
+                # Variables must be replaced at evaluation time
+                dynamic_payload[k] = v
+                checks.append((k, None))
+            else:
+                checks.append((k, self.compile_check(v)))
+
+        self._checks = checks
+        self._dynamic_template = PayloadTemplate(dynamic_payload)
+
+    @classmethod
+    def compile_check(cls, value):
+        """
+        Compile a payload check, a list is a check type followed by check values
+        :param value: Payload check
+        :return: Match callable
+        """
+        if isinstance(value, list):
+            return Utils.compile_match(check_type=value[0], check_value=value[1:])
+
+        return Utils.compile_match(check_type='ieq', check_value=[value])
+
+    def matches(self, other_payload):
+        """
+        Check if payload matches and return a dict of variables or False on failure
+        :param other_payload:
+        :return:
+        """
+        matching_vars = {}
+
+        payload = None
+        for k, match in self._checks:
+            if k not in other_payload:
+                return False
+
+            if match is None:
+                if payload is None:
+                    payload = self._dynamic_template.render(Utils.get_variables_params())
+
+                match = self.compile_check(payload[k])
+
+            res = match(other_payload[k])
+
+            # Need strict check here
+            if res is False:
+                return False
+
+            matching_vars.update(res)
+
+        return matching_vars
+
+
 class Event(Message):
     message = None
+    _matcher = None
 
     @classmethod
     def create_from_message(cls, message: Message) -> Event:
@@ -39,91 +106,64 @@ class Event(Message):
         event.message = message
         return event
 
+    def compile(self):
+        """
+        Precompute payload checks
+        """
+        self._matcher = PayloadMatcher(self.message_payload)
+
     def matches(self, other: Event):
         """
         Check if event matches and return a dict of variables or False on failure
         :param other:
         :return:
         """
-        matching_vars = {}
-
         if other.message_type != self.message_type:
             return False
 
+        if self.message_from is not None and other.message_from != self.message_from:
+            return False
+
+        if self._matcher is None:
+            self.compile()
+
         other_payload = other.message_payload
         if other_payload is None:
             other_payload = {}
 
-        payload = Utils.replace_variables_dict(self.message_payload)
-        for k, v in payload.items():
-            if k not in other_payload:
-                return False
-
-            if isinstance(v, list):
-                check_type = v[0]
-                check_values = v[1:]
-            else:
-                check_type = 'ieq'
-                check_values = [v]
-
-            res = Utils.complex_match(
-                check_type=check_type,
-                check_value=check_values,
-                value=other_payload[k]
-            )
-
-            # Need strict check here
-            if res is False:
-                return False
-
-            matching_vars.update(res)
-
-        return matching_vars
+        return self._matcher.matches(other_payload)
 
 
 class Condition:
     _condition_payload = None
+    _matcher = None
 
     def __init__(self, condition_payload):
         self.set_condition_payload(condition_payload)
 
     def set_condition_payload(self, value):
         self._condition_payload = value
+        self._matcher = PayloadMatcher(value)
 
     def get_condition_payload(self):
         return self._condition_payload
 
     def matches(self):
-        other_payload = App.get_variables()
-        payload = Utils.replace_variables_dict(self.get_condition_payload())
-
-        for k, v in payload.items():
-            if k not in other_payload:
-                return False
-
-            if isinstance(v, list):
-                check_type = v[0]
-                check_values = v[1:]
-            else:
-                check_type = 'ieq'
-                check_values = [v]
-
-            if Utils.complex_match(
-                check_type=check_type,
-                check_value=check_values,
-                value=other_payload[k]
-            ) is False:
-                return False
-
-        return True
+        return self._matcher.matches(App.get_variables()) is not False
 
 
 class Action(Message):
     _async = False
     _delay = 0
+    _debounce = False
+    _throttle = 0
+    _payload_template = None
+
+    key = None
 
     def __init__(self, message_from, message_to, message_type,
-                 action_async=False, action_delay=0, message_payload=None):
+                 action_async=False, action_delay=0, message_payload=None,
+                 action_key=None, action_debounce=False, action_throttle=0):
 
         Message.__init__(
             self,
@@ -133,15 +173,20 @@ class Action(Message):
             message_payload=message_payload
         )
 
-        self.async = action_async
+        self.is_async = action_async
         self.delay = action_delay
+        self.key = action_key
+        self.debounce = action_debounce
+        self.throttle = action_throttle
+
+        self._payload_template = PayloadTemplate(message_payload)
 
     @property
-    def async(self):
+    def is_async(self):
         return self._async
 
-    @async.setter
-    def async(self, value):
+    @is_async.setter
+    def is_async(self, value):
         self._async = int(value)
 
     @property
@@ -152,28 +197,44 @@ class Action(Message):
     def delay(self, value):
         self._delay = int(value)
 
-    def fire(self, variables):
-        if self.async:
-            threading.Thread(target=self._fire, kwargs={
-                'variables': variables,
-                'delay': self.delay
-            }).start()
+    @property
+    def debounce(self):
+        return self._debounce
 
-        else:
-            self._fire(
-                variables=variables,
-                delay=self.delay
-            )
+    @debounce.setter
+    def debounce(self, value):
+        self._debounce = bool(value)
 
-    def _fire(self, variables, delay=0):
-        time.sleep(delay)
-        message_to_send = self.copy()
+    @property
+    def throttle(self):
+        return self._throttle
 
-        payload = message_to_send.message_payload
-        new_payload = Utils.replace_variables_dict(payload, variables)
+    @throttle.setter
+    def throttle(self, value):
+        self._throttle = float(value)
 
-        message_to_send.message_payload = new_payload
-        Log.info('Firing action "' + self.message_type + '" ')
+    def fire(self, variables, scheduler: Scheduler, group=None):
+        """
+        Fire action in background, after its delay.
+        A debounced action restarts its pending timer, so it fires once after the last trigger.
+        :param variables: Action variables
+        :param scheduler: Actions scheduler
+        :param group: Timer group, the owning rule code
+        """
+        if self.debounce:
+            scheduler.schedule(self.key, self.delay, self._fire, variables, group=group)
+        else:
+            scheduler.call_later_keyed(self.key, self.delay, self._fire, variables, group=group)
+
+    def _fire(self, variables):
+        message_to_send = Message(
+            message_from=self.message_from,
+            message_to=self.message_to,
+            message_type=self.message_type,
+            message_payload=self._payload_template.render(Utils.get_variables_params(variables))
+        )
+
+        Log.info('Firing action "%s" ', self.message_type)
 
         return message_to_send.send()
 
@@ -227,153 +288,352 @@ class Rule:
 
         return False
 
-    def fire_actions(self, variables):
+    def fire_actions(self, variables, scheduler: Scheduler, start=0):
+        """
+        Fire actions in order. A delayed synchronous action postpones the following ones without holding a thread.
+        Timers are keyed by action key and grouped by rule code, so they can be cancelled.
+        :param variables: Actions variables
+        :param scheduler: Actions scheduler
+        :param start: First action to be fired
+        """
         actions = self.actions
-        for action in actions:
-            action.fire(variables)
+        for i in range(start, len(actions)):
+            action = actions[i]
+
+            if action.throttle > 0 and not scheduler.throttle(action.key, action.throttle):
+                Log.debug('Throttling action "%s"', action.key)
+                continue
+
+            if action.is_async:
+                action.fire(variables, scheduler, self.code)
+
+            elif action.debounce:
+                # Following actions still wait for the debounced one, a new trigger restarts them too
+                scheduler.schedule(action.key, action.delay, self._resume_actions, variables, scheduler, i,
+                                   group=self.code)
+                return
+
+            elif action.delay > 0:
+                scheduler.call_later_keyed(action.key, action.delay, self._resume_actions, variables, scheduler, i,
+                                           group=self.code)
+                return
+
+            else:
+                action._fire(variables)
+
+    def _resume_actions(self, variables, scheduler: Scheduler, position):
+        self.actions[position]._fire(variables)
+        self.fire_actions(variables, scheduler, position + 1)
 
 
 class RuleRepo:
     _rules = []
+    _rule_infos = {}
+    _index = {}
 
     @classmethod
-    def _get_rules_file(cls):
+    def get_rules_file(cls):
         return App.get_settings_path() + '/rules.yml'
 
+    @classmethod
+    def _create_rule(cls, rule_code, rule_info) -> Rule:
+        """
+        Create a rule from its YML representation
+        :param rule_code: Rule code
+        :param rule_info: Rule settings
+        :return: Newly created rule
+        """
+        event_instances = []
+        action_instances = []
+        condition_instances = []
+
+        for event in rule_info['events']:
+            if 'type' not in event:
+                Log.error('Missing "type" for event on rule "' + rule_code + '"')
+                continue
+
+            payload = {}
+            if 'payload' in event:
+                payload = event['payload']
+
+            component = None
+            if 'component_from' in event:
+                component = event['component_from']
+
+            event_instance = Event(
+                message_from=component,
+                message_to='',
+                message_type=event['type'],
+                message_payload=payload
+            )
+            event_instance.compile()
+
+            event_instances.append(event_instance)
+
+        for action in rule_info['actions']:
+            if 'type' not in action:
+                Log.error('Missing "type" for action on rule "' + rule_code + '"')
+                continue
+
+            payload = {}
+            if 'payload' in action:
+                payload = action['payload']
+
+            component = '_all'
+            if 'component_to' in action:
+                component = action['component_to']
+
+            action_async = False
+            if 'async' in action:
+                action_async = action['async']
+
+            delay = False
+            if 'delay' in action:
+                delay = action['delay']
+
+            # Timer key, can be shared among rules to debounce or cancel the same action
+            key = rule_code + '/' + str(len(action_instances))
+            if 'key' in action:
+                key = action['key']
+
+            debounce = False
+            if 'debounce' in action:
+                debounce = action['debounce']
+
+            throttle = 0
+            if 'throttle' in action:
+                throttle = action['throttle']
+
+            action_instances.append(Action(
+                message_to=component,
+                message_from=RuleManager.get_instance().get_code(),
+                message_type=action['type'],
+                message_payload=payload,
+                action_async=action_async,
+                action_delay=delay,
+                action_key=key,
+                action_debounce=debounce,
+                action_throttle=throttle
+            ))
+
+        if 'conditions' in rule_info:
+            for condition in rule_info['conditions']:
+                if 'payload' in condition:
+                    payload = condition['payload']
+                    condition_instance = Condition(
+                        condition_payload=payload
+                    )
+                    condition_instances.append(condition_instance)
+
+        # Settings are kept untouched, to be compared on reload
+        name = rule_code
+        if 'name' in rule_info:
+            name = rule_info['name']
+
+        return Rule(
+            code=rule_code,
+            name=name,
+            events=event_instances,
+            actions=action_instances,
+            conditions=condition_instances
+        )
+
     @classmethod
     def load(cls):
         """
-        Load YML rules file
+        Load YML rules file.
+        Rules whose settings did not change are kept, so their state survives reloads.
+        :return: Codes of replaced or removed rules
         """
-        cls._rules = []
+        rule_instances = []
+        rule_infos = {}
 
-        rules_file = cls._get_rules_file()
+        rules_file = cls.get_rules_file()
         try:
-            rules = yaml.load(open(rules_file, 'r'))
+            rules = Settings.load(rules_file)
             Log.info("Loading rules information from " + rules_file)
         except:
             Log.error("Loading rules information failed from " + rules_file)
-            return
+            return []
+
+        previous_rules = {}
+        for rule in cls._rules:
+            previous_rules[rule.code] = rule
 
+        changed = 0
         for rule_code, rule_info in rules.items():
+            if rule_code in previous_rules and cls._rule_infos.get(rule_code) == rule_info:
+                rule = previous_rules[rule_code]
+            else:
+                rule = cls._create_rule(rule_code, rule_info)
+                changed += 1
 
-            event_instances = []
-            action_instances = []
-            condition_instances = []
-
-            for event in rule_info['events']:
-                if 'type' not in event:
-                    Log.error('Missing "type" for event on rule "' + rule_code + '"')
-                    continue
-
-                payload = {}
-                if 'payload' in event:
-                    payload = event['payload']
-
-                component = None
-                if 'component_from' in event:
-                    component = event['component_from']
-
-                event_instances.append(Event(
-                    message_from=component,
-                    message_to='',
-                    message_type=event['type'],
-                    message_payload=payload
-                ))
-
-            for action in rule_info['actions']:
-                if 'type' not in action:
-                    Log.error('Missing "type" for action on rule "' + rule_code + '"')
-                    continue
-
-                payload = {}
-                if 'payload' in action:
-                    payload = action['payload']
-
-                component = '_all'
-                if 'component_to' in action:
-                    component = action['component_to']
-
-                async = False
-                if 'async' in action:
-                    async = action['async']
-
-                delay = False
-                if 'delay' in action:
-                    delay = action['delay']
-
-                action_instances.append(Action(
-                    message_to=component,
-                    message_from=RuleManager.get_instance().get_code(),
-                    message_type=action['type'],
-                    message_payload=payload,
-                    action_async=async,
-                    action_delay=delay
-                ))
-
-            if 'conditions' in rule_info:
-                for condition in rule_info['conditions']:
-                    if 'payload' in condition:
-                        payload = condition['payload']
-                        condition_instance = Condition(
-                            condition_payload=payload
-                        )
-                        condition_instances.append(condition_instance)
-
-            if 'name' not in rule_info:
-                rule_info['name'] = rule_code
-
-            rule = Rule(
-                code=rule_code,
-                name=rule_info['name'],
-                events=event_instances,
-                actions=action_instances,
-                conditions=condition_instances
-            )
+            rule_instances.append(rule)
+            rule_infos[rule_code] = rule_info
 
-            cls._rules.append(rule)
+        removed = [code for code in previous_rules.keys() if code not in rule_infos]
+        Log.info("Rules loaded: %s changed, %s removed, %s unchanged",
+                 changed, len(removed), len(rule_instances) - changed)
+
+        cls._index = cls._build_index(rule_instances)
+        cls._rules = rule_instances
+        cls._rule_infos = rule_infos
+
+        return removed + [rule.code for rule in rule_instances
+                          if rule.code in previous_rules and rule is not previous_rules[rule.code]]
+
+    @classmethod
+    def _build_index(cls, rules):
+        """
+        Build an index of rules keyed by event type and source component
+        :param rules: A list of rules
+        :return: Rules index
+        """
+        index = {}
+
+        for position, rule in enumerate(rules):
+            for event in rule.events:
+                if event.message_type not in index:
+                    index[event.message_type] = {}
+
+                by_component = index[event.message_type]
+                if event.message_from not in by_component:
+                    by_component[event.message_from] = []
+
+                if (position, rule) not in by_component[event.message_from]:
+                    by_component[event.message_from].append((position, rule))
+
+        return index
 
     @classmethod
     def get_rules(cls):
         return cls._rules
 
+    @classmethod
+    def get_message_types(cls):
+        """
+        Return the list of message types that can trigger a rule
+        :return: A list of message types
+        """
+        return list(cls._index.keys())
+
+    @classmethod
+    def get_candidate_rules(cls, message: Message):
+        """
+        Return the rules that may be triggered by a message, in file order
+        :param message: Incoming message
+        :return: A list of rules
+        """
+        index = cls._index
+        if message.message_type not in index:
+            return []
+
+        by_component = index[message.message_type]
+
+        candidates = []
+        if None in by_component:
+            candidates.extend(by_component[None])
+
+        if message.message_from is not None and message.message_from in by_component:
+            candidates.extend(by_component[message.message_from])
+            candidates.sort(key=lambda c: c[0])
+
+        return [rule for position, rule in candidates]
+
 
 class RuleManager(Component):
     COMPONENT_TYPE = 'rule-manager'
 
     INTERCOM_MESSAGE_RULE_TRIGGERED_PREFIX = 'rule-triggered-'
+    INTERCOM_MESSAGE_DO_CANCEL_TIMER = 'rule-do-cancel-timer'
+
+    INTERCOM_MESSAGES = [
+        INTERCOM_MESSAGE_DO_CANCEL_TIMER,
+    ]
+
+    DEFAULT_ACTION_WORKERS = 4
+    DEFAULT_ACTION_QUEUE_SIZE = 0
+
+    _executor = None
+    _scheduler = None
+
+    def __init__(self, code, name, params=None):
+        Component.__init__(self, code, name, params)
+
+        action_workers = self.DEFAULT_ACTION_WORKERS
+        if 'action_workers' in self._params:
+            action_workers = self._params['action_workers']
+
+        action_queue_size = self.DEFAULT_ACTION_QUEUE_SIZE
+        if 'action_queue_size' in self._params:
+            action_queue_size = self._params['action_queue_size']
+
+        self._executor = Executor('rule-actions', workers=action_workers, queue_size=action_queue_size)
+        self._scheduler = Scheduler(self._executor)
+
+    def get_stats(self):
+        stats = Component.get_stats(self)
+        stats['actions'] = self._executor.get_stats()
+        stats['timers'] = self._scheduler.get_stats()
+
+        return stats
 
     def _trigger_rule_event(self, rule: Rule, message: Message):
-        self.send_intercom_message(
+        self.send_intercom_event(
             self.INTERCOM_MESSAGE_RULE_TRIGGERED_PREFIX + rule.code, message.message_payload)
 
+    def get_intercom_messages(self):
+        # Only messages matching a rule event are routed here
+        return Component.get_intercom_messages(self) + RuleRepo.get_message_types()
+
+    def _on_cancel_timer(self, message: Message) -> Reply:
+        payload = message.message_payload
+
+        params_fail = self.check_required_parameters(payload, ['key'])
+        if params_fail:
+            return params_fail
+
+        return Reply(Reply.INTERCOM_STATUS_SUCCESS, {
+            'cancelled': self._scheduler.cancel(payload['key'])
+        })
+
     def _on_intercom_message(self, message: Message) -> Reply:
+        if message == self.INTERCOM_MESSAGE_DO_CANCEL_TIMER:
+            return self._on_cancel_timer(message)
+
         event = Event.create_from_message(message)
 
-        all_rules = RuleRepo.get_rules()
-        for rule in all_rules:
+        candidate_rules = RuleRepo.get_candidate_rules(message)
+        for rule in candidate_rules:
             res = rule.match_event(event)
             if res is not False:
-                Log.info('Triggering rule: ' + rule.code)
+                Log.info('Triggering rule: %s', rule.code)
 
                 variables = copy.deepcopy(message.message_payload)
                 variables.update(res)
 
-                threading.Thread(target=rule.fire_actions, kwargs={
-                    'variables': variables
-                }).start()
-
-                threading.Thread(target=self._trigger_rule_event, kwargs={
-                    'rule': rule,
-                    'message': message
-                }).start()
+                self._executor.submit(rule.fire_actions, variables, self._scheduler)
+                self._executor.submit(self._trigger_rule_event, rule, message)
 
         return Component._on_intercom_message(self, message)
 
+    def load_rules(self):
+        message_types = set(RuleRepo.get_message_types())
+
+        # Pending actions of outdated rules must not fire
+        for rule_code in RuleRepo.load():
+            self._scheduler.cancel_group(rule_code)
+
+        # Routing only depends on the events rules are listening to
+        if set(RuleRepo.get_message_types()) != message_types:
+            App.components.build_subscriptions()
+
     def _reload(self):
-        RuleRepo.load()
+        self.load_rules()
         return True
 
     def start(self):
         Component.start(self)
-        RuleRepo.load()
+        self.load_rules()
+
+        SettingsWatcher.register(RuleRepo.get_rules_file(), self.load_rules)
@@ -1,9 +1,9 @@
-import yaml
 
 from survy.core.app import App
 from survy.core.component import Component
 from survy.core.intercom import Message, Reply
 from survy.core.log import Log
+from survy.core.settings import Settings
 
 
 class RunlevelManager(Component):
@@ -12,6 +12,10 @@ class RunlevelManager(Component):
     INTERCOM_MESSAGE_EVENT_RUNLEVEL_CHANGE = 'runlevel-event-change'
     INTERCOM_MESSAGE_DO_RUNLEVEL_CHANGE = 'runlevel-do-change'
 
+    INTERCOM_MESSAGES = [
+        INTERCOM_MESSAGE_DO_RUNLEVEL_CHANGE,
+    ]
+
     runlevel = None
 
     def get_variables(self):
@@ -41,31 +45,34 @@ class RunlevelManager(Component):
     def load(self):
         runlevel_file = self._get_runlevel_file()
         try:
-            runlevel = yaml.load(open(runlevel_file, 'r'))
+            runlevel = Settings.load(runlevel_file)
 
             Log.info("Loading runlevel information from " + runlevel_file)
             self.runlevel = runlevel['runlevel']
+            self.publish_variables()
 
         except:
             Log.warn("Loading runlevel information failed from " + runlevel_file)
 
             self.runlevel = 'default'
+            self.publish_variables()
             self.save()
 
     def save(self):
         runlevel_file = self._get_runlevel_file()
-        yaml.dump({'runlevel': self.runlevel}, open(runlevel_file, 'w'), default_flow_style=False)
+        Settings.save(runlevel_file, {'runlevel': self.runlevel})
 
     def get_current(self):
         return self.runlevel
 
     def set_current(self, runlevel):
         if self.get_current() != runlevel:
-            self.send_intercom_message(self.INTERCOM_MESSAGE_EVENT_RUNLEVEL_CHANGE, {
+            self.send_intercom_event(self.INTERCOM_MESSAGE_EVENT_RUNLEVEL_CHANGE, {
                 'runlevel': runlevel
             })
 
             self.runlevel = runlevel
+            self.publish_variables()
             self.save()
 
     def start(self):
@@ -1,45 +1,140 @@
-import copy
+import collections
 import time
 
-from survy.core.signal import SignalManagerTTY, Signal
+from survy.core.signal import SignalManagerTTY, SignalManagerMultiTTY, SignalPort, Signal
+
+
+class OOKDebouncer:
+    """
+    Confirm codes received twice within a confirmation interval and ignore confirmed codes
+    repeated within a debounce interval.
+    Entries expire in arrival order, so each message costs O(1) amortized.
+    """
+    _confirmation_interval = None
+    _debounce_interval = None
+
+    _received = None
+    _received_expiry = None
+    _confirmed = None
+    _confirmed_expiry = None
+
+    def __init__(self, confirmation_interval, debounce_interval):
+        self._confirmation_interval = float(confirmation_interval)
+        self._debounce_interval = float(debounce_interval)
+
+        self._received = {}
+        self._received_expiry = collections.deque()
+        self._confirmed = {}
+        self._confirmed_expiry = collections.deque()
+
+    @classmethod
+    def _expire(cls, codes, expiry, interval, now):
+        while len(expiry) > 0 and now - expiry[0][0] > interval:
+            ts, code = expiry.popleft()
+
+            # Codes received again are still referenced later in the queue
+            if codes.get(code) == ts:
+                del codes[code]
+
+    @classmethod
+    def _mark(cls, codes, expiry, code, now):
+        codes[code] = now
+        expiry.append((now, code))
+
+    def receive(self, code, now, force=False):
+        """
+        Register a received code
+        :param code: Signal code
+        :param now: Reception timestamp, never lower than the previous one
+        :param force: Confirm the code even if it was recently confirmed
+        :return: True if the code must be triggered
+        """
+        self._expire(self._confirmed, self._confirmed_expiry, self._debounce_interval, now)
+        self._expire(self._received, self._received_expiry, self._confirmation_interval, now)
+
+        res = False
+
+        # Check if we received the same signal in the confirmation interval
+        if code in self._received:
+            # Check if we already triggered this confirmed message
+            res = code not in self._confirmed or force
+
+            # Mark signal as confirmed
+            self._mark(self._confirmed, self._confirmed_expiry, code, now)
+
+        self._mark(self._received, self._received_expiry, code, now)
+        return res
 
 
 class SignalManagerUsbOOK(SignalManagerTTY):
-    _last_confirmed_codes = {}  # Avoids to trigger the same signal twice in a short period
-    _last_received_codes = {}  # Confirm signal only if received twice
+    _debouncer = None
+
+    def _get_debouncer(self) -> OOKDebouncer:
+        if self._debouncer is None:
+            self._debouncer = OOKDebouncer(
+                confirmation_interval=self._params['signals-confirmation-interval'],
+                debounce_interval=self._params['debounce-interval']
+            )
 
-    def _parse_cli_message(self, message):
+        return self._debouncer
+
+    def _parse_cli_message(self, message, now=None):
         try:
             signal_code, signal_dump = message.split(':')
         except ValueError:
             return False
 
-        now = time.time()
+        if now is None:
+            now = time.time()
+
+        if self._get_debouncer().receive(signal_code, now, self.is_learning()):
+            signal = Signal(manager=self, code=signal_code, dump=signal_dump)
+            self._on_signal(signal)
 
-        # Clear old codes
-        codes = copy.deepcopy(self._last_confirmed_codes)
-        for k in list(codes):
-            if now - self._last_confirmed_codes[k] > float(self._params['debounce-interval']):
-                del self._last_confirmed_codes[k]
+        return True
 
-        codes = copy.deepcopy(self._last_received_codes)
-        for k in list(codes):
-            if now - self._last_received_codes[k] > float(self._params['signals-confirmation-interval']):
-                del self._last_received_codes[k]
+    def _fire(self, signal: Signal):
+        self.send(signal.get_dump())
+        return True
 
-        # Check if we received the same signal in the "signals-confirmation-interval" interval
-        if signal_code in self._last_received_codes:
-            # Check if we already triggered this confirmed message
-            if (signal_code not in self._last_confirmed_codes) or self.is_learning():
-                signal = Signal(manager=self, code=signal_code, dump=signal_dump)
-                self._on_signal(signal)
 
-            # Mark signal as confirmed
-            self._last_confirmed_codes[signal_code] = now
+class SignalManagerMultiUsbOOK(SignalManagerMultiTTY):
+    """
+    USB OOK adapters on several ports, for instance a 433MHz and a 868MHz receiver.
+    Every port has its own debouncer, ports may override debounce params.
+    """
+    _debouncers = None
+
+    def _get_debouncer(self, port: SignalPort) -> OOKDebouncer:
+        if self._debouncers is None:
+            self._debouncers = {}
+
+        if port.get_code() not in self._debouncers:
+            params = dict(self._params)
+            params.update(port.get_params())
+
+            self._debouncers[port.get_code()] = OOKDebouncer(
+                confirmation_interval=params['signals-confirmation-interval'],
+                debounce_interval=params['debounce-interval']
+            )
+
+        return self._debouncers[port.get_code()]
+
+    def _parse_cli_message(self, port: SignalPort, message, now=None):
+        try:
+            signal_code, signal_dump = message.split(':')
+        except ValueError:
+            return False
+
+        if now is None:
+            now = time.time()
+
+        if self._get_debouncer(port).receive(signal_code, now, self.is_learning()):
+            signal = Signal(manager=self, code=signal_code, dump=signal_dump, port=port.get_code())
+            self._on_signal(signal)
 
-        self._last_received_codes[signal_code] = now
         return True
 
     def _fire(self, signal: Signal):
-        self.send(signal.get_dump())
+        self.send(signal.get_dump(), signal.get_port())
         return True
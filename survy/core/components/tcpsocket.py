@@ -1,89 +1,381 @@
+import collections
 import json
-import socketserver
+import selectors
+import socket
 import threading
 
 from survy.core.component import Component
+from survy.core.executor import Executor
 from survy.core.intercom import Reply, Message
 from survy.core.log import Log
+from survy.core.stream import LineBuffer
 
 
-class ThreadedTCPRequestHandler(socketserver.BaseRequestHandler):
-    _lock = threading.Lock()
+class TCPClient:
+    """
+    Connected client state, sockets are only accessed by the manager loop thread
+    """
+    sock = None
+    address = None
+    line_buffer = None
+    outbound = None
+    message_types = None
+    message_prefixes = None
+    overflow = False
+    requests = None
+    busy = False
 
-    def _on_line(self, line):
-        if len(line) == 0:
-            return
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.line_buffer = LineBuffer()
+        self.outbound = collections.deque()
+        self.requests = collections.deque()
+
+    def get_name(self):
+        (host, port) = self.address
+        return host + ':' + str(port)
+
+    def set_filters(self, message_types=None, message_prefixes=None):
+        self.message_types = message_types
+        self.message_prefixes = message_prefixes
+
+    def accepts(self, message_type):
+        """
+        Check client subscription filters, a client without filters receives everything
+        :param message_type: Message type
+        :return:
+        """
+        if self.message_types is None and self.message_prefixes is None:
+            return True
+
+        if self.message_types is not None and message_type in self.message_types:
+            return True
+
+        if self.message_prefixes is not None:
+            for prefix in self.message_prefixes:
+                if message_type.startswith(prefix):
+                    return True
+
+        return False
+
+
+class TCPSocketManager(Component):
+    COMPONENT_TYPE = 'tcpsocket-manager'
+
+    INTERCOM_MESSAGE_DO_SUBSCRIBE = 'tcpsocket-do-subscribe'
+
+    # Every message is forwarded to connected clients
+    INTERCOM_MESSAGES = None
+
+    RECV_SIZE = 4096
+    DEFAULT_CLIENT_QUEUE_SIZE = 1000
+    DEFAULT_WORKERS = 4
+
+    _selector = None
+    _clients = None
+    _lock = None
+    _dirty = None
+    _wakeup_r = None
+    _wakeup_w = None
+    _executor = None
+    _client_queue_size = None
+
+    def __init__(self, code, name, params=None):
+        Component.__init__(self, code, name, params)
+
+        self._clients = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+        self._client_queue_size = self.DEFAULT_CLIENT_QUEUE_SIZE
+        if 'client_queue_size' in self._params:
+            self._client_queue_size = int(self._params['client_queue_size'])
+
+        workers = self.DEFAULT_WORKERS
+        if 'workers' in self._params:
+            workers = self._params['workers']
+
+        # Incoming requests may block on slow components, they never run on the loop thread
+        self._executor = Executor('tcpsocket', workers=workers)
+
+        self._stats = {
+            'connections': 0,
+            'sent': 0,
+            'filtered': 0,
+            'slow_disconnections': 0,
+            'oversized_disconnections': 0,
+        }
+
+    def get_stats(self):
+        stats = Component.get_stats(self)
+
+        with self._lock:
+            stats['tcpsocket'] = dict(self._stats)
+            stats['tcpsocket']['clients'] = len(self._clients)
+            stats['tcpsocket']['queued'] = sum([len(c.outbound) for c in self._clients.values()])
 
+        stats['requests'] = self._executor.get_stats()
+
+        return stats
+
+    def _wakeup(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            # Wakeup already pending
+            pass
+
+    def _enqueue(self, client: TCPClient, data):
+        """
+        Queue outbound data for a client, a client not consuming its queue is disconnected
+        :param client: Recipient client
+        :param data: Bytes to be sent
+        """
+        with self._lock:
+            if client.overflow:
+                return
+
+            if len(client.outbound) >= self._client_queue_size:
+                client.overflow = True
+            else:
+                client.outbound.append(data)
+
+            self._dirty.add(client)
+
+        self._wakeup()
+
+    def _on_subscribe(self, client: TCPClient, payload) -> Reply:
+        for key in ['types', 'prefixes']:
+            if key in payload and not isinstance(payload[key], list):
+                return Reply(Reply.INTERCOM_STATUS_FAILURE, {'message': "'" + key + "' must be a list"})
+
+        message_types = None
+        if 'types' in payload:
+            message_types = set(payload['types'])
+
+        message_prefixes = None
+        if 'prefixes' in payload:
+            message_prefixes = list(payload['prefixes'])
+
+        client.set_filters(message_types, message_prefixes)
+        return Reply(Reply.INTERCOM_STATUS_SUCCESS)
+
+    def _on_line(self, client: TCPClient, line):
         try:
             message = json.loads(line)
 
-            if 'payload' not in message:
+            if 'payload' not in message or message['payload'] is None:
                 message['payload'] = {}
 
-            reply = TCPSocketManager.get_instance().send_intercom_message(
-                message_type=message['message'],
-                message_payload=message['payload']
-            )
+            if message['message'] == self.INTERCOM_MESSAGE_DO_SUBSCRIBE:
+                reply = self._on_subscribe(client, message['payload'])
+            else:
+                reply = self.send_intercom_message(
+                    message_type=message['message'],
+                    message_payload=message['payload']
+                )
 
         except Exception as e:
+            message = None
             reply = Reply(Reply.INTERCOM_STATUS_FAILURE, {'message': str(e)})
 
-        self._lock.acquire()
-        self.request.sendall(bytes(json.dumps(reply.to_dict()) + "\n", 'utf-8'))
-        self._lock.release()
+        reply_dict = reply.to_dict()
+
+        # Echo correlation ID
+        if isinstance(message, dict) and 'id' in message:
+            reply_dict['id'] = message['id']
+
+        self._enqueue(client, bytes(json.dumps(reply_dict) + "\n", 'utf-8'))
+
+    def _run_requests(self, client: TCPClient):
+        """
+        Serve a client's requests one at a time, replies must keep requests order
+        :param client: Requesting client
+        """
+        while True:
+            with self._lock:
+                if len(client.requests) == 0:
+                    client.busy = False
+                    return
+
+                line = client.requests.popleft()
+
+            self._on_line(client, line)
+
+    def _on_intercom_message(self, message: Message) -> Reply:
+        with self._lock:
+            clients = list(self._clients.values())
+
+        if len(clients) > 0:
+            # Encode once for all clients
+            data = bytes(json.dumps(message.to_dict()) + "\n", 'utf-8')
+
+            for client in clients:
+                if client.accepts(message.message_type):
+                    self._enqueue(client, data)
+                else:
+                    with self._lock:
+                        self._stats['filtered'] += 1
+
+        return Component._on_intercom_message(self, message)
+
+    def _accept(self, server_sock):
+        try:
+            sock, address = server_sock.accept()
+        except BlockingIOError:
+            return
+
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = TCPClient(sock, address)
+
+        with self._lock:
+            self._clients[sock.fileno()] = client
+            self._stats['connections'] += 1
+
+        self._selector.register(sock, selectors.EVENT_READ, client)
+        Log.info("TCP socket client connected from " + client.get_name())
 
-    def send_message(self, message: Message):
-        self._lock.acquire()
-        self.request.sendall(bytes(json.dumps(message.to_dict()) + "\n", 'utf-8'))
-        self._lock.release()
+    def _disconnect(self, client: TCPClient):
+        with self._lock:
+            if self._clients.get(client.sock.fileno()) is not client:
+                return
 
-    def handle(self):
-        line = ''
+            del self._clients[client.sock.fileno()]
+            self._dirty.discard(client)
 
-        (host, port) = self.client_address
+        self._selector.unregister(client.sock)
+        client.sock.close()
 
-        Log.info("TCP socket client connected from " + host + ':' + str(port))
-        TCPSocketManager.get_instance().handlers[threading.current_thread()] = self
+        Log.info("TCP socket client disconnected from " + client.get_name())
 
+    def _read(self, client: TCPClient):
+        try:
+            data = client.sock.recv(self.RECV_SIZE)
+            if data == b'':
+                self._disconnect(client)
+                return
+
+            lines = client.line_buffer.feed(data)
+        except BlockingIOError:
+            return
+        except Exception:
+            self._disconnect(client)
+            return
+
+        # A client sending endless lines is either broken or hostile, its partial line is already dropped
+        if client.line_buffer.get_dropped_lines() > 0:
+            Log.error("TCP socket client " + client.get_name() + " sent an oversized line")
+            with self._lock:
+                self._stats['oversized_disconnections'] += 1
+            self._disconnect(client)
+            return
+
+        if len(lines) == 0:
+            return
+
+        with self._lock:
+            overflow = len(client.requests) + len(lines) > self._client_queue_size
+            if not overflow:
+                client.requests.extend(lines)
+
+        if overflow:
+            Log.error("TCP socket client " + client.get_name() + " sent too many requests, disconnecting")
+            with self._lock:
+                self._stats['slow_disconnections'] += 1
+            self._disconnect(client)
+            return
+
+        with self._lock:
+            if client.busy:
+                return
+
+            client.busy = True
+
+        self._executor.submit(self._run_requests, client)
+
+    def _write(self, client: TCPClient):
         while True:
+            with self._lock:
+                if len(client.outbound) == 0:
+                    break
+                data = client.outbound[0]
+
             try:
-                b = self.request.recv(1)
+                sent = client.sock.send(data)
+            except BlockingIOError:
+                return
             except Exception:
-                break
+                self._disconnect(client)
+                return
 
-            if b == b'':
-                break
+            with self._lock:
+                if sent < len(data):
+                    client.outbound[0] = data[sent:]
+                    return
 
-            c = b.decode('utf-8')
-            if c in ['\n', '\r']:
-                self._on_line(line.strip())
-                line = ''
+                client.outbound.popleft()
+                self._stats['sent'] += 1
 
-            else:
-                line += c
+        self._selector.modify(client.sock, selectors.EVENT_READ, client)
 
-        del TCPSocketManager.get_instance().handlers[threading.current_thread()]
-        Log.info("TCP socket client disconnected from " + host + ':' + str(port))
+    def _flush_dirty(self):
+        with self._lock:
+            dirty = list(self._dirty)
+            self._dirty.clear()
 
+        for client in dirty:
+            if client.overflow:
+                Log.error("TCP socket client " + client.get_name() + " is too slow, disconnecting")
 
-class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    pass
+                with self._lock:
+                    self._stats['slow_disconnections'] += 1
 
+                self._disconnect(client)
+                continue
 
-class TCPSocketManager(Component):
-    handlers = {}
-
-    def _on_intercom_message(self, message: Message) -> Reply:
-        for thread_id, handler in self.handlers.items():
-            handler.send_message(message)
-
-        return Component._on_intercom_message(self, message)
+            try:
+                self._selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+            except (KeyError, ValueError):
+                # Client already disconnected
+                pass
 
     def start(self):
         Component.start(self)
 
-        server = ThreadedTCPServer((self._params['host'], self._params['port']), ThreadedTCPRequestHandler, False)
-        server.allow_reuse_address = True
-        server.server_bind()
-        server.server_activate()
-        server.serve_forever()
+        server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_sock.bind((self._params['host'], self._params['port']))
+        server_sock.listen(socket.SOMAXCONN)
+        server_sock.setblocking(False)
+
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(server_sock, selectors.EVENT_READ, None)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+        while True:
+            for key, events in self._selector.select():
+                if key.fileobj is server_sock:
+                    self._accept(server_sock)
+
+                elif key.fileobj is self._wakeup_r:
+                    try:
+                        self._wakeup_r.recv(self.RECV_SIZE)
+                    except BlockingIOError:
+                        pass
+
+                else:
+                    client = key.data
+
+                    if events & selectors.EVENT_READ:
+                        self._read(client)
+
+                    if events & selectors.EVENT_WRITE and client.sock.fileno() >= 0:
+                        self._write(client)
+
+            self._flush_dirty()
@@ -5,7 +5,6 @@ from threading import Lock
 import os
 import telegram
 import time
-import yaml
 
 from telegram.bot import Bot
 from telegram.ext.commandhandler import CommandHandler
@@ -18,6 +17,7 @@ from survy.core.component import Component
 from survy.core.components.cam import CamManager, CamRepo, Cam
 from survy.core.intercom import Message, Reply
 from survy.core.log import Log
+from survy.core.settings import Settings
 
 
 class TelegramManager(Component):
@@ -32,6 +32,15 @@ class TelegramManager(Component):
     INTERCOM_MESSAGE_DO_SEND_CAM_SNAPSHOT = 'telegram-do-send-cam-snapshot'
     INTERCOM_MESSAGE_DO_SEND_CAM_VIDEO = 'telegram-do-send-cam-video'
 
+    INTERCOM_MESSAGES = [
+        INTERCOM_MESSAGE_DO_CHAT_MESSAGE,
+        INTERCOM_MESSAGE_DO_SEND_CAM_SNAPSHOT,
+        INTERCOM_MESSAGE_DO_SEND_CAM_VIDEO,
+        INTERCOM_MESSAGE_DO_PHOTO_MESSAGE,
+        INTERCOM_MESSAGE_DO_VIDEO_MESSAGE,
+        INTERCOM_MESSAGE_DO_DOCUMENT_MESSAGE,
+    ]
+
     _allowed_users = []
     _token = None
     _current_token = None
@@ -53,7 +62,7 @@ class TelegramManager(Component):
 
         runtime_file = self._get_runtime_file()
         try:
-            runtime = yaml.load(open(runtime_file, 'r'))
+            runtime = Settings.load(runtime_file)
             Log.info("Loading runtime from " + runtime_file)
         except:
             Log.error("Loading runtime failed from " + runtime_file)
@@ -69,7 +78,7 @@ class TelegramManager(Component):
         }
 
         self._runtime_file_mutex.acquire()
-        yaml.dump(runtime, open(runtime_file, 'w'), default_flow_style=False)
+        Settings.save(runtime_file, runtime)
         self._runtime_file_mutex.release()
 
     def _add_chat_id(self, user, chat_id):
@@ -95,7 +104,7 @@ class TelegramManager(Component):
 
         settings_file = self._get_settings_file()
         try:
-            settings = yaml.load(open(settings_file, 'r'))
+            settings = Settings.load(settings_file)
             Log.info("Loading settings from " + settings_file)
         except:
             Log.error("Loading settings failed from " + settings_file)
@@ -348,7 +357,7 @@ class TelegramManager(Component):
         self._add_chat_id(update.message.from_user.username, update.message.chat_id)
 
         if self.get_is_allowed_message(update):
-            self.send_intercom_message(
+            self.send_intercom_event(
                 self.INTERCOM_MESSAGE_EVENT_CHAT_START,
                 self._get_update_info_for_payload(update)
             )
@@ -357,7 +366,7 @@ class TelegramManager(Component):
         self._add_chat_id(update.message.from_user.username, update.message.chat_id)
 
         if self.get_is_allowed_message(update):
-            self.send_intercom_message(
+            self.send_intercom_event(
                 self.INTERCOM_MESSAGE_EVENT_CHAT_MESSAGE,
                 self._get_update_info_for_payload(update)
             )
@@ -369,6 +378,8 @@ class TelegramManager(Component):
         self._updater.dispatcher.add_handler(MessageHandler([Filters.text], self._on_message))
         self._updater.start_polling()
 
+        self.publish_variables()
+
     def _stop_bot(self):
         if self._updater is not None:
             self._updater.stop()
@@ -12,6 +12,10 @@ class TtsManager(Component):
 
     INTERCOM_MESSAGE_DO_SAY = 'tts-do-say'
 
+    INTERCOM_MESSAGES = [
+        INTERCOM_MESSAGE_DO_SAY,
+    ]
+
     _sp = None
 
     def _on_say_text(self, message: Message):
@@ -12,6 +12,11 @@ class WebClientManager(Component):
     INTERCOM_MESSAGE_DO_GET = 'webclient-do-get'
     INTERCOM_MESSAGE_DO_POST = 'webclient-do-post'
 
+    INTERCOM_MESSAGES = [
+        INTERCOM_MESSAGE_DO_GET,
+        INTERCOM_MESSAGE_DO_POST,
+    ]
+
     def _run_client(self, message: Message) -> Reply:
         payload = message.message_payload
         url = payload['url']
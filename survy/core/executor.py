@@ -0,0 +1,366 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+import traceback
+
+from survy.core.log import Log
+
+
+class Executor:
+    """
+    Pool of worker threads consuming a shared task queue
+    """
+    LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10]
+
+    _name = None
+    _workers = None
+    _queue = None
+    _started = False
+    _lock = None
+
+    def __init__(self, name, workers=4, queue_size=0):
+        self._name = name
+        self._workers = int(workers)
+        self._queue = queue.Queue(maxsize=int(queue_size))
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'busy': 0,
+            'wait_total': 0.0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+        }
+        self._histogram = [0] * (len(self.LATENCY_BUCKETS) + 1)
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+
+            self._started = True
+
+        for i in range(0, self._workers):
+            threading.Thread(target=self._work, name=self._name + '-' + str(i), daemon=True).start()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue a task
+        :param fn: Callable to be run
+        :return: False if the task has been rejected because the queue is full
+        """
+        self.start()
+
+        try:
+            self._queue.put((time.time(), fn, args, kwargs), block=False)
+        except queue.Full:
+            Log.error('Executor %s queue full, rejecting task', self._name)
+
+            with self._lock:
+                self._stats['rejected'] += 1
+
+            return False
+
+        with self._lock:
+            self._stats['submitted'] += 1
+
+        return True
+
+    def _work(self):
+        while True:
+            submit_ts, fn, args, kwargs = self._queue.get()
+            start_ts = time.time()
+
+            with self._lock:
+                self._stats['busy'] += 1
+
+            failed = False
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                Log.error('Executor %s task failed: %s', self._name, traceback.format_exc())
+
+            self._record(submit_ts, start_ts, time.time(), failed)
+
+    def _record(self, submit_ts, start_ts, end_ts, failed):
+        latency = end_ts - submit_ts
+
+        bucket = len(self.LATENCY_BUCKETS)
+        for i in range(0, len(self.LATENCY_BUCKETS)):
+            if latency <= self.LATENCY_BUCKETS[i]:
+                bucket = i
+                break
+
+        with self._lock:
+            self._stats['busy'] -= 1
+            self._stats['failed' if failed else 'completed'] += 1
+            self._stats['wait_total'] += start_ts - submit_ts
+            self._stats['latency_total'] += latency
+            self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+            self._histogram[bucket] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            histogram = list(self._histogram)
+
+        done = stats['completed'] + stats['failed']
+
+        histogram_stats = {}
+        for i in range(0, len(self.LATENCY_BUCKETS)):
+            histogram_stats['<=' + str(self.LATENCY_BUCKETS[i])] = histogram[i]
+        histogram_stats['>' + str(self.LATENCY_BUCKETS[-1])] = histogram[-1]
+
+        return {
+            'workers': self._workers,
+            'busy': stats['busy'],
+            'queue_depth': self._queue.qsize(),
+            'submitted': stats['submitted'],
+            'completed': stats['completed'],
+            'failed': stats['failed'],
+            'rejected': stats['rejected'],
+            'wait_avg': stats['wait_total'] / done if done else 0,
+            'latency_avg': stats['latency_total'] / done if done else 0,
+            'latency_max': stats['latency_max'],
+            'latency_histogram': histogram_stats,
+        }
+
+
+class Timer:
+    """
+    Scheduled call handle
+    """
+    key = None
+    group = None
+    due = None
+    fn = None
+    args = None
+    kwargs = None
+    cancelled = False
+
+    def __init__(self, due, fn, args, kwargs, key=None, group=None):
+        self.key = key
+        self.group = group
+        self.due = due
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Single timer thread running due calls on an executor.
+    Keyed timers can be restarted, throttled or cancelled by key, or cancelled together by group.
+    """
+    _executor = None
+    _heap = None
+    _keyed = None
+    _groups = None
+    _throttled = None
+    _cond = None
+    _seq = None
+    _started = False
+    _dead = 0
+
+    def __init__(self, executor: Executor):
+        self._executor = executor
+        self._heap = []
+        self._keyed = {}
+        self._groups = {}
+        self._throttled = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+        self._stats = {
+            'restarted': 0,
+            'cancelled': 0,
+            'throttled': 0,
+        }
+
+    def get_executor(self) -> Executor:
+        return self._executor
+
+    def call_later(self, delay, fn, *args, **kwargs) -> Timer:
+        """
+        Run a callable on the executor after a delay
+        :param delay: Delay in seconds
+        :param fn: Callable to be run
+        :return: Timer handle
+        """
+        timer = Timer(time.time() + float(delay), fn, args, kwargs)
+
+        if delay <= 0:
+            self._executor.submit(fn, *args, **kwargs)
+            return timer
+
+        with self._cond:
+            self._push(timer)
+
+        return timer
+
+    def call_later_keyed(self, key, delay, fn, *args, group=None, **kwargs) -> Timer:
+        """
+        Run a callable after a delay, keeping pending timers with the same key
+        :param key: Timer key, to be cancelled with
+        :param delay: Delay in seconds
+        :param fn: Callable to be run
+        :param group: Timer group, to be cancelled with
+        :return: Timer handle
+        """
+        timer = Timer(time.time() + float(delay), fn, args, kwargs, key, group)
+
+        if delay <= 0:
+            self._executor.submit(fn, *args, **kwargs)
+            return timer
+
+        with self._cond:
+            self._register(timer)
+            self._push(timer)
+
+        return timer
+
+    def schedule(self, key, delay, fn, *args, group=None, **kwargs) -> Timer:
+        """
+        Run a callable after a delay, restarting any pending timer with the same key (debounce)
+        :param key: Timer key
+        :param delay: Delay in seconds
+        :param fn: Callable to be run
+        :param group: Timer group, to be cancelled with
+        :return: Timer handle
+        """
+        timer = Timer(time.time() + float(delay), fn, args, kwargs, key, group)
+
+        with self._cond:
+            for pending in list(self._keyed.get(key, ())):
+                self._discard(pending)
+                self._stats['restarted'] += 1
+
+            self._register(timer)
+            self._push(timer)
+
+        return timer
+
+    def cancel(self, key):
+        """
+        Cancel pending timers with a key
+        :param key: Timer key
+        :return: False if no timer was pending
+        """
+        with self._cond:
+            return self._cancel(list(self._keyed.get(key, ()))) > 0
+
+    def cancel_group(self, group):
+        """
+        Cancel pending timers of a group
+        :param group: Timer group
+        :return: Number of cancelled timers
+        """
+        with self._cond:
+            return self._cancel(list(self._groups.get(group, ())))
+
+    def _cancel(self, timers):
+        for timer in timers:
+            self._discard(timer)
+
+        self._stats['cancelled'] += len(timers)
+        return len(timers)
+
+    def _discard(self, timer: Timer):
+        """
+        Cancel a pending timer, its heap entry is dropped lazily
+        """
+        self._unregister(timer)
+        timer.cancel()
+        self._dead += 1
+
+        # Restarted debounce timers would otherwise pile up until their due time
+        if self._dead > len(self._heap) - self._dead:
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._dead = 0
+
+    def _register(self, timer: Timer):
+        self._keyed.setdefault(timer.key, set()).add(timer)
+
+        if timer.group is not None:
+            self._groups.setdefault(timer.group, set()).add(timer)
+
+    def _unregister(self, timer: Timer):
+        for index, name in [(self._keyed, timer.key), (self._groups, timer.group)]:
+            timers = index.get(name)
+            if timers is None:
+                continue
+
+            timers.discard(timer)
+            if len(timers) == 0:
+                del index[name]
+
+    def throttle(self, key, interval):
+        """
+        Check if a keyed call can run, allowing at most one call per interval
+        :param key: Throttling key
+        :param interval: Interval in seconds
+        :return: True if call can run
+        """
+        now = time.time()
+
+        with self._cond:
+            if key in self._throttled and now - self._throttled[key] < float(interval):
+                self._stats['throttled'] += 1
+                return False
+
+            self._throttled[key] = now
+
+        return True
+
+    def _push(self, timer: Timer):
+        if not self._started:
+            self._started = True
+            threading.Thread(target=self._run, name='scheduler', daemon=True).start()
+
+        heapq.heappush(self._heap, (timer.due, next(self._seq), timer))
+        self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Drop cancelled timers at the head, so the wait is for a live one
+                while len(self._heap) > 0 and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                    self._dead = max(0, self._dead - 1)
+
+                if len(self._heap) == 0:
+                    self._cond.wait()
+                    continue
+
+                due, seq, timer = self._heap[0]
+
+                wait = due - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                heapq.heappop(self._heap)
+
+                if timer.key is not None:
+                    self._unregister(timer)
+
+            if not timer.cancelled:
+                self._executor.submit(timer.fn, *timer.args, **timer.kwargs)
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._heap) - self._dead
+            stats['keyed'] = len(self._keyed)
+
+        return stats
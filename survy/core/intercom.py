@@ -1,5 +1,7 @@
 import copy
+import queue
 import re
+import threading
 
 from survy.core.log import Log
 
@@ -51,20 +53,197 @@ class Reply:
         return other == self.get_status()
 
 
+class ReplyFuture:
+    """
+    Reply placeholder for a message handled by another thread
+    """
+    _reply = None
+    _event = None
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def set_reply(self, reply: Reply):
+        self._reply = reply
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def get_reply(self, timeout=None) -> Reply:
+        """
+        Wait for the reply
+        :param timeout: Maximum waiting time in seconds
+        :return: Message reply or None on timeout
+        """
+        if not self._event.wait(timeout):
+            return None
+
+        return self._reply
+
+
+class Mailbox:
+    """
+    Bounded component inbox served by a pool of worker threads
+    """
+    _local = threading.local()
+
+    _component = None
+    _queue = None
+    _workers = None
+    _request_timeout = None
+    _stats_lock = None
+
+    def __init__(self, component, workers=1, queue_size=100, request_timeout=30):
+        self._component = component
+        self._workers = int(workers)
+        self._request_timeout = float(request_timeout)
+        self._queue = queue.Queue(maxsize=int(queue_size))
+        self._stats_lock = threading.Lock()
+
+        self._stats = {
+            'queued': 0,
+            'processed': 0,
+            'dropped': 0,
+            'dropped_events': 0,
+            'overflow': 0,
+            'timeouts': 0,
+            'max_depth': 0,
+        }
+
+    @classmethod
+    def get_current(cls):
+        """
+        Return the mailbox served by the current thread
+        :return: Current mailbox or None
+        """
+        return getattr(cls._local, 'mailbox', None)
+
+    def _count(self, counter):
+        with self._stats_lock:
+            self._stats[counter] += 1
+
+    def _put(self, item, block):
+        try:
+            self._queue.put(item, block=False)
+
+        except queue.Full:
+            self._count('overflow')
+
+            if not block:
+                return False
+
+            try:
+                self._queue.put(item, timeout=self._request_timeout)
+            except queue.Full:
+                return False
+
+        with self._stats_lock:
+            self._stats['queued'] += 1
+            self._stats['max_depth'] = max(self._stats['max_depth'], self._queue.qsize())
+
+        return True
+
+    def post(self, message):
+        """
+        Queue a fire and forget message, dropping it when the inbox is full
+        :param message: Message to be delivered
+        :return: False if message has been dropped
+        """
+        if not self._put((message, None), False):
+            Log.warn('Inbox full for %s, dropping %s', self._component.get_code(), message.message_type)
+            self._count('dropped_events')
+            return False
+
+        return True
+
+    def request(self, message) -> ReplyFuture:
+        """
+        Queue a message waiting for inbox room
+        :param message: Message to be delivered
+        :return: Reply future
+        """
+        future = ReplyFuture()
+
+        if self.get_current() is self:
+            # Message sent from one of our own workers, handle it inline to avoid deadlocks
+            future.set_reply(self._component.handle_intercom_message(message))
+
+        elif not self._put((message, future), True):
+            self._count('dropped')
+            future.set_reply(Reply(Reply.INTERCOM_STATUS_FAILURE, {
+                'message': 'Inbox full for ' + self._component.get_code()
+            }))
+
+        return future
+
+    def wait(self, future: ReplyFuture) -> Reply:
+        """
+        Wait for a request reply
+        :param future: Reply future
+        :return: Message reply
+        """
+        reply = future.get_reply(self._request_timeout)
+        if not future.done():
+            self._count('timeouts')
+            return Reply(Reply.INTERCOM_STATUS_FAILURE, {
+                'message': 'Timeout waiting for ' + self._component.get_code()
+            })
+
+        return reply
+
+    def _work(self):
+        self._local.mailbox = self
+
+        while True:
+            message, future = self._queue.get()
+
+            reply = self._component.handle_intercom_message(message)
+            if future is not None:
+                future.set_reply(reply)
+
+            self._count('processed')
+
+    def start(self):
+        for i in range(0, self._workers):
+            threading.Thread(
+                target=self._work,
+                name='intercom-' + self._component.get_code() + '-' + str(i),
+                daemon=True
+            ).start()
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = copy.copy(self._stats)
+
+        stats['depth'] = self._queue.qsize()
+        stats['queue_size'] = self._queue.maxsize
+        stats['workers'] = self._workers
+
+        return stats
+
+
 class Message:
     INTERCOM_RECIPIENT_BROADCAST = '_all'
     INTERCOM_RECIPIENT_TYPE_BROADCAST = '_type'
 
+    # Requests wait for inbox room and replies, events are delivered fire and forget to asynchronous components
+    INTERCOM_DELIVERY_REQUEST = 'request'
+    INTERCOM_DELIVERY_EVENT = 'event'
+
     message_from = None
     message_to = None
     message_type = None
     message_payload = None
+    delivery = None
 
-    def __init__(self, message_from, message_to, message_type, message_payload=None):
+    def __init__(self, message_from, message_to, message_type, message_payload=None,
+                 delivery=INTERCOM_DELIVERY_REQUEST):
         self.message_from = message_from
         self.message_to = message_to
         self.message_type = message_type
         self.message_payload = message_payload
+        self.delivery = delivery
 
     def to_dict(self):
         return {
@@ -79,7 +258,8 @@ class Message:
             message_from=self.message_from,
             message_to=self.message_to,
             message_type=self.message_type,
-            message_payload=copy.deepcopy(self.message_payload)
+            message_payload=copy.deepcopy(self.message_payload),
+            delivery=self.delivery
         )
 
     def get_recipients(self):
@@ -93,18 +273,22 @@ class Message:
             return self.message_to
 
         if self.message_to == self.INTERCOM_RECIPIENT_BROADCAST:
-            return App.components.get_list()
+            return App.components.get_subscribers(self.message_type)
 
         # Type broadcast
-        m = re.search('^' + self.INTERCOM_RECIPIENT_TYPE_BROADCAST + r':(?P<type>.+)$', self.get_message_to())
+        m = re.search('^' + self.INTERCOM_RECIPIENT_TYPE_BROADCAST + r':(?P<type>.+)$', self.message_to)
         if m:
-            return App.components.get_list(m.group('type'))
+            subscribers = App.components.get_subscribers(self.message_type)
+            return [code for code in App.components.get_list(m.group('type')) if code in subscribers]
 
         return [self.message_to]
 
     def __eq__(self, other):
         return other == self.message_type
 
+    def is_event(self):
+        return self.delivery == self.INTERCOM_DELIVERY_EVENT
+
     def send(self) -> Reply:
         """
         Send a message to intercom channel
@@ -116,26 +300,49 @@ class Message:
         res = {}
         status = Reply.INTERCOM_STATUS_SUCCESS
 
+        # Dispatch first, then collect replies so asynchronous components work in parallel
+        replies = []
+        is_event = self.is_event()
+
         recipients = self.get_recipients()
         for component in recipients:
             component_instance = App.components.get(component)
 
             if component_instance is not None:
-                reply = component_instance.handle_intercom_message(self)
+                mailbox = component_instance.get_mailbox()
+
+                if mailbox is None:
+                    replies.append((component, component_instance.handle_intercom_message(self)))
 
-                if reply is not None:
-                    if reply != Reply.INTERCOM_STATUS_NOT_FOUND:
-                        # At least one component can handle our message
-                        found = True
+                elif is_event:
+                    found = True
 
-                        if reply == Reply.INTERCOM_STATUS_FAILURE:
-                            # Set failure when at least one component replies with failure
-                            status = Reply.INTERCOM_STATUS_FAILURE
+                    if not mailbox.post(self):
+                        # Let the sender know, the event is lost for this component
+                        res[component] = Reply(Reply.INTERCOM_STATUS_NON_BLOCKING_FAILURE, {
+                            'message': 'Inbox full for ' + component
+                        }).to_dict()
 
-                        res[component] = reply.to_dict()
+                else:
+                    replies.append((component, mailbox.request(self)))
 
             else:
-                Log.error('Unknown component: ' + component)
+                Log.error('Unknown component: %s', component)
+
+        for component, reply in replies:
+            if isinstance(reply, ReplyFuture):
+                reply = App.components.get(component).get_mailbox().wait(reply)
+
+            if reply is not None:
+                if reply != Reply.INTERCOM_STATUS_NOT_FOUND:
+                    # At least one component can handle our message
+                    found = True
+
+                    if reply == Reply.INTERCOM_STATUS_FAILURE:
+                        # Set failure when at least one component replies with failure
+                        status = Reply.INTERCOM_STATUS_FAILURE
+
+                    res[component] = reply.to_dict()
 
         if not found:
             return Reply(Reply.INTERCOM_STATUS_NOT_FOUND)
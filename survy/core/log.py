@@ -1,35 +1,50 @@
-import inspect
+import atexit
 import logging
+import queue
 import sys
 
-from logging.handlers import RotatingFileHandler
-
-
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 
 class Log:
     FACILITY = 'survy-has'
     FORMAT = '%(asctime)-15s [%(levelname)-6s] %(class)-20s: %(message)s'
+    LOG_FILE = '/var/log/survy.log'
 
     init_done = False
 
+    _logger = None
+    _listener = None
+
     @classmethod
     def _init(cls):
         if not cls.init_done:
             cls.init_done = True
 
-            logging.basicConfig(level=logging.INFO)
-
             formatter = logging.Formatter(cls.FORMAT)
 
             file_handler = RotatingFileHandler(
-                filename='/var/log/survy.log',
+                filename=cls.LOG_FILE,
                 mode='a',
                 backupCount=10,
                 maxBytes=1000000)
             file_handler.setLevel(logging.DEBUG)
             file_handler.setFormatter(formatter)
-            cls._get_logger().addHandler(file_handler)
+            file_handler.addFilter(logging.Filter(cls.FACILITY))
+
+            # Same output basicConfig gave on stderr, for every logger
+            stderr_handler = logging.StreamHandler()
+            stderr_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+            # Console and disk writes are performed by the listener thread, never by the caller
+            log_queue = queue.Queue(-1)
+            cls._listener = QueueListener(log_queue, stderr_handler, file_handler, respect_handler_level=True)
+            cls._listener.start()
+            atexit.register(cls._listener.stop)
+
+            root_logger = logging.getLogger()
+            root_logger.setLevel(logging.INFO)
+            root_logger.addHandler(QueueHandler(log_queue))
 
             # stdout_handler = logging.StreamHandler(stream=sys.stdout)
             # stdout_handler.setLevel(logging.DEBUG)
@@ -38,37 +53,47 @@ class Log:
 
     @classmethod
     def _get_logger(cls):
-        return logging.getLogger(cls.FACILITY)
+        if cls._logger is None:
+            cls._logger = logging.getLogger(cls.FACILITY)
+
+        return cls._logger
 
     @classmethod
     def _get_caller(cls):
-        l = inspect.stack()[2][0].f_locals
+        # 0: _get_caller, 1: _log, 2: Log public method, 3: caller
+        frame = sys._getframe(3)
+        code = frame.f_code
+
+        if code.co_argcount > 0 and code.co_varnames[0] in ['self', 'cls']:
+            owner = frame.f_locals.get(code.co_varnames[0])
 
-        if 'self' in l.keys():
-            return inspect.stack()[2][0].f_locals["self"].__class__.__name__
+            if code.co_varnames[0] == 'self':
+                return owner.__class__.__name__
 
-        if 'cls' in inspect.stack()[2][0].f_locals:
-            return inspect.stack()[2][0].f_locals["cls"].__name__
+            return owner.__name__
 
-        return inspect.stack()[2][0].f_locals['__file__']
+        return frame.f_globals.get('__file__', code.co_filename)
 
     @classmethod
-    def debug(cls, msg):
+    def _log(cls, level, msg, args):
         cls._init()
 
-        cls._get_logger().debug(msg, extra={'class': cls._get_caller()})
+        logger = cls._get_logger()
+        if logger.isEnabledFor(level):
+            logger.log(level, msg, *args, extra={'class': cls._get_caller()})
 
     @classmethod
-    def info(cls, msg):
-        cls._init()
-        cls._get_logger().info(msg, extra={'class': cls._get_caller()})
+    def debug(cls, msg, *args):
+        cls._log(logging.DEBUG, msg, args)
 
     @classmethod
-    def warn(cls, msg):
-        cls._init()
-        cls._get_logger().warn(msg, extra={'class': cls._get_caller()})
+    def info(cls, msg, *args):
+        cls._log(logging.INFO, msg, args)
 
     @classmethod
-    def error(cls, msg):
-        cls._init()
-        cls._get_logger().error(msg, extra={'class': cls._get_caller()})
+    def warn(cls, msg, *args):
+        cls._log(logging.WARNING, msg, args)
+
+    @classmethod
+    def error(cls, msg, *args):
+        cls._log(logging.ERROR, msg, args)
@@ -0,0 +1,184 @@
+class SignalIndex:
+    """
+    Nearest neighbour lookup of OOK signals.
+    Codes are hex bit patterns compared by Hamming distance, dumps are sequences of 3 hex digits
+    pulse durations compared with a relative timing tolerance.
+
+    Codes are split in max_distance + 1 blocks: two codes within max_distance bits share at least
+    one identical block, so only signals sharing a block are compared.
+    """
+    DEFAULT_MAX_DISTANCE = 2
+    DEFAULT_TIMING_TOLERANCE = .25
+
+    PULSE_DIGITS = 3
+
+    _max_distance = None
+    _timing_tolerance = None
+    _blocks = None
+    _entries = None
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, timing_tolerance=DEFAULT_TIMING_TOLERANCE):
+        self._max_distance = int(max_distance)
+        self._timing_tolerance = float(timing_tolerance)
+        self._blocks = {}
+        self._entries = {}
+
+    @classmethod
+    def parse_code(cls, code):
+        """
+        :param code: Hex code
+        :return: A (value, bits) tuple or None if code is not an hex bit pattern
+        """
+        try:
+            return int(code, 16), len(code) * 4
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def parse_dump(cls, dump):
+        """
+        :param dump: Pulses dump
+        :return: A list of pulse durations or None if dump is not valid
+        """
+        if not isinstance(dump, str) or len(dump) == 0 or len(dump) % cls.PULSE_DIGITS != 0:
+            return None
+
+        try:
+            return [int(dump[i:i + cls.PULSE_DIGITS], 16) for i in range(0, len(dump), cls.PULSE_DIGITS)]
+        except ValueError:
+            return None
+
+    def _get_blocks(self, value, bits):
+        """
+        Split a code in max_distance + 1 blocks
+        :return: A list of (bits, block number, block value) keys
+        """
+        count = min(self._max_distance + 1, bits)
+        size = bits // count
+
+        res = []
+        shift = 0
+        for i in range(0, count):
+            # Last block takes the remaining bits
+            block_bits = size if i < count - 1 else bits - shift
+            res.append((bits, i, (value >> shift) & ((1 << block_bits) - 1)))
+            shift += block_bits
+
+        return res
+
+    def add(self, item, code, dump):
+        """
+        Index an item
+        :param item: Item to be returned by lookup
+        :param code: Hex code
+        :param dump: Pulses dump
+        :return: False if code cannot be indexed
+        """
+        parsed = self.parse_code(code)
+        if parsed is None or parsed[1] == 0:
+            return False
+
+        self.remove(item)
+
+        value, bits = parsed
+        blocks = self._get_blocks(value, bits)
+        self._entries[id(item)] = (item, value, bits, self.parse_dump(dump), blocks)
+
+        for block in blocks:
+            if block not in self._blocks:
+                self._blocks[block] = []
+
+            self._blocks[block].append(id(item))
+
+        return True
+
+    def remove(self, item):
+        entry = self._entries.pop(id(item), None)
+        if entry is None:
+            return
+
+        for block in entry[4]:
+            self._blocks[block].remove(id(item))
+            if len(self._blocks[block]) == 0:
+                del self._blocks[block]
+
+    def clear(self):
+        self._blocks = {}
+        self._entries = {}
+
+    def get_timing_score(self, pulses, other_pulses):
+        """
+        :return: Timing similarity between 0 and 1, None if unknown
+        """
+        if pulses is None or other_pulses is None:
+            return None
+
+        if len(pulses) != len(other_pulses):
+            return 0.0
+
+        drift = 0.0
+        for a, b in zip(pulses, other_pulses):
+            drift += abs(a - b) / max(a, b, 1)
+
+        return 1 - drift / len(pulses)
+
+    def get_confidence(self, distance, bits, timing_score):
+        confidence = 1 - distance / bits
+        if timing_score is not None:
+            confidence *= timing_score
+
+        return round(confidence, 3)
+
+    def score(self, item, code, dump):
+        """
+        Compare a signal with an indexed item, regardless of tolerances
+        :return: Confidence between 0 and 1, None if not comparable
+        """
+        entry = self._entries.get(id(item))
+        parsed = self.parse_code(code)
+        if entry is None or parsed is None or parsed[1] != entry[2]:
+            return None
+
+        distance = bin(parsed[0] ^ entry[1]).count('1')
+        return self.get_confidence(distance, entry[2], self.get_timing_score(self.parse_dump(dump), entry[3]))
+
+    def lookup(self, code, dump):
+        """
+        Find the most similar item within tolerances
+        :param code: Received hex code
+        :param dump: Received pulses dump
+        :return: An (item, confidence) tuple or (None, 0) if nothing matches
+        """
+        parsed = self.parse_code(code)
+        if parsed is None or parsed[1] == 0:
+            return None, 0
+
+        value, bits = parsed
+        pulses = self.parse_dump(dump)
+
+        candidates = set()
+        for block in self._get_blocks(value, bits):
+            candidates.update(self._blocks.get(block, []))
+
+        best = None
+        best_confidence = 0
+        for candidate in candidates:
+            item, item_value, item_bits, item_pulses, blocks = self._entries[candidate]
+
+            distance = bin(value ^ item_value).count('1')
+            if distance > self._max_distance:
+                continue
+
+            timing_score = self.get_timing_score(pulses, item_pulses)
+            if timing_score is not None and 1 - timing_score > self._timing_tolerance:
+                continue
+
+            confidence = self.get_confidence(distance, bits, timing_score)
+            if confidence > best_confidence:
+                best = item
+                best_confidence = confidence
+
+        return best, best_confidence
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+import yaml
+
+from survy.core.log import Log
+
+# libyaml bindings are much faster than the pure Python parser, when available
+try:
+    from yaml import CSafeLoader as SettingsLoader, CSafeDumper as SettingsDumper
+except ImportError:
+    from yaml import SafeLoader as SettingsLoader, SafeDumper as SettingsDumper
+
+
+class Settings:
+    """
+    YML settings loader.
+    Parsed files are cached as pickled snapshots under the sys path, so unchanged files
+    are not parsed again on restart or reload.
+    """
+    CACHE_VERSION = 1
+    CACHE_DIR = 'settings-cache'
+
+    _lock = threading.Lock()
+    _stats = {
+        'hits': 0,
+        'misses': 0,
+        'parse_time': 0.0,
+    }
+
+    @classmethod
+    def _get_cache_file(cls, file_name):
+        from survy.core.app import App
+
+        if App.get_base_path() is None:
+            return None
+
+        key = hashlib.sha1(bytes(os.path.abspath(file_name), 'utf-8')).hexdigest()
+        return App.get_sys_path() + '/' + cls.CACHE_DIR + '/' + key + '.pickle'
+
+    @classmethod
+    def _read_cache(cls, cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception:
+            return None
+
+        if not isinstance(cache, dict) or cache.get('version') != cls.CACHE_VERSION:
+            return None
+
+        return cache
+
+    @classmethod
+    def _write_cache(cls, cache_file, cache):
+        try:
+            os.makedirs(os.path.dirname(cache_file), 0o750, True)
+
+            tmp_file = cache_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            Log.warn('Cannot write settings cache %s: %s', cache_file, e)
+
+    @classmethod
+    def parse(cls, content):
+        """
+        Parse a YML document
+        :param content: YML text or bytes
+        :return: Parsed document
+        """
+        start = time.time()
+        data = yaml.load(content, Loader=SettingsLoader)
+
+        with cls._lock:
+            cls._stats['parse_time'] += time.time() - start
+
+        return data
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        Load a YML file, using the cached snapshot when the file did not change.
+        Each call returns a new object, so callers may modify it.
+
+        :param file_name: YML file
+        :return: Parsed document
+        """
+        stat = os.stat(file_name)
+
+        cache_file = cls._get_cache_file(file_name)
+        cache = None
+        if cache_file is not None:
+            cache = cls._read_cache(cache_file)
+
+        # Same size and modification time, file is unchanged
+        if cache is not None and cache['mtime'] == stat.st_mtime_ns and cache['size'] == stat.st_size:
+            with cls._lock:
+                cls._stats['hits'] += 1
+
+            return cache['data']
+
+        with open(file_name, 'rb') as f:
+            content = f.read()
+
+        digest = hashlib.sha1(content).hexdigest()
+
+        # File touched or copied, but content is the same
+        if cache is not None and cache['hash'] == digest:
+            data = cache['data']
+
+            with cls._lock:
+                cls._stats['hits'] += 1
+
+        else:
+            data = cls.parse(content)
+
+            with cls._lock:
+                cls._stats['misses'] += 1
+
+        if cache_file is not None:
+            cls._write_cache(cache_file, {
+                'version': cls.CACHE_VERSION,
+                'mtime': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'hash': digest,
+                'data': data,
+            })
+
+        return data
+
+    @classmethod
+    def save(cls, file_name, data):
+        """
+        Save a YML file through a temporary file and a rename
+        :param file_name: YML file
+        :param data: Document to be saved
+        """
+        from survy.core.utils import Utils
+
+        Utils.write_file_atomic(file_name, yaml.dump(data, Dumper=SettingsDumper, default_flow_style=False))
+
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            stats = dict(cls._stats)
+
+        stats['libyaml'] = SettingsLoader is not yaml.SafeLoader
+
+        return stats
@@ -1,3 +1,11 @@
+import collections
+import errno
+import heapq
+import itertools
+import json
+import os
+import selectors
+import socket
 import threading
 
 import serial
@@ -5,12 +13,16 @@ import select
 import re
 
 import time
-import yaml
 
 from survy.core.app import App
+from survy.core.capture import CaptureReader, CaptureWriter
 from survy.core.component import Component
 from survy.core.intercom import Message, Reply
 from survy.core.log import Log
+from survy.core.recognition import SignalIndex
+from survy.core.settings import Settings
+from survy.core.stream import LineBuffer
+from survy.core.watcher import SettingsWatcher
 
 
 class Signal:
@@ -28,22 +40,80 @@ class SignalManager(Component):
     INTERCOM_MESSAGE_EVENT_LEARN_END = 'signal-event-learn-end'
     INTERCOM_MESSAGE_DO_LEARN = 'signal-do-learn'
     INTERCOM_MESSAGE_DO_FIRE = 'signal-do-fire'
+    INTERCOM_MESSAGE_DO_FIRE_BATCH = 'signal-do-fire-batch'
+
+    FIRE_STATUS_QUEUED = 'queued'
+    FIRE_STATUS_NOT_FOUND = 'not-found'
+    FIRE_STATUS_OTHER_MANAGER = 'other-manager'
 
     LEARN_TIMEOUT = 10
-    SIGNAL_RELAX_TIME = .1
+
+    # Max different code bits for a received signal to be recognized, only exact codes by default
+    DEFAULT_RECOGNITION_DISTANCE = 0
+
+    # Lower values are transmitted first
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 10
+    PRIORITY_LOW = 20
+
+    INTERCOM_MESSAGES = [
+        INTERCOM_MESSAGE_DO_LEARN,
+        INTERCOM_MESSAGE_EVENT_LEARN_END,
+        INTERCOM_MESSAGE_DO_FIRE,
+        INTERCOM_MESSAGE_DO_FIRE_BATCH,
+    ]
 
     _learning_signal = None
     _learn_timeout = None
     _free_channel_ts = None
 
-    def _can_send_message(self):
-        return self._free_channel_ts is None or self._free_channel_ts < time.time()
+    # Transmit queue, a heap of [priority, seq, queued_ts, signal, cancelled] entries
+    _tx_queue = None
+    _tx_pending = None
+    _tx_condition = None
+    _tx_seq = None
+    _tx_depth = 0
+    _tx_started = False
+
+    def __init__(self, code, name, params=None):
+        Component.__init__(self, code, name, params)
+
+        self._tx_queue = []
+        self._tx_pending = {}
+        self._tx_condition = threading.Condition()
+        self._tx_seq = itertools.count()
+
+        self._tx_stats = {
+            'queued': 0,
+            'coalesced': 0,
+            'sent': 0,
+            'failed': 0,
+            'max_depth': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        }
+
+    def get_stats(self):
+        stats = Component.get_stats(self)
+
+        with self._tx_condition:
+            tx_stats = dict(self._tx_stats)
+            tx_stats['depth'] = self._tx_depth
+
+        wait_total = tx_stats.pop('wait_total')
+        tx_stats['wait_avg'] = 0.0
+        if tx_stats['sent'] + tx_stats['failed'] > 0:
+            tx_stats['wait_avg'] = wait_total / (tx_stats['sent'] + tx_stats['failed'])
+
+        stats['transmitter'] = tx_stats
+
+        return stats
 
     def _delay_signal(self):
         self._free_channel_ts = time.time() + float(self._params['signals-interval'])
 
     def _on_signal(self, signal: Signal):
-        Log.info("Received signal: " + str(signal))
+        Log.info("Received signal: %s", signal)
 
         self._delay_signal()
 
@@ -51,13 +121,15 @@ class SignalManager(Component):
             self._learn_signal(signal)
 
         else:
-            self.send_intercom_message(SignalManager.INTERCOM_MESSAGE_EVENT_SIGNAL_RECEIVED, signal.to_dict())
+            self.send_intercom_event(SignalManager.INTERCOM_MESSAGE_EVENT_SIGNAL_RECEIVED, signal.to_dict())
 
-            recognized_signal = SignalRepo.get_by_signal(signal)
+            recognized_signal, confidence = SignalRepo.recognize(signal)
             if recognized_signal is not None:
-                Log.info("Recognized signal: " + str(recognized_signal))
-                self.send_intercom_message(SignalManager.INTERCOM_MESSAGE_EVENT_SIGNAL_RECOGNIZED,
-                                           recognized_signal.to_dict())
+                Log.info("Recognized signal: %s (confidence %s)", recognized_signal, confidence)
+
+                payload = recognized_signal.to_dict()
+                payload['confidence'] = confidence
+                self.send_intercom_event(SignalManager.INTERCOM_MESSAGE_EVENT_SIGNAL_RECOGNIZED, payload)
 
     def _learn_signal(self, signal: Signal):
         Log.info("Learning signal " + str(signal))
@@ -65,11 +137,12 @@ class SignalManager(Component):
         self._learning_signal.set_manager(signal.get_manager())
         self._learning_signal.set_code(signal.get_code())
         self._learning_signal.set_dump(signal.get_dump())
+        self._learning_signal.set_port(signal.get_port())
 
         SignalRepo.add(self._learning_signal)
 
-        self.send_intercom_message(self.INTERCOM_MESSAGE_EVENT_LEARN_NEW_SIGNAL, signal.to_dict())
-        self.send_intercom_message(self.INTERCOM_MESSAGE_EVENT_LEARN_END)
+        self.send_intercom_event(self.INTERCOM_MESSAGE_EVENT_LEARN_NEW_SIGNAL, signal.to_dict())
+        self.send_intercom_event(self.INTERCOM_MESSAGE_EVENT_LEARN_END)
 
     def is_learning(self):
         return self._learning_signal is not None
@@ -78,7 +151,7 @@ class SignalManager(Component):
         if self._learning_signal is not None:
             Log.info("Learning signal timeout")
 
-            self.send_intercom_message(self.INTERCOM_MESSAGE_EVENT_LEARN_FAIL, self._learning_signal.to_dict())
+            self.send_intercom_event(self.INTERCOM_MESSAGE_EVENT_LEARN_FAIL, self._learning_signal.to_dict())
             self._learning_signal = None
 
     def _on_learn_start(self, message: Message) -> Reply:
@@ -99,7 +172,7 @@ class SignalManager(Component):
         self._learn_timeout.start()
 
         Log.info("Learning start: " + str(self._learning_signal))
-        self.send_intercom_message(self.INTERCOM_MESSAGE_EVENT_LEARN_START, self._learning_signal.to_dict())
+        self.send_intercom_event(self.INTERCOM_MESSAGE_EVENT_LEARN_START, self._learning_signal.to_dict())
 
         return Reply(Reply.INTERCOM_STATUS_SUCCESS)
 
@@ -119,9 +192,66 @@ class SignalManager(Component):
         if signal is None:
             return Reply(Reply.INTERCOM_STATUS_FAILURE)
 
-        signal.fire()
+        priority = self.PRIORITY_NORMAL
+        if 'priority' in payload:
+            priority = int(payload['priority'])
+
+        signal.fire(priority)
         return Reply(Reply.INTERCOM_STATUS_SUCCESS)
 
+    def _on_do_fire_batch(self, message: Message) -> Reply:
+        """
+        Fire a list of {device, sub, repeat} signals as a single ordered burst.
+        Every signal manager receives the batch and only transmits its own signals.
+        """
+        payload = message.message_payload
+
+        params_fail = self.check_required_parameters(payload, ['signals'])
+        if params_fail:
+            return params_fail
+
+        priority = self.PRIORITY_NORMAL
+        if 'priority' in payload:
+            priority = int(payload['priority'])
+
+        repeat = 1
+        if 'repeat' in payload:
+            repeat = int(payload['repeat'])
+
+        items = payload['signals']
+        signals = SignalRepo.get_by_codes([(item['device'], item['sub']) for item in items])
+
+        burst = []
+        results = []
+        status = Reply.INTERCOM_STATUS_SUCCESS
+        for item, signal in zip(items, signals):
+            if signal is None:
+                item_status = self.FIRE_STATUS_NOT_FOUND
+                status = Reply.INTERCOM_STATUS_FAILURE
+
+            elif signal.get_manager() is not self:
+                item_status = self.FIRE_STATUS_OTHER_MANAGER
+
+            else:
+                item_status = self.FIRE_STATUS_QUEUED
+
+                item_repeat = 1
+                if 'repeat' in item:
+                    item_repeat = int(item['repeat'])
+
+                burst += [signal] * item_repeat
+
+            results.append({
+                'device': item['device'],
+                'sub': item['sub'],
+                'status': item_status,
+            })
+
+        if len(burst) > 0:
+            self.fire_burst(burst * repeat, priority)
+
+        return Reply(status, {'signals': results})
+
     def _on_intercom_message(self, message: Message) -> Reply:
         if message == self.INTERCOM_MESSAGE_DO_LEARN:
             return self._on_learn_start(message)
@@ -132,28 +262,176 @@ class SignalManager(Component):
         if message == self.INTERCOM_MESSAGE_DO_FIRE:
             return self._on_do_fire(message)
 
+        if message == self.INTERCOM_MESSAGE_DO_FIRE_BATCH:
+            return self._on_do_fire_batch(message)
+
         return Component._on_intercom_message(self, message)
 
-    def fire(self, signal: Signal):
-        t = threading.Thread(target=self._fire_delayed, args=(signal, ))
-        t.start()
+    def fire(self, signal: Signal, priority=PRIORITY_NORMAL):
+        """
+        Queue a signal for transmission. A signal already waiting in queue is not queued twice.
+        :param signal: Signal to be transmitted
+        :param priority: Transmission priority, signals with the same priority are sent in order
+        :return: False if the signal was already queued
+        """
+        self._start_transmitter()
 
-    def _fire_delayed(self, signal: Signal):
-        Log.info('Queuing signal: ' + str(signal))
-        while not self._can_send_message():
-            time.sleep(self.SIGNAL_RELAX_TIME)
+        key = self._get_tx_key(signal)
 
-        Log.info('Firing signal: ' + str(signal))
-        self._delay_signal()
-        self._fire(signal)
+        with self._tx_condition:
+            pending = self._tx_pending.get(key)
+            if pending is not None:
+                self._tx_stats['coalesced'] += 1
+
+                if priority >= pending[0]:
+                    Log.info('Signal already queued: %s', signal)
+                    return False
+
+                # Move the pending transmission ahead
+                pending[4] = True
+                self._tx_depth -= 1
+
+            Log.info('Queuing signal: %s', signal)
+
+            entry = self._push_transmission(priority, [signal])
+            if pending is not None:
+                entry[2] = pending[2]
+                self._tx_stats['queued'] -= 1
+
+            self._tx_pending[key] = entry
+
+        return pending is None
+
+    @classmethod
+    def _get_tx_key(cls, signal: Signal):
+        """
+        :return: Key identifying duplicate transmissions
+        """
+        return signal.get_port(), signal.get_code()
+
+    def fire_burst(self, signals, priority=PRIORITY_NORMAL):
+        """
+        Queue signals to be transmitted in order, one after another.
+        Repeated signals are not coalesced.
+
+        :param signals: A list of signals
+        :param priority: Transmission priority
+        """
+        self._start_transmitter()
+
+        with self._tx_condition:
+            Log.info('Queuing burst of %s signals', len(signals))
+            self._push_transmission(priority, list(signals))
+
+    def _push_transmission(self, priority, signals):
+        entry = [priority, next(self._tx_seq), time.time(), signals, False]
+        heapq.heappush(self._tx_queue, entry)
+
+        self._tx_depth += len(signals)
+        self._tx_stats['queued'] += len(signals)
+        self._tx_stats['max_depth'] = max(self._tx_stats['max_depth'], self._tx_depth)
+
+        self._tx_condition.notify()
+
+        return entry
+
+    def _start_transmitter(self):
+        with self._tx_condition:
+            if self._tx_started:
+                return
+
+            self._tx_started = True
+
+        threading.Thread(target=self._transmit_loop, name=self.get_code() + '-tx', daemon=True).start()
+
+    def _wait_free_channel(self):
+        """
+        Wait until the channel is free, must be called holding the transmitter condition.
+        Received signals also hold the channel, so the deadline is checked again on wake up.
+        """
+        while True:
+            now = time.time()
+            if self._free_channel_ts is None or self._free_channel_ts <= now:
+                return
+
+            self._tx_condition.wait(self._free_channel_ts - now)
+
+    def _next_transmission(self):
+        """
+        Wait for a queued transmission
+        :return: Queue time and signals to be transmitted
+        """
+        with self._tx_condition:
+            while True:
+                while len(self._tx_queue) > 0 and self._tx_queue[0][4]:
+                    heapq.heappop(self._tx_queue)
+
+                if len(self._tx_queue) > 0:
+                    break
+
+                self._tx_condition.wait()
+
+            # A higher priority signal queued while waiting for the channel goes first
+            self._wait_free_channel()
+            while self._tx_queue[0][4]:
+                heapq.heappop(self._tx_queue)
+
+            entry = heapq.heappop(self._tx_queue)
+            priority, seq, queued_ts, signals, cancelled = entry
+
+            for signal in signals:
+                if self._tx_pending.get(self._get_tx_key(signal)) is entry:
+                    del self._tx_pending[self._get_tx_key(signal)]
+
+            return queued_ts, signals
+
+    def _transmit_loop(self):
+        while True:
+            queued_ts, signals = self._next_transmission()
+
+            for signal in signals:
+                with self._tx_condition:
+                    self._wait_free_channel()
+                    self._delay_signal()
+
+                    wait = time.time() - queued_ts
+                    self._tx_depth -= 1
+                    self._tx_stats['wait_total'] += wait
+                    self._tx_stats['wait_max'] = max(self._tx_stats['wait_max'], wait)
+
+                Log.info('Firing signal: %s', signal)
+                try:
+                    self._fire(signal)
+                    ok = True
+                except Exception as e:
+                    Log.error('Firing signal %s failed: %s', signal, e)
+                    ok = False
+
+                with self._tx_condition:
+                    if ok:
+                        self._tx_stats['sent'] += 1
+                    else:
+                        self._tx_stats['failed'] += 1
 
     def _fire(self, signal: Signal):
         pass
 
     def start(self):
         Component.start(self)
+
+        recognition_distance = self.DEFAULT_RECOGNITION_DISTANCE
+        if 'recognition_distance' in self._params:
+            recognition_distance = self._params['recognition_distance']
+
+        recognition_timing_tolerance = SignalIndex.DEFAULT_TIMING_TOLERANCE
+        if 'recognition_timing_tolerance' in self._params:
+            recognition_timing_tolerance = self._params['recognition_timing_tolerance']
+
+        SignalRepo.configure_recognition(self.get_code(), recognition_distance, recognition_timing_tolerance)
         SignalRepo.lazy_load()
 
+        SettingsWatcher.register(SignalRepo.get_signals_file(), SignalRepo.reload)
+
 
 class Signal:
     _manager = None
@@ -163,8 +441,10 @@ class Signal:
     _sub_name = None
     _device_code = None
     _sub_code = None
+    _port = None
 
-    def __init__(self, manager, code, dump=None, device_name=None, sub_name=None, device_code=None, sub_code=None):
+    def __init__(self, manager, code, dump=None, device_name=None, sub_name=None, device_code=None, sub_code=None,
+                 port=None):
         self.set_manager(manager)
         self.set_code(code)
         self.set_dump(dump)
@@ -172,6 +452,7 @@ class Signal:
         self.set_device_code(device_code)
         self.set_sub_name(sub_name)
         self.set_sub_code(sub_code)
+        self.set_port(port)
 
     @classmethod
     def filter_code(cls, value):
@@ -202,6 +483,9 @@ class Signal:
     def set_dump(self, value):
         self._dump = value
 
+    def set_port(self, value):
+        self._port = value
+
     def get_manager_code(self):
         if self.get_manager() is None:
             return ''
@@ -235,6 +519,12 @@ class Signal:
     def get_dump(self):
         return self._dump
 
+    def get_port(self):
+        """
+        :return: Code of the port the signal is received from or transmitted to, None for single port managers
+        """
+        return self._port
+
     def to_dict(self):
         return {
             'manager': self.get_manager_code(),
@@ -244,10 +534,11 @@ class Signal:
             'device_name': self.get_device_name(),
             'sub_code': self.get_sub_code(),
             'sub_name': self.get_sub_name(),
+            'port': self.get_port(),
         }
 
-    def fire(self):
-        self.get_manager().fire(self)
+    def fire(self, priority=SignalManager.PRIORITY_NORMAL):
+        return self.get_manager().fire(self, priority)
 
     @classmethod
     def create_from_dict(cls, dict_info):
@@ -264,6 +555,7 @@ class Signal:
             device_name=dict_info['device_name'],
             sub_code=dict_info['sub_code'],
             sub_name=dict_info['sub_name'],
+            port=dict_info.get('port'),
         )
 
     def __eq__(self, other):
@@ -294,37 +586,118 @@ class Signal:
 
 
 class SignalRepo:
+    """
+    Signals are stored as a signals.yml snapshot plus an append-only journal of learned signals.
+    The journal is merged into the snapshot once it grows over JOURNAL_COMPACT_SIZE entries.
+    """
+    JOURNAL_COMPACT_SIZE = 100
+
     _signals = None
+    _journal_size = 0
+
+    # Lookup indexes, learning and firing happen on different threads
+    _by_signal = None
+    _by_code = None
+    _lock = threading.RLock()
+
+    # Similarity indexes and their settings, by manager code
+    _recognition = {}
+    _recognition_params = {}
 
     @classmethod
-    def _get_signals_file(cls):
+    def get_signals_file(cls):
         return App.get_settings_path() + '/signals.yml'
 
+    @classmethod
+    def _get_journal_file(cls):
+        return App.get_settings_path() + '/signals.journal'
+
     @classmethod
     def lazy_load(cls):
-        if cls._signals is None:
-            cls.load()
+        with cls._lock:
+            if cls._signals is None:
+                cls.load()
 
     @classmethod
-    def load(cls):
+    def _unindex(cls, signal: Signal):
         """
-        Load YML signals file
+        Remove a signal from collection and lookup indexes
+        :param signal: Signal to be removed
         """
+        # Signals compare equal when they share a radio code, so look for this very instance
+        for i, other in enumerate(cls._signals):
+            if other is signal:
+                del cls._signals[i]
+                break
+        del cls._by_code[(signal.get_device_code(), signal.get_sub_code())]
 
-        cls._signals = []
+        cls._get_recognition_index(signal.get_manager_code()).remove(signal)
 
-        signals_file = cls._get_signals_file()
-        try:
-            signals = yaml.load(open(signals_file, 'r'))
-            Log.info("Loading signals information from " + signals_file)
-        except:
-            Log.error("Loading signals information failed from " + signals_file)
-            return
+        signal_key = (signal.get_manager_code(), signal.get_code())
+        if cls._by_signal.get(signal_key) is signal:
+            del cls._by_signal[signal_key]
+
+            # Another device may share the same radio code
+            for other in cls._signals:
+                if (other.get_manager_code(), other.get_code()) == signal_key:
+                    cls._by_signal[signal_key] = other
+                    break
+
+    @classmethod
+    def _index(cls, signal: Signal):
+        """
+        Add a signal to collection and lookup indexes, replacing a signal with the same device and sub codes
+        :param signal: Signal to be added
+        """
+        code_key = (signal.get_device_code(), signal.get_sub_code())
+        if code_key in cls._by_code:
+            cls._unindex(cls._by_code[code_key])
+
+        cls._signals.append(signal)
+        cls._by_code[code_key] = signal
+        cls._by_signal.setdefault((signal.get_manager_code(), signal.get_code()), signal)
+        cls._get_recognition_index(signal.get_manager_code()).add(signal, signal.get_code(), signal.get_dump())
+
+    @classmethod
+    def _get_recognition_index(cls, manager_code) -> SignalIndex:
+        if manager_code not in cls._recognition:
+            if manager_code in cls._recognition_params:
+                cls._recognition[manager_code] = SignalIndex(*cls._recognition_params[manager_code])
+            else:
+                cls._recognition[manager_code] = SignalIndex(SignalManager.DEFAULT_RECOGNITION_DISTANCE)
+
+        return cls._recognition[manager_code]
+
+    @classmethod
+    def configure_recognition(cls, manager_code, max_distance, timing_tolerance):
+        """
+        Set similarity tolerances for signals of a manager
+        :param manager_code: Signal manager code
+        :param max_distance: Max different code bits
+        :param timing_tolerance: Max average relative drift of pulse durations
+        """
+        with cls._lock:
+            cls._recognition_params[manager_code] = (max_distance, timing_tolerance)
+            cls._recognition.pop(manager_code, None)
 
+            if cls._signals is not None:
+                index = cls._get_recognition_index(manager_code)
+                for signal in cls._signals:
+                    if signal.get_manager_code() == manager_code:
+                        index.add(signal, signal.get_code(), signal.get_dump())
+
+    @classmethod
+    def _parse_yaml(cls, signals):
+        """
+        Create signals from their YML representation
+        :param signals: Parsed YML signals
+        :return: A list of signals
+        """
+        res = []
         if signals is not None:
             for device_code, device_info in signals.items():
                 for sub_code, sub_info in device_info['subs'].items():
-                    signal = Signal(
+                    res.append(Signal(
                         manager=App.components.get(sub_info['manager']),
                         code=sub_info['code'],
                         dump=sub_info['dump'],
@@ -332,9 +705,110 @@ class SignalRepo:
                         device_name=device_info['name'],
                         sub_code=sub_code,
                         sub_name=sub_info['name'],
-                    )
+                        port=sub_info.get('port'),
+                    ))
+
+        return res
+
+    @classmethod
+    def _read_signals_file(cls):
+        signals_file = cls.get_signals_file()
+        try:
+            signals = Settings.load(signals_file)
+            Log.info("Loading signals information from " + signals_file)
+        except:
+            Log.error("Loading signals information failed from " + signals_file)
+            signals = None
+
+        return cls._parse_yaml(signals)
+
+    @classmethod
+    def _read_journal(cls):
+        """
+        Read signals learned since last compaction
+        :return: A list of signals and False if the journal contains corrupted entries
+        """
+        res = []
+        valid = True
+
+        journal_file = cls._get_journal_file()
+        try:
+            f = open(journal_file, 'r')
+        except FileNotFoundError:
+            return res, valid
+
+        with f:
+            for line in f:
+                try:
+                    signal_info = json.loads(line)
+                except ValueError:
+                    # Partial line left by an interrupted write
+                    Log.error("Skipping corrupted entry in " + journal_file)
+                    valid = False
+                    continue
+
+                signal_info['manager'] = App.components.get(signal_info['manager'])
+                res.append(Signal.create_from_dict(signal_info))
+
+        Log.info("Replayed %s signals from %s", len(res), journal_file)
+        return res, valid
+
+    @classmethod
+    def load(cls):
+        """
+        Load YML signals file and journal
+        """
+
+        with cls._lock:
+            cls._signals = []
+            cls._by_signal = {}
+            cls._by_code = {}
+            cls._recognition = {}
+
+            for signal in cls._read_signals_file():
+                cls._index(signal)
 
-                    cls._signals.append(signal)
+            journal, valid = cls._read_journal()
+            for signal in journal:
+                cls._index(signal)
+
+            cls._journal_size = len(journal)
+
+            # New entries must not be appended after a corrupted one
+            if not valid:
+                cls.compact()
+
+    @classmethod
+    def reload(cls):
+        """
+        Apply changes made to signals files, only added, modified or removed signals are touched
+        """
+
+        with cls._lock:
+            if cls._signals is None:
+                return cls.load()
+
+            signals = {}
+            journal, valid = cls._read_journal()
+            for signal in cls._read_signals_file() + journal:
+                signals[(signal.get_device_code(), signal.get_sub_code())] = signal
+
+            changed = 0
+            for code_key, signal in signals.items():
+                current = cls._by_code.get(code_key)
+                if current is None or current.to_dict() != signal.to_dict():
+                    cls._index(signal)
+                    changed += 1
+
+            removed = [s for code_key, s in cls._by_code.items() if code_key not in signals]
+            for signal in removed:
+                cls._unindex(signal)
+
+            cls._journal_size = len(journal)
+            Log.info("Signals reloaded: %s changed, %s removed", changed, len(removed))
+
+            if not valid:
+                cls.compact()
 
     @classmethod
     def get_by_code(cls, device_code, sub_code) -> Signal:
@@ -350,11 +824,23 @@ class SignalRepo:
         sub_code = Signal.filter_code(sub_code)
 
         cls.lazy_load()
-        for s in cls._signals:
-            if s.get_device_code() == device_code and s.get_sub_code() == sub_code:
-                return s
+        with cls._lock:
+            return cls._by_code.get((device_code, sub_code))
 
-        return None
+    @classmethod
+    def get_by_codes(cls, codes):
+        """
+        Return signals from repo identified by a list of device and sub codes
+
+        :param codes: A list of (device code, sub code) tuples
+        :return: A list of signals, None for unknown codes
+        """
+
+        keys = [(Signal.filter_code(device_code), Signal.filter_code(sub_code)) for device_code, sub_code in codes]
+
+        cls.lazy_load()
+        with cls._lock:
+            return [cls._by_code.get(key) for key in keys]
 
     @classmethod
     def get_by_signal(cls, signal: Signal) -> Signal:
@@ -366,11 +852,31 @@ class SignalRepo:
         """
 
         cls.lazy_load()
-        for s in cls._signals:
-            if s == signal:
-                return s
+        with cls._lock:
+            return cls._by_signal.get((signal.get_manager_code(), signal.get_code()))
 
-        return None
+    @classmethod
+    def recognize(cls, signal: Signal):
+        """
+        Return the repo signal matching a received one, allowing drifts within manager tolerances
+
+        :param signal: Received signal
+        :return: A (signal, confidence) tuple, (None, 0) if not recognized
+        """
+
+        cls.lazy_load()
+        with cls._lock:
+            index = cls._get_recognition_index(signal.get_manager_code())
+
+            exact = cls._by_signal.get((signal.get_manager_code(), signal.get_code()))
+            if exact is not None:
+                confidence = index.score(exact, signal.get_code(), signal.get_dump())
+                if confidence is None:
+                    confidence = 1.0
+
+                return exact, confidence
+
+            return index.lookup(signal.get_code(), signal.get_dump())
 
     @classmethod
     def get_by_dict(cls, dict_repr) -> Signal:
@@ -391,55 +897,139 @@ class SignalRepo:
         :param signal: Signal to be added
         """
 
-        cls.load()
-        cls._signals.append(signal)
-        cls._save()
+        with cls._lock:
+            cls.lazy_load()
+            cls._index(signal)
+
+            with open(cls._get_journal_file(), 'a') as f:
+                f.write(json.dumps(signal.to_dict()) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            cls._journal_size += 1
+            if cls._journal_size >= cls.JOURNAL_COMPACT_SIZE:
+                cls.compact()
 
     @classmethod
-    def _save(cls):
+    def compact(cls):
         """
-        Save signals configuration to YML file
+        Merge journal into signals.yml
         """
-        signals_file = cls._get_signals_file()
+        with cls._lock:
+            cls.lazy_load()
+
+            # A crash before truncating the journal only replays signals already saved
+            cls.export_yaml(cls.get_signals_file())
+            open(cls._get_journal_file(), 'w').close()
+            cls._journal_size = 0
+
+            Log.info("Compacted %s signals", len(cls._signals))
 
+    @classmethod
+    def export_yaml(cls, file_name):
+        """
+        Save signals configuration to YML file
+        :param file_name: Destination file
+        """
         signals_yaml = {}
-        for signal in cls._signals:
-            device_code = signal.get_device_code()
-            sub_code = signal.get_sub_code()
 
-            if device_code not in signals_yaml:
-                signals_yaml[device_code] = {
-                    'name': signal.get_device_name(),
-                    'subs': {}
-                }
+        with cls._lock:
+            cls.lazy_load()
+
+            for signal in cls._signals:
+                device_code = signal.get_device_code()
+                sub_code = signal.get_sub_code()
+
+                if device_code not in signals_yaml:
+                    signals_yaml[device_code] = {
+                        'name': signal.get_device_name(),
+                        'subs': {}
+                    }
+
+                if sub_code not in signals_yaml[device_code]['subs']:
+                    signals_yaml[device_code]['subs'][sub_code] = {
+                        'name': signal.get_sub_name(),
+                    }
 
-            if sub_code not in signals_yaml[device_code]['subs']:
-                signals_yaml[device_code]['subs'][sub_code] = {
-                    'name': signal.get_sub_name(),
-                }
+                signals_yaml[device_code]['subs'][sub_code]['manager'] = signal.get_manager_code()
+                signals_yaml[device_code]['subs'][sub_code]['code'] = signal.get_code()
+                signals_yaml[device_code]['subs'][sub_code]['dump'] = signal.get_dump()
 
-            signals_yaml[device_code]['subs'][sub_code]['manager'] = signal.get_manager_code()
-            signals_yaml[device_code]['subs'][sub_code]['code'] = signal.get_code()
-            signals_yaml[device_code]['subs'][sub_code]['dump'] = signal.get_dump()
+                if signal.get_port() is not None:
+                    signals_yaml[device_code]['subs'][sub_code]['port'] = signal.get_port()
 
-        yaml.dump(signals_yaml, open(signals_file, 'w'), default_flow_style=False)
+        Settings.save(file_name, signals_yaml)
+
+    @classmethod
+    def import_yaml(cls, file_name):
+        """
+        Add signals from a YML file, replacing signals with the same device and sub codes
+        :param file_name: Source file
+        :return: Number of imported signals
+        """
+        signals = Settings.load(file_name)
+
+        with cls._lock:
+            cls.lazy_load()
+            imported = cls._parse_yaml(signals)
+            for signal in imported:
+                cls._index(signal)
+
+            cls.compact()
+
+        return len(imported)
 
 
 class SignalManagerTTY(SignalManager):
+    """
+    Signal manager reading a serial adapter.
+    Received lines can be recorded to a capture file ("capture" param), and a capture can be
+    replayed instead of opening the serial port ("replay" param).
+    """
     _serial = None
     _tty_port = None
+    _line_buffer = None
+    _capture = None
 
     SELECT_TIMEOUT = 60000
+    READ_SIZE = 4096
+
+    DEFAULT_CAPTURE_SIZE = 1048576
+    DEFAULT_CAPTURE_SEGMENTS = 2
+    DEFAULT_REPLAY_SPEED = 1
 
-    def _parse_cli_message(self, message):
+    def _parse_cli_message(self, message, now=None):
         """
         Parse an incoming CLI message. Method to be overridden
 
         :param message: message line
+        :param now: Reception timestamp, current time if None
         """
         pass
 
+    def _on_data(self, data):
+        """
+        Parse received bytes, lines may span several reads
+        :param data: Received bytes
+        """
+        for message in self._line_buffer.feed(data):
+            if self._capture is not None:
+                self._capture.write(time.time(), message)
+
+            self._parse_cli_message(message)
+
+    def _get_capture_file(self, param):
+        file_name = self._params[param]
+        if not os.path.isabs(file_name):
+            file_name = App.get_sys_path() + '/' + file_name
+
+        return file_name
+
     def _send(self, message):
+        if self._serial is None:
+            Log.warn('Serial port not available, dropping message: %s', message)
+            return
+
         self._serial.write(bytes(message + "\n", 'utf-8'))
 
     def send(self, message):
@@ -449,22 +1039,455 @@ class SignalManagerTTY(SignalManager):
         """
         self._send(message)
 
+    def replay(self, file_name, speed=DEFAULT_REPLAY_SPEED):
+        """
+        Feed a capture to the parser, with recorded timestamps
+        :param file_name: Capture file
+        :param speed: Speed factor, 0 to replay at max speed
+        :return: Number of replayed lines
+        """
+        Log.info('Replaying capture %s at %sx', file_name, speed)
+
+        n = CaptureReader(file_name).replay(self._parse_cli_message, float(speed))
+
+        Log.info('Replayed %s lines from %s', n, file_name)
+        return n
+
     def start(self):
         SignalManager.start(self)
 
+        if 'replay' in self._params:
+            speed = self.DEFAULT_REPLAY_SPEED
+            if 'replay_speed' in self._params:
+                speed = self._params['replay_speed']
+
+            self.replay(self._get_capture_file('replay'), speed)
+            return
+
+        if 'capture' in self._params:
+            capture_size = self.DEFAULT_CAPTURE_SIZE
+            if 'capture_size' in self._params:
+                capture_size = self._params['capture_size']
+
+            capture_segments = self.DEFAULT_CAPTURE_SEGMENTS
+            if 'capture_segments' in self._params:
+                capture_segments = self._params['capture_segments']
+
+            self._capture = CaptureWriter(self._get_capture_file('capture'), capture_size, capture_segments)
+
         self._serial = serial.Serial(self._params['serial'], self._params['baud'])
 
         # Flush garbage
         while self._serial.inWaiting():
             self._serial.read(self._serial.inWaiting())
 
+        # Line noise must not break the reader
+        self._line_buffer = LineBuffer(errors='replace')
+
+        fd = self._serial.fileno()
         while True:
-            ready, _, _ = select.select([self._serial.fileno()], [], [], self.SELECT_TIMEOUT)
+            ready, _, _ = select.select([fd], [], [], self.SELECT_TIMEOUT)
 
             if ready:
-                while self._serial.inWaiting() > 0:
-                    message = self._serial.readline().strip().decode('utf-8')
-                    message = re.sub(r'[\n\r]+', '', message)
+                try:
+                    data = os.read(fd, self.READ_SIZE)
+                except BlockingIOError:
+                    continue
+
+                self._on_data(data)
+
+
+class SignalPort:
+    """
+    Serial link of a multi-port signal manager.
+    Ports are read by the manager loop thread only, while transmissions come from the transmitter thread.
+    """
+    READ_SIZE = 4096
+
+    line_buffer = None
+
+    _code = None
+    _params = None
+    _lock = None
+    _connected = False
+    _stats = None
+
+    def __init__(self, code, params):
+        self._code = code
+        self._params = params
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'connected': False,
+            'connections': 0,
+            'errors': 0,
+            'lines': 0,
+            'sent': 0,
+        }
+
+    @classmethod
+    def create(cls, code, params):
+        """
+        Create a port from its settings
+        :param code: Port code
+        :param params: A dict with "serial" and "baud" for local adapters, "host" and "port" for TCP bridges
+        :return: New port
+        """
+        if 'serial' in params:
+            return SerialSignalPort(code, params)
+
+        if 'host' in params:
+            return TCPSignalPort(code, params)
+
+        raise Exception('Signal port ' + code + ' needs a serial device or a TCP host')
+
+    def get_code(self):
+        return self._code
+
+    def get_params(self):
+        return self._params
+
+    def is_connected(self):
+        return self._connected
+
+    def get_fileobj(self):
+        """
+        :return: Object to be registered in the manager selector
+        """
+        pass
+
+    def get_events(self):
+        """
+        :return: Selector events the port is waiting for
+        """
+        return selectors.EVENT_READ
+
+    def _open(self):
+        """
+        Open the link. Method to be overridden
+        :return: False if the connection is still in progress
+        """
+        return True
+
+    def _read(self):
+        pass
+
+    def _write(self, data):
+        pass
+
+    def _close(self):
+        pass
+
+    def _on_connected(self):
+        self.line_buffer = LineBuffer(errors='replace')
+
+        with self._lock:
+            self._connected = True
+            self._stats['connected'] = True
+            self._stats['connections'] += 1
+
+        Log.info('Signal port %s connected', self.get_code())
+
+    def connect(self):
+        """
+        Open the link
+        :return: False if the connection is still in progress
+        """
+        if not self._open():
+            return False
+
+        self._on_connected()
+        return True
+
+    def finish_connect(self):
+        """
+        Complete a connection in progress, raises an exception on failure
+        """
+        self._on_connected()
+
+    def read(self):
+        """
+        Read available bytes, raises an exception when the link is lost
+        :return: Received bytes
+        """
+        data = self._read()
+
+        with self._lock:
+            self._stats['lines'] += data.count(b'\n')
+
+        return data
+
+    def write(self, message):
+        """
+        Send a line
+        :param message: Line to be sent
+        """
+        with self._lock:
+            if not self._connected:
+                raise IOError('Signal port ' + self.get_code() + ' is not connected')
+
+            self._write(bytes(message + "\n", 'utf-8'))
+            self._stats['sent'] += 1
+
+    def close(self, error=False):
+        """
+        Close the link
+        :param error: True if closed because of a failure
+        """
+        with self._lock:
+            self._connected = False
+            self._stats['connected'] = False
+
+            if error:
+                self._stats['errors'] += 1
+
+            try:
+                self._close()
+            except Exception:
+                pass
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
 
-                    if len(message) > 0:
-                        self._parse_cli_message(message)
+
+class SerialSignalPort(SignalPort):
+    """
+    Local serial adapter
+    """
+    DEFAULT_BAUD = 115200
+
+    _serial = None
+
+    def get_fileobj(self):
+        return self._serial.fileno()
+
+    def _open(self):
+        baud = self.DEFAULT_BAUD
+        if 'baud' in self._params:
+            baud = self._params['baud']
+
+        self._serial = serial.Serial(self._params['serial'], baud)
+
+        # Flush garbage
+        while self._serial.inWaiting():
+            self._serial.read(self._serial.inWaiting())
+
+        return True
+
+    def _read(self):
+        data = os.read(self._serial.fileno(), self.READ_SIZE)
+        if data == b'':
+            raise IOError('Serial device closed')
+
+        return data
+
+    def _write(self, data):
+        self._serial.write(data)
+
+    def _close(self):
+        self._serial.close()
+
+
+class TCPSignalPort(SignalPort):
+    """
+    Serial adapter exposed by a TCP bridge (ser2net, ESP boards...).
+    Connections are not blocking, so an unreachable bridge does not stall other ports.
+    """
+    SEND_TIMEOUT = 5
+
+    _sock = None
+    _connecting = False
+
+    def get_fileobj(self):
+        return self._sock
+
+    def get_events(self):
+        if self._connecting:
+            return selectors.EVENT_WRITE
+
+        return selectors.EVENT_READ
+
+    def _open(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock.setblocking(False)
+
+        error = self._sock.connect_ex((self._params['host'], int(self._params['port'])))
+        if error not in (0, errno.EINPROGRESS):
+            self._sock.close()
+            raise ConnectionError(os.strerror(error))
+
+        self._connecting = error != 0
+        if self._connecting:
+            return False
+
+        self._sock.settimeout(self.SEND_TIMEOUT)
+        return True
+
+    def finish_connect(self):
+        self._connecting = False
+
+        error = self._sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error != 0:
+            raise ConnectionError(os.strerror(error))
+
+        # Reads only happen when data is available, the timeout bounds transmissions
+        self._sock.settimeout(self.SEND_TIMEOUT)
+        SignalPort.finish_connect(self)
+
+    def _read(self):
+        data = self._sock.recv(self.READ_SIZE)
+        if data == b'':
+            raise ConnectionError('Connection closed by bridge')
+
+        return data
+
+    def _write(self, data):
+        self._sock.sendall(data)
+
+    def _close(self):
+        self._connecting = False
+        self._sock.close()
+
+
+class SignalManagerMultiTTY(SignalManager):
+    """
+    Signal manager reading several serial adapters, local or behind TCP bridges, from a single selector thread.
+    Ports are configured in the "ports" param. Received signals are tagged with their port code
+    and transmitted through the port they were learned from, or through "default_port".
+    """
+    DEFAULT_RECONNECT_INTERVAL = 10
+
+    _ports = None
+    _selector = None
+    _reconnect_ts = None
+
+    def _get_ports(self):
+        if self._ports is None:
+            self._ports = collections.OrderedDict()
+
+            for port_code, port_params in self._params['ports'].items():
+                self._ports[port_code] = SignalPort.create(port_code, port_params)
+
+        return self._ports
+
+    def get_port(self, port_code) -> SignalPort:
+        return self._get_ports().get(port_code)
+
+    def get_default_port(self) -> SignalPort:
+        if 'default_port' in self._params:
+            return self.get_port(self._params['default_port'])
+
+        for port in self._get_ports().values():
+            return port
+
+        return None
+
+    def get_stats(self):
+        stats = SignalManager.get_stats(self)
+        stats['ports'] = {port_code: port.get_stats() for port_code, port in self._get_ports().items()}
+
+        return stats
+
+    def _parse_cli_message(self, port: SignalPort, message, now=None):
+        """
+        Parse an incoming CLI message. Method to be overridden
+
+        :param port: Source port
+        :param message: message line
+        :param now: Reception timestamp, current time if None
+        """
+        pass
+
+    def _on_data(self, port: SignalPort, data):
+        for message in port.line_buffer.feed(data):
+            self._parse_cli_message(port, message)
+
+    def send(self, message, port_code=None):
+        """
+        Send a TTY message
+        :param message: message to be sent
+        :param port_code: Destination port, default port if None or unknown
+        """
+        port = self.get_port(port_code)
+        if port is None:
+            port = self.get_default_port()
+
+        if port is None:
+            raise IOError('No signal port available for ' + str(port_code))
+
+        port.write(message)
+
+    def _connect(self, port: SignalPort):
+        try:
+            connected = port.connect()
+        except Exception as e:
+            Log.error('Signal port %s connection failed: %s', port.get_code(), e)
+            self._schedule_reconnect(port)
+            return
+
+        self._selector.register(port.get_fileobj(), port.get_events(), port)
+
+        if not connected:
+            Log.info('Signal port %s connecting', port.get_code())
+
+    def _disconnect(self, port: SignalPort, error):
+        Log.error('Signal port %s disconnected: %s', port.get_code(), error)
+
+        self._selector.unregister(port.get_fileobj())
+        port.close(True)
+        self._schedule_reconnect(port)
+
+    def _schedule_reconnect(self, port: SignalPort):
+        reconnect_interval = self.DEFAULT_RECONNECT_INTERVAL
+        if 'reconnect_interval' in self._params:
+            reconnect_interval = self._params['reconnect_interval']
+
+        self._reconnect_ts[port.get_code()] = time.time() + float(reconnect_interval)
+
+    def _on_ready(self, port: SignalPort):
+        if not port.is_connected():
+            try:
+                port.finish_connect()
+            except Exception as e:
+                self._disconnect(port, e)
+                return
+
+            self._selector.modify(port.get_fileobj(), port.get_events(), port)
+            return
+
+        try:
+            data = port.read()
+        except (BlockingIOError, InterruptedError):
+            return
+        except Exception as e:
+            self._disconnect(port, e)
+            return
+
+        self._on_data(port, data)
+
+    def _get_select_timeout(self):
+        if len(self._reconnect_ts) == 0:
+            return None
+
+        return max(0, min(self._reconnect_ts.values()) - time.time())
+
+    def start(self):
+        SignalManager.start(self)
+
+        self._selector = selectors.DefaultSelector()
+        self._reconnect_ts = {}
+
+        for port in self._get_ports().values():
+            self._connect(port)
+
+        while True:
+            for key, events in self._selector.select(self._get_select_timeout()):
+                self._on_ready(key.data)
+
+            now = time.time()
+            for port_code, reconnect_ts in list(self._reconnect_ts.items()):
+                if reconnect_ts <= now:
+                    del self._reconnect_ts[port_code]
+                    self._connect(self.get_port(port_code))
@@ -0,0 +1,222 @@
+import collections
+import itertools
+import re
+import threading
+
+
+class LineBuffer:
+    """
+    Split a stream of bytes received in chunks into text lines
+    """
+    DEFAULT_MAX_LINE_SIZE = 1048576
+
+    # Both LF and bare CR end a line, CRLF yields an empty line which is skipped
+    EOL_PATTERN = re.compile(b'[\r\n]')
+
+    _buffer = None
+    _encoding = None
+    _errors = None
+    _max_line_size = None
+    _skipping = False
+    _dropped_lines = 0
+
+    def __init__(self, encoding='utf-8', errors='strict', max_line_size=DEFAULT_MAX_LINE_SIZE):
+        """
+        :param encoding: Lines encoding
+        :param errors: Decoding errors handling
+        :param max_line_size: Longer lines are discarded, None for no limit
+        """
+        self._buffer = bytearray()
+        self._encoding = encoding
+        self._errors = errors
+        self._max_line_size = max_line_size
+
+    def feed(self, data):
+        """
+        Add received bytes and return complete lines.
+        Lines are decoded only once complete, so multibyte characters split across chunks are preserved.
+        Lines end on LF or CR, lines longer than max_line_size are discarded up to their end, see get_dropped_lines.
+
+        :param data: Received bytes
+        :return: A list of stripped non empty lines
+        """
+        self._buffer += data
+
+        lines = []
+        start = 0
+        while True:
+            match = self.EOL_PATTERN.search(self._buffer, start)
+            if match is None:
+                break
+
+            end = match.start()
+
+            if self._skipping:
+                # Tail of an oversized line already counted
+                self._skipping = False
+            elif self._max_line_size is not None and end - start > self._max_line_size:
+                self._dropped_lines += 1
+            else:
+                line = self._buffer[start:end].decode(self._encoding, self._errors).strip()
+                if len(line) > 0:
+                    lines.append(line)
+
+            start = end + 1
+
+        if start > 0:
+            del self._buffer[:start]
+
+        # Never hold more than one line worth of bytes while the peer sends no newline
+        if self._max_line_size is not None and len(self._buffer) > self._max_line_size:
+            if not self._skipping:
+                self._dropped_lines += 1
+                self._skipping = True
+            del self._buffer[:]
+
+        return lines
+
+    def get_pending_size(self):
+        return len(self._buffer)
+
+    def get_dropped_lines(self):
+        """
+        :return: Number of oversized lines discarded so far
+        """
+        return self._dropped_lines
+
+
+class EventRing:
+    """
+    Bounded buffer of sequenced items shared by many readers.
+    Every item is stored once, readers only keep track of the last sequence number they have seen.
+    """
+    _items = None
+    _seq = 0
+    _condition = None
+
+    def __init__(self, size=1000):
+        self._items = collections.deque(maxlen=int(size))
+        self._condition = threading.Condition()
+
+    def append(self, item):
+        """
+        Add an item and wake up waiting readers
+        :param item: Item to be stored
+        :return: Item sequence number
+        """
+        with self._condition:
+            self._seq += 1
+            self._items.append((self._seq, item))
+            self._condition.notify_all()
+
+            return self._seq
+
+    def get_seq(self):
+        return self._seq
+
+    def get_first_seq(self):
+        """
+        :return: Oldest sequence number still in buffer
+        """
+        with self._condition:
+            return self._seq - len(self._items) + 1
+
+    def read(self, since, timeout=None):
+        """
+        Get items newer than a sequence number, waiting for them if none is available.
+        Items evicted from the buffer are silently skipped.
+
+        :param since: Last sequence number seen by reader
+        :param timeout: Max seconds to wait, None to wait forever
+        :return: A list of (seq, item) tuples, empty on timeout
+        """
+        with self._condition:
+            # Reader coming from a previous run, replay everything available
+            if since > self._seq:
+                since = 0
+
+            if not self._condition.wait_for(lambda: self._seq > since, timeout):
+                return []
+
+            # Sequence numbers are contiguous, so the first wanted item position is known
+            start = max(0, len(self._items) - (self._seq - since))
+            return list(itertools.islice(self._items, start, None))
+
+    def wait(self, since, timeout=None, interrupt=None):
+        """
+        Wait for items newer than a sequence number, without reading them
+        :param since: Last sequence number seen by reader
+        :param timeout: Max seconds to wait, None to wait forever
+        :param interrupt: Function ending the wait when it returns True, checked when notified
+        :return: True if newer items are available
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._seq > since or (interrupt is not None and interrupt()), timeout)
+
+            return self._seq > since
+
+    def notify(self):
+        """
+        Wake up waiting readers without adding an item
+        """
+        with self._condition:
+            self._condition.notify_all()
+
+    def get_stats(self):
+        with self._condition:
+            return {
+                'seq': self._seq,
+                'size': len(self._items),
+                'capacity': self._items.maxlen,
+            }
+
+
+class FrameBuffer:
+    """
+    Latest frame slot written by a single producer and shared by many readers.
+    Frames are never queued, readers only get the newest one and wait on its sequence number.
+    """
+    _frame = None
+    _ts = None
+    _seq = 0
+    _condition = None
+
+    def __init__(self):
+        self._condition = threading.Condition()
+
+    def put(self, frame, ts):
+        """
+        Replace current frame and wake up waiting readers
+        :param frame: New frame
+        :param ts: Capture timestamp
+        :return: Frame sequence number
+        """
+        with self._condition:
+            self._seq += 1
+            self._frame = frame
+            self._ts = ts
+            self._condition.notify_all()
+
+            return self._seq
+
+    def get(self):
+        """
+        :return: A (seq, timestamp, frame) tuple, frame is None if nothing was captured yet
+        """
+        with self._condition:
+            return self._seq, self._ts, self._frame
+
+    def wait(self, since, timeout=None):
+        """
+        Get the current frame, waiting for a frame newer than a sequence number
+        :param since: Last sequence number seen by reader
+        :param timeout: Max seconds to wait, None to wait forever
+        :return: A (seq, timestamp, frame) tuple, seq is not greater than since on timeout
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > since, timeout)
+            return self._seq, self._ts, self._frame
+
+    def get_seq(self):
+        return self._seq
@@ -1,73 +1,208 @@
+import collections
 import copy
+import functools
+import operator
+import os
 import re
 
 from survy.core.app import App
 
 
+class Template:
+    """
+    Compiled %variable% text template
+    """
+    VARIABLE_PATTERN = re.compile(r'%([\w\-_]+?)%')
+
+    _text = None
+    _segments = None
+
+    def __init__(self, text):
+        self._text = text
+
+        # Split result alternates literals and variable names
+        segments = []
+        parts = self.VARIABLE_PATTERN.split(text)
+        for i in range(0, len(parts)):
+            if i % 2:
+                segments.append((None, parts[i]))
+            elif parts[i] != '':
+                segments.append((parts[i], None))
+
+        self._segments = segments
+
+    @classmethod
+    @functools.lru_cache(maxsize=512)
+    def compile(cls, text):
+        """
+        Return a cached compiled template
+        :param text: Template text
+        :return: Compiled template
+        """
+        return Template(text)
+
+    def is_static(self):
+        return len([s for s in self._segments if s[0] is None]) == 0
+
+    def render(self, params):
+        """
+        Render template, unknown variables are left untouched
+        :param params: A dict of variables
+        :return: Rendered text
+        """
+        out = []
+        for literal, variable in self._segments:
+            if variable is None:
+                out.append(literal)
+            elif variable in params:
+                out.append(str(params[variable]))
+            else:
+                out.append('%' + variable + '%')
+
+        return ''.join(out)
+
+
+class PayloadTemplate:
+    """
+    Compiled payload template, strings are rendered at any nesting level of dicts and lists
+    """
+    _render = None
+
+    def __init__(self, payload):
+        self._render = self._compile(payload)
+
+    @classmethod
+    def _compile(cls, value):
+        if isinstance(value, str):
+            template = Template.compile(value)
+            if template.is_static():
+                return lambda params: value
+
+            return template.render
+
+        if isinstance(value, dict):
+            items = [(k, cls._compile(v)) for k, v in value.items()]
+            return lambda params: {k: render(params) for k, render in items}
+
+        if isinstance(value, list):
+            renders = [cls._compile(v) for v in value]
+            return lambda params: [render(params) for render in renders]
+
+        if value is None or isinstance(value, (int, float, bool)):
+            return lambda params: value
+
+        return lambda params: copy.deepcopy(value)
+
+    def render(self, params):
+        """
+        Render a new payload
+        :param params: A dict of variables
+        :return: Rendered payload
+        """
+        return self._render(params)
+
+
 class Utils:
+    VARIABLE_PATTERN = Template.VARIABLE_PATTERN
+
     @classmethod
-    def replace_variables_text(cls, format_text, params, add_global=True):
-        if params is None:
-            params = {}
+    def has_variables(cls, value):
+        """
+        Return true if value contains a variable placeholder
+        :param value: A string, a list or a dict
+        :return:
+        """
+        if isinstance(value, dict):
+            value = list(value.values())
 
-        if add_global:
-            p = copy.deepcopy(params)
-            params = copy.deepcopy(App.get_variables())
-            params.update(p)
+        if isinstance(value, list):
+            for v in value:
+                if cls.has_variables(v):
+                    return True
 
-        for k, v in params.items():
-            format_text = format_text.replace('%' + k + '%', v)
+            return False
 
-        return format_text
+        return isinstance(value, str) and cls.VARIABLE_PATTERN.search(value) is not None
 
     @classmethod
-    def replace_variables_dict(cls, format_dict, params=None, add_global=True):
+    def get_variables_params(cls, params=None, add_global=True):
+        """
+        Return substitution parameters, optionally layered over global variables
+        :param params: A dict of local variables
+        :param add_global: Add global variables
+        :return: A dict like object of variables
+        """
         if params is None:
             params = {}
 
         if add_global:
-            p = copy.deepcopy(params)
-            params = copy.deepcopy(App.get_variables())
-            params.update(p)
+            params = collections.ChainMap(params, App.get_variables())
 
-        out = copy.deepcopy(format_dict)
-        for key, value in format_dict.items():
-            if isinstance(value, list):
-                for i in range(0, len(value)):
-                    if isinstance(value[i], str):
-                        variables = re.findall(r'%([\w\-_]+?)%', value[i])
+        return params
 
-                        for variable in variables:
-                            if variable in params:
-                                out[key][i] = out[key][i].replace('%' + variable + '%', params[variable])
+    @classmethod
+    def replace_variables_text(cls, format_text, params, add_global=True):
+        params = cls.get_variables_params(params, add_global)
 
-            else:
-                if isinstance(value, str):
-                    variables = re.findall(r'%([\w\-_]+?)%', value)
+        return Template.compile(format_text).render(params)
 
-                    for variable in variables:
-                        if variable in params:
-                            out[key] = out[key].replace('%' + variable + '%', params[variable])
+    @classmethod
+    def replace_variables_dict(cls, format_dict, params=None, add_global=True):
+        params = cls.get_variables_params(params, add_global)
 
-        return out
+        return PayloadTemplate(format_dict).render(params)
 
     @classmethod
-    def complex_match(cls, check_type, check_value, value):
+    def write_file_atomic(cls, file_name, content):
         """
-        Perform a complex match and return a dict of objects for regex or False on failure
-        :param check_type:
-        :param check_value:
-        :param value:
-        :return:
+        Write a file through a temporary file and a rename, so readers never see a partial file
+        :param file_name: Destination file
+        :param content: Text content
         """
-        if isinstance(check_value, list):
+        tmp_file_name = file_name + '.tmp'
+        with open(tmp_file_name, 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_file_name, file_name)
+
+    @classmethod
+    def _compile_int_match(cls, compare, check_value):
+        try:
+            int_check_value = int(check_value)
+        except (TypeError, ValueError):
+            # Fail at evaluation time, as an uncompiled match would
+            return lambda value: compare(int(value), int(check_value))
+
+        return lambda value: compare(int(value), int_check_value)
+
+    @classmethod
+    def _compile_regex_match(cls, check_value, flags=0):
+        try:
+            regex = re.compile(check_value, flags=flags)
+        except (TypeError, re.error):
+            # Fail at evaluation time, as an uncompiled match would
+            regex = None
+
+        def match(value):
+            if regex is None:
+                m = re.search(check_value, str(value), flags=flags)
+            else:
+                m = regex.search(str(value))
+
+            if not m:
+                return False
+            return m.groupdict()
+
+        return match
+
+    @classmethod
+    def _compile_list_match(cls, matchers):
+        def match(value):
             out = {}
-            for cv in check_value:
-                res = cls.complex_match(
-                    check_type=check_type,
-                    check_value=cv,
-                    value=value
-                )
+            for matcher in matchers:
+                res = matcher(value)
 
                 if res is False:
                     return False
@@ -77,44 +212,97 @@ class Utils:
 
             return out
 
+        return match
+
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def _compile_match_cached(cls, check_type, typed_value, is_list):
+        # Values come as (type, value) pairs, 1, 1.0 and True are equal keys but render differently
+        if is_list:
+            return cls._compile_list_match([
+                cls._compile_match_cached(check_type, tv, False) for tv in typed_value
+            ])
+
+        return cls._compile_match(check_type, typed_value[1])
+
+    @classmethod
+    def _compile_match(cls, check_type, check_value):
+        if isinstance(check_value, list):
+            return cls._compile_list_match([cls.compile_match(check_type, cv) for cv in check_value])
+
         if check_type == 'contains':
-            return value in check_value
+            return lambda value: value in check_value
 
         if check_type == 'icontains':
-            return value.lower() in check_value.lower()
+            if not isinstance(check_value, str):
+                return lambda value: value.lower() in check_value.lower()
+
+            lower_check_value = check_value.lower()
+            return lambda value: value.lower() in lower_check_value
 
         if check_type == 'eq':
-            return str(value) == str(check_value)
+            str_check_value = str(check_value)
+            return lambda value: str(value) == str_check_value
 
         if check_type == 'neq':
-            return str(value) != str(check_value)
+            str_check_value = str(check_value)
+            return lambda value: str(value) != str_check_value
 
         if check_type == 'ineq':
-            return str(value).lower() != str(check_value).lower()
+            lower_check_value = str(check_value).lower()
+            return lambda value: str(value).lower() != lower_check_value
 
         if check_type == 'gt':
-            return int(value) > int(check_value)
+            return cls._compile_int_match(operator.gt, check_value)
 
         if check_type == 'lt':
-            return int(value) < int(check_value)
+            return cls._compile_int_match(operator.lt, check_value)
 
         if check_type == 'gteq':
-            return int(value) <= int(check_value)
+            return cls._compile_int_match(operator.le, check_value)
 
         if check_type == 'lteq':
-            return int(value) >= int(check_value)
+            return cls._compile_int_match(operator.ge, check_value)
 
         if check_type == 'regex':
-            m = re.search(check_value, str(value))
-            if not m:
-                return False
-            return m.groupdict()
+            return cls._compile_regex_match(check_value)
 
         if check_type == 'iregex':
-            m = re.search(check_value, str(value), flags=re.IGNORECASE)
-            if not m:
-                return False
-            return m.groupdict()
+            return cls._compile_regex_match(check_value, flags=re.IGNORECASE)
 
         # check_type == 'ieq'
-        return str(check_value).lower() == str(value).lower()
+        lower_check_value = str(check_value).lower()
+        return lambda value: lower_check_value == str(value).lower()
+
+    @classmethod
+    def compile_match(cls, check_type, check_value):
+        """
+        Compile a complex match into a callable returning a dict of objects for regex or False on failure
+        :param check_type:
+        :param check_value:
+        :return: Match callable
+        """
+        is_list = isinstance(check_value, list)
+
+        try:
+            if is_list:
+                return cls._compile_match_cached(
+                    check_type, tuple((type(cv), cv) for cv in check_value), True
+                )
+
+            return cls._compile_match_cached(check_type, (type(check_value), check_value), False)
+
+        except TypeError:
+            # Unhashable check values cannot be cached
+            return cls._compile_match(check_type, check_value)
+
+    @classmethod
+    def complex_match(cls, check_type, check_value, value):
+        """
+        Perform a complex match and return a dict of objects for regex or False on failure
+        :param check_type:
+        :param check_value:
+        :param value:
+        :return:
+        """
+        return cls.compile_match(check_type, check_value)(value)
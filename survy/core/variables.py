@@ -0,0 +1,83 @@
+import collections
+import threading
+import time
+
+from types import MappingProxyType
+
+
+class VariableStore:
+    """
+    Versioned global variables store.
+    Sources publish their variables, readers get an immutable snapshot without copying.
+    """
+    STATS_WINDOW = 10
+
+    _lock = threading.Lock()
+    _sources = {}
+    _snapshot = MappingProxyType({})
+    _version = 0
+    _builds = 0
+    _builds_ts = collections.deque()
+
+    @classmethod
+    def publish(cls, source, variables):
+        """
+        Publish variables for a source, replacing the previously published ones
+        :param source: Source code (e.g.: component code)
+        :param variables: A dict of variables
+        """
+        if variables is None:
+            variables = {}
+
+        with cls._lock:
+            if source in cls._sources and cls._sources[source] == variables:
+                return
+
+            sources = dict(cls._sources)
+            sources[source] = dict(variables)
+
+            cls._sources = sources
+            cls._build()
+
+    @classmethod
+    def _build(cls):
+        out = {}
+
+        # Later sources override earlier ones
+        for variables in cls._sources.values():
+            out.update(variables)
+
+        cls._snapshot = MappingProxyType(out)
+        cls._version += 1
+
+        now = time.time()
+        cls._builds += 1
+        cls._builds_ts.append(now)
+
+        while cls._builds_ts[0] < now - cls.STATS_WINDOW:
+            cls._builds_ts.popleft()
+
+    @classmethod
+    def get_snapshot(cls):
+        """
+        Return a read only view of current variables, never modified after being returned
+        :return: Variables snapshot
+        """
+        return cls._snapshot
+
+    @classmethod
+    def get_version(cls):
+        return cls._version
+
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            now = time.time()
+            recent_builds = len([ts for ts in cls._builds_ts if ts >= now - cls.STATS_WINDOW])
+
+            return {
+                'version': cls._version,
+                'builds': cls._builds,
+                'builds_per_second': recent_builds / cls.STATS_WINDOW,
+                'variables': len(cls._snapshot),
+            }
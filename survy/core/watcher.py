@@ -0,0 +1,198 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+from survy.core.log import Log
+
+
+class SettingsWatcher:
+    """
+    Watch settings files and notify their owners when they change.
+    Uses inotify when available, falling back to polling files modification time and size.
+    """
+    MODE_INOTIFY = 'inotify'
+    MODE_POLLING = 'polling'
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    INOTIFY_EVENT = struct.Struct('iIII')
+
+    DEFAULT_INTERVAL = 2
+
+    # Editors and atomic writes produce bursts of events for a single change
+    SETTLE_TIME = .2
+
+    _callbacks = {}
+    _lock = threading.Lock()
+    _started = False
+    _stats = {
+        'mode': None,
+        'changes': 0,
+        'errors': 0,
+    }
+
+    @classmethod
+    def register(cls, file_name, callback):
+        """
+        Call a function when a file changes
+        :param file_name: Watched file, must be located in settings path
+        :param callback: Function to be called, without arguments
+        """
+        file_name = os.path.abspath(file_name)
+
+        with cls._lock:
+            if file_name not in cls._callbacks:
+                cls._callbacks[file_name] = []
+
+            if callback not in cls._callbacks[file_name]:
+                cls._callbacks[file_name].append(callback)
+
+    @classmethod
+    def _notify(cls, file_names):
+        for file_name in file_names:
+            with cls._lock:
+                callbacks = list(cls._callbacks.get(file_name, []))
+                if len(callbacks) > 0:
+                    cls._stats['changes'] += 1
+
+            for callback in callbacks:
+                Log.info('Settings file changed: %s', file_name)
+                try:
+                    callback()
+                except Exception as e:
+                    Log.error('Reloading %s failed: %s', file_name, e)
+
+                    with cls._lock:
+                        cls._stats['errors'] += 1
+
+    @classmethod
+    def _init_inotify(cls, path):
+        """
+        :param path: Directory to be watched
+        :return: inotify file descriptor or None if not supported
+        """
+        library = ctypes.util.find_library('c')
+        if library is None:
+            return None
+
+        try:
+            libc = ctypes.CDLL(library, use_errno=True)
+            fd = libc.inotify_init()
+        except (OSError, AttributeError):
+            return None
+
+        if fd < 0:
+            return None
+
+        mask = cls.IN_CLOSE_WRITE | cls.IN_MOVED_TO | cls.IN_DELETE
+        if libc.inotify_add_watch(fd, bytes(os.path.abspath(path), 'utf-8'), mask) < 0:
+            os.close(fd)
+            return None
+
+        return fd
+
+    @classmethod
+    def _read_inotify(cls, fd, path):
+        """
+        Read pending inotify events
+        :return: A set of changed files
+        """
+        data = os.read(fd, 4096)
+
+        file_names = set()
+        offset = 0
+        while offset + cls.INOTIFY_EVENT.size <= len(data):
+            wd, mask, cookie, name_len = cls.INOTIFY_EVENT.unpack_from(data, offset)
+            offset += cls.INOTIFY_EVENT.size
+
+            name = data[offset:offset + name_len].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += name_len
+
+            if name != '':
+                file_names.add(os.path.abspath(path + '/' + name))
+
+        return file_names
+
+    @classmethod
+    def _run_inotify(cls, fd, path):
+        while True:
+            file_names = cls._read_inotify(fd, path)
+
+            # Collect the whole burst before notifying
+            while True:
+                ready, _, _ = select.select([fd], [], [], cls.SETTLE_TIME)
+                if not ready:
+                    break
+
+                file_names |= cls._read_inotify(fd, path)
+
+            cls._notify(sorted(file_names))
+
+    @classmethod
+    def _get_file_state(cls, file_name):
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def _run_polling(cls, interval):
+        states = {}
+
+        while True:
+            with cls._lock:
+                file_names = list(cls._callbacks.keys())
+
+            changed = []
+            for file_name in file_names:
+                state = cls._get_file_state(file_name)
+                if file_name in states and states[file_name] != state:
+                    changed.append(file_name)
+
+                states[file_name] = state
+
+            cls._notify(changed)
+            time.sleep(interval)
+
+    @classmethod
+    def start(cls, path, interval=DEFAULT_INTERVAL, use_inotify=True):
+        """
+        Start watching in background
+        :param path: Settings directory
+        :param interval: Polling interval in seconds, when inotify is not available
+        :param use_inotify: Set to False to force polling
+        """
+        with cls._lock:
+            if cls._started:
+                return
+
+            cls._started = True
+
+        fd = None
+        if use_inotify:
+            fd = cls._init_inotify(path)
+
+        if fd is not None:
+            cls._stats['mode'] = cls.MODE_INOTIFY
+            target, args = cls._run_inotify, (fd, path)
+        else:
+            cls._stats['mode'] = cls.MODE_POLLING
+            target, args = cls._run_polling, (float(interval), )
+
+        Log.info('Watching settings in %s (%s)', path, cls._stats['mode'])
+        threading.Thread(target=target, args=args, name='settings-watcher', daemon=True).start()
+
+    @classmethod
+    def get_stats(cls):
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats['files'] = len(cls._callbacks)
+
+        return stats
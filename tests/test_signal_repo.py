@@ -0,0 +1,62 @@
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import serial
+except ImportError:
+    # survy.core.signal imports pyserial for its adapters, the repo never opens a port
+    sys.modules['serial'] = types.ModuleType('serial')
+
+
+class SignalRepoTest(unittest.TestCase):
+    def setUp(self):
+        from survy.core.app import App
+        from survy.core.component import ComponentCollection
+        from survy.core.signal import SignalManager, SignalRepo
+
+        self.base_path = tempfile.mkdtemp()
+        App.base_path = self.base_path
+        os.makedirs(App.get_settings_path())
+
+        App.components = ComponentCollection()
+        self.manager = SignalManager('ook', 'ook', {})
+        App.components.add('ook', self.manager, self.manager.COMPONENT_TYPE)
+
+        SignalRepo._signals = None
+
+    def tearDown(self):
+        shutil.rmtree(self.base_path)
+
+    def test_relearn_on_shared_code(self):
+        from survy.core.signal import Signal, SignalRepo
+
+        SignalRepo.add(Signal(self.manager, '123', device_name='A', sub_name='On'))
+        SignalRepo.add(Signal(self.manager, '123', device_name='B', sub_name='On'))
+
+        # B is learned again, the replaced signal compares equal to A
+        SignalRepo.add(Signal(self.manager, '999', device_name='B', sub_name='On'))
+
+        self.assertEqual(SignalRepo.get_by_code('a', 'on').get_code(), '123')
+        self.assertEqual(SignalRepo.get_by_code('b', 'on').get_code(), '999')
+        self.assertEqual(SignalRepo.get_by_signal(Signal(self.manager, '123')).get_device_code(), 'a')
+        self.assertEqual(
+            sorted((s.get_device_code(), s.get_code()) for s in SignalRepo._signals),
+            [('a', '123'), ('b', '999')]
+        )
+
+        SignalRepo.compact()
+        SignalRepo.load()
+
+        self.assertEqual(SignalRepo.get_by_code('a', 'on').get_code(), '123')
+        self.assertEqual(SignalRepo.get_by_code('b', 'on').get_code(), '999')
+        self.assertEqual(len(SignalRepo._signals), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from survy.core.utils import Utils
+
+
+class CompileMatchTest(unittest.TestCase):
+    def test_equal_constants_of_different_types(self):
+        # 1, 1.0 and True share a hash, each must still get its own matcher
+        self.assertIsNot(Utils.complex_match('ieq', [1], '1'), False)
+        self.assertIsNot(Utils.complex_match('ieq', [True], 'true'), False)
+        self.assertIs(Utils.complex_match('ieq', [True], '1'), False)
+        self.assertIsNot(Utils.complex_match('eq', 1.0, '1.0'), False)
+        self.assertIs(Utils.complex_match('eq', 1.0, '1'), False)
+
+        self.assertIsNot(Utils.complex_match('eq', 0, '0'), False)
+        self.assertIsNot(Utils.complex_match('ieq', False, 'false'), False)
+        self.assertIs(Utils.complex_match('ieq', False, '0'), False)
+
+    def test_list_is_a_conjunction(self):
+        self.assertIsNot(Utils.complex_match('ieq', ['x', 'X'], 'x'), False)
+        self.assertIs(Utils.complex_match('ieq', ['x', 'y'], 'x'), False)
+
+
+if __name__ == '__main__':
+    unittest.main()